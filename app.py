@@ -1,12 +1,119 @@
 import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
+import orjson
 import pandas as pd
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from src.log_classifier.utils.classifiers.classifier import classify
+from fastapi import FastAPI, UploadFile, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
+from starlette.routing import Match
+from src.log_classifier.constants import (classify_csv_chunk_size, classify_ndjson_batch_size, classify_json_max_logs,
+                                          tracing_server_timing_header)
+from src.log_classifier.utils.classifiers.classification_executor import create_classification_executor
+from src.log_classifier.utils.classifiers.classifier import (classify_async, classify_with_tiers_async,
+                                                            warmup, is_ready)
+from src.log_classifier.utils.lazy_loader import load_status
+from src.log_classifier.utils.metrics import (metrics_registry, http_requests_total, http_request_duration_seconds,
+                                              http_requests_in_flight)
+from src.log_classifier.utils.tracing import current_trace, span, start_trace, is_sampled, trace_exporter
 from fastapi.responses import JSONResponse
 
-app = FastAPI()
+# the executor the regex and BERT tiers run on, without it they run on the default thread pool
+classification_executor = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global classification_executor
+    classification_executor = create_classification_executor()
+    yield
+    classification_executor.shutdown(wait=False, cancel_futures=True)
+    classification_executor = None
+
+app = FastAPI(lifespan=lifespan)
+
+
+def route_path(scope) -> str:
+    """The path template of the route that handles the request, so the metrics have one label per route."""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records the count, latency and in-flight gauge of the HTTP requests per route.
+    The latency of a streamed response includes the time to stream its body.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not metrics_registry.enabled:
+            await self.app(scope, receive, send)
+            return
+        route = (route_path(scope),)
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec(route)
+            http_request_duration_seconds.observe(time.perf_counter() - start, route)
+            http_requests_total.inc(route + (scope["method"], str(status)))
+
+
+class TracingMiddleware:
+    """
+    Traces each request stage by stage, the durations of the stages finished before the response starts
+    are sent in the Server-Timing header. The sampled and the slow traces are written by the trace exporter,
+    with the stages of a streamed body included.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        trace = start_trace(route_path(scope), method=scope["method"]) if scope["type"] == "http" else None
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_server_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if tracing_server_timing_header:
+                    headers = list(message.get("headers", [])) + [(b"server-timing", trace.server_timing().encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            current_trace.reset(token)
+            trace.finish(status=status)
+            if is_sampled(trace):
+                trace_exporter.export(trace)
+
+
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 @app.get("/")
 async def homepage():
@@ -17,6 +124,39 @@ async def homepage():
         "message": "Hello! Welcome to the Log Classifier. Please use the /classify endpoint to run log classification."
     }
 
+@app.get("/health/live")
+async def liveness():
+    """
+    The process is up and serving requests, the models do not need to be loaded.
+    """
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Ready when the models and clients the routes of the routing table use are loaded, either by /warmup
+    or by the first classifications that reach each tier.
+    """
+    if is_ready():
+        return {"status": "ready", "models": load_status()}
+    return JSONResponse(status_code=503, content={"status": "not ready", "models": load_status()})
+
+@app.post("/warmup")
+def warmup_models():
+    """
+    Load the models before the first classification request.
+    """
+    status = warmup()
+    return JSONResponse(status_code=200 if is_ready() else 503,
+                        content={"status": "ready" if is_ready() else "not ready", "models": status})
+
+@app.get("/metrics")
+async def metrics():
+    """
+    The request, tier, LLM and cache metrics in the Prometheus text exposition format.
+    """
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/classify/")
 async def classify_logs_get():
     return JSONResponse(
@@ -24,18 +164,51 @@ async def classify_logs_get():
         content={"message": "This endpoint only supports POST requests. Please send a POST request with a CSV file."}
     )
 
+async def classify_csv_chunks(first_chunk: pd.DataFrame, csv_reader) -> AsyncIterator[str]:
+    """
+    Classify the CSV chunk by chunk and yield each classified chunk as CSV text.
+    Only one chunk is in memory at a time.
+    """
+    try:
+        chunk, header = first_chunk, True
+        while chunk is not None:
+            chunk["target_label"] = await classify_async(list(zip(chunk["source"], chunk["log_message"])),
+                                                         classification_executor)
+            with span("serialize", rows=len(chunk)):
+                csv_text = chunk.to_csv(index=False, header=header)
+            yield csv_text
+            with span("parse"):
+                chunk, header = await run_in_threadpool(next, csv_reader, None), False
+    finally:
+        csv_reader.close()
+
+
 @app.post("/classify/")
-async def classify_logs(file: UploadFile):
+async def classify_logs(file: UploadFile, stream: bool = False):
     # Check if the uploaded file is a CSV
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Input file must be a CSV file.")
 
+    required_columns = {"source", "log_message"}
     try:
+        if stream:
+            # Read the CSV in chunks, the classified rows are streamed back as each chunk is done
+            with span("parse"):
+                csv_reader = await run_in_threadpool(pd.read_csv, file.file, chunksize=classify_csv_chunk_size)
+                first_chunk = await run_in_threadpool(next, csv_reader, None)
+            if first_chunk is None or not required_columns.issubset(first_chunk.columns):
+                csv_reader.close()
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"CSV must contain the following columns: {', '.join(required_columns)}."
+                )
+            return StreamingResponse(classify_csv_chunks(first_chunk, csv_reader), media_type='text/csv')
+
         # Load the CSV content into a DataFrame
-        df = pd.read_csv(file.file)
+        with span("parse"):
+            df = await run_in_threadpool(pd.read_csv, file.file)
 
         # Validate required columns
-        required_columns = {"source", "log_message"}
         if not required_columns.issubset(df.columns):
             raise HTTPException(
                 status_code=400,
@@ -44,20 +217,142 @@ async def classify_logs(file: UploadFile):
 
         # Classify the logs
         logs = list(zip(df["source"], df["log_message"]))
-        df["target_label"] = classify(logs)
+        df["target_label"] = await classify_async(logs, classification_executor)
 
-        # Save the processed DataFrame to a file
-        # create the output folder if it does not exist
-        output_folder = "output"
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder, exist_ok=True)
+        # Save the processed DataFrame to a file for this request, the file is deleted after it is sent
+        output_file_descriptor, output_file = tempfile.mkstemp(prefix="output_", suffix=".csv")
+        os.close(output_file_descriptor)
+        with span("serialize"):
+            await run_in_threadpool(df.to_csv, output_file, index=False)
+        return FileResponse(output_file, media_type='text/csv', filename="output.csv",
+                            background=BackgroundTask(os.remove, output_file))
 
-        output_file = f"{output_folder}/output.csv"
-        df.to_csv(output_file, index=False)
-        return FileResponse(output_file, media_type='text/csv')
+    except HTTPException:
+        raise
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
     finally:
-        file.file.close()
+        if not stream:
+            file.file.close()
+
+
+def parse_log_record(record) -> tuple:
+    """Validate a {"source", "log_message"} object and return it as a (source, log_message) tuple."""
+    if not isinstance(record, dict):
+        raise ValueError("Each log must be an object with a source and a log_message.")
+    source, log_message = record.get("source"), record.get("log_message")
+    if not isinstance(source, str) or not isinstance(log_message, str):
+        raise ValueError("Each log must have a string source and a string log_message.")
+    return source, log_message
+
+
+def tier_results(labels, tiers) -> list:
+    return [{"target_label": label, "tier": tier} for label, tier in zip(labels, tiers)]
+
+
+@app.post("/v1/classify")
+async def classify_json(request: Request):
+    """
+    Classify a JSON array of {"source", "log_message"} objects, without pandas or a file on disk.
+    Returns a JSON array with the label and the tier that produced it for each log, in the same order.
+    """
+    body = await request.body()
+    try:
+        with span("parse"):
+            records = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="The body must be a JSON array of logs.")
+    if len(records) > classify_json_max_logs:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {classify_json_max_logs} logs can be sent in one request, "
+                                   f"use /v1/classify/stream or /classify/ for more.")
+    try:
+        with span("validate"):
+            logs = [parse_log_record(record) for record in records]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        labels, tiers = await classify_with_tiers_async(logs, classification_executor)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    with span("serialize"):
+        content = orjson.dumps(tier_results(labels, tiers))
+    return Response(content, media_type="application/json")
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose body is generated while the request body is read.
+    StreamingResponse reads the request in a second task to detect the client disconnecting,
+    that task would take the request body from the generator, here the generator detects it when it reads.
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+async def classify_ndjson_batch(lines: list) -> bytes:
+    """
+    Classify NDJSON lines together and return one NDJSON result per line that is not empty.
+    A line that is not a valid log gets {"error": ...} as its result.
+    """
+    results = []
+    logs = []
+    log_indices = []
+    with span("parse", lines=len(lines)):
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                logs.append(parse_log_record(orjson.loads(line)))
+                log_indices.append(len(results))
+                results.append(None)
+            except ValueError as e:
+                results.append({"error": str(e)})
+
+    if logs:
+        try:
+            log_results = tier_results(*await classify_with_tiers_async(logs, classification_executor))
+        except Exception as e:
+            # the response has started, the error is reported on the lines of the logs
+            log_results = [{"error": f"An error occurred: {str(e)}"}] * len(logs)
+        for index, result in zip(log_indices, log_results):
+            results[index] = result
+    with span("serialize", lines=len(results)):
+        return b"".join(orjson.dumps(result) + b"\n" for result in results)
+
+
+async def classify_ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """
+    Classify the NDJSON body as it is received, the complete lines of each received chunk of the body
+    are classified together, at most classify_ndjson_batch_size at a time, and their results are yielded.
+    """
+    buffer = b""
+    async for body_chunk in request.stream():
+        lines = (buffer + body_chunk).split(b"\n")
+        # the last line is not complete until the next chunk or the end of the body
+        buffer = lines.pop()
+        for start in range(0, len(lines), classify_ndjson_batch_size):
+            results = await classify_ndjson_batch(lines[start:start + classify_ndjson_batch_size])
+            if results:
+                yield results
+    if buffer.strip():
+        yield await classify_ndjson_batch([buffer])
+
+
+@app.post("/v1/classify/stream")
+async def classify_ndjson(request: Request):
+    """
+    Classify NDJSON, one {"source", "log_message"} object per line, and stream back NDJSON,
+    one {"target_label", "tier"} object per line in the same order. Empty lines are skipped.
+    """
+    return RequestStreamingResponse(classify_ndjson_lines(request), media_type="application/x-ndjson")
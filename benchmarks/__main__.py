@@ -0,0 +1,58 @@
+"""
+Run the benchmark suite and write the results to a JSON file, by default benchmarks/results/<commit>.json.
+Compare the results of two commits with python -m benchmarks.compare.
+
+Run from the project root:
+    python -m benchmarks
+    python -m benchmarks --quick --only tiers end_to_end
+"""
+import argparse
+import json
+import traceback
+
+from benchmarks import (api_throughput, clustering, end_to_end, incremental_training, metrics_overhead,
+                        pipeline_stages, tiers)
+from benchmarks.common import write_results
+
+# benchmark name -> (full run, quick run)
+suite = {
+    "tiers": (lambda: tiers.run(),
+              lambda: tiers.run(batch_sizes=(1, 8, 64), repeats=2)),
+    "end_to_end": (lambda: end_to_end.run(),
+                   lambda: end_to_end.run(row_counts=(10 ** 4,), repeats=2)),
+    "api": (lambda: api_throughput.run(),
+            lambda: api_throughput.run(row_counts=(100, 1000), repeats=2)),
+    "metrics": (lambda: metrics_overhead.run(),
+                lambda: metrics_overhead.run(rows=10 ** 4, requests=50, repeats=3)),
+    "clustering": (lambda: clustering.run(),
+                   lambda: clustering.run(row_counts=(1000, 10000))),
+    "training": (lambda: incremental_training.run(),
+                 lambda: incremental_training.run(row_counts=(10000,))),
+    "pipeline": (lambda: pipeline_stages.run(),
+                 lambda: pipeline_stages.run(repeats=1, rows=1000)),
+}
+
+
+def run(names: list, quick: bool = False) -> dict:
+    results = {}
+    for name in names:
+        full_run, quick_run = suite[name]
+        print(f"Running the {name} benchmark")
+        try:
+            results[name] = quick_run() if quick else full_run()
+        except Exception as e:
+            # a benchmark that fails does not stop the others, its error is in the results
+            traceback.print_exc()
+            results[name] = {"error": str(e)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=list(suite), default=list(suite))
+    parser.add_argument("--quick", action="store_true", help="fewer rows, batch sizes and repeats")
+    parser.add_argument("--output", default=None, help="the results file, by default benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+    results = run(args.only, args.quick)
+    print(json.dumps(results, indent=2, default=str))
+    print(f"Results written to {write_results({'quick': args.quick, 'benchmarks': results}, args.output)}")
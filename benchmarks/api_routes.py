@@ -0,0 +1,87 @@
+"""
+Compare the per-request latency of the classification routes for the small batches the agents send.
+The same logs are sent as a CSV upload to POST /classify/, as a JSON array to POST /v1/classify
+and as NDJSON to POST /v1/classify/stream, through an in-process ASGI client.
+The models are warmed up and each route is called once before it is measured.
+
+Run from the project root:
+    python -m benchmarks.api_routes
+"""
+import asyncio
+import io
+import statistics
+import time
+
+import httpx
+import orjson
+import pandas as pd
+
+from app import app
+from benchmarks.common import percentile
+from src.log_classifier.constants import data_file_folder_name, data_file_name
+
+
+def csv_request(logs: list) -> dict:
+    csv_bytes = pd.DataFrame(logs).to_csv(index=False).encode()
+    return {"url": "/classify/", "files": {"file": ("logs.csv", io.BytesIO(csv_bytes), "text/csv")}}
+
+
+def json_request(logs: list) -> dict:
+    return {"url": "/v1/classify", "content": orjson.dumps(logs),
+            "headers": {"content-type": "application/json"}}
+
+
+def ndjson_request(logs: list) -> dict:
+    return {"url": "/v1/classify/stream", "content": b"".join(orjson.dumps(log) + b"\n" for log in logs),
+            "headers": {"content-type": "application/x-ndjson"}}
+
+
+routes = {"csv": csv_request, "json": json_request, "ndjson": ndjson_request}
+
+
+async def route_latencies(client: httpx.AsyncClient, build_request, logs: list, requests: int) -> list:
+    latencies = []
+    for _ in range(requests + 1):
+        # the CSV upload is rebuilt for each request, its file object is read by the request
+        request = build_request(logs)
+        start = time.perf_counter()
+        response = await client.post(**request)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    # the first request of each route is not measured
+    return latencies[1:]
+
+
+async def measure(batch_sizes: tuple, requests: int) -> list:
+    df = pd.read_csv(f"{data_file_folder_name}/{data_file_name}")
+    # the LegacyCRM rows need the LLM, they are left out so the benchmark runs offline
+    df = df[df["source"] != "LegacyCRM"]
+    records = df[["source", "log_message"]].to_dict(orient="records")
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            (await client.post("/warmup")).raise_for_status()
+            for batch_size in batch_sizes:
+                logs = records[:batch_size]
+                for route, build_request in routes.items():
+                    latencies = await route_latencies(client, build_request, logs, requests)
+                    results.append({
+                        "route": route,
+                        "batch_size": batch_size,
+                        "requests": requests,
+                        "p50_ms": statistics.median(latencies) * 1000,
+                        "p99_ms": percentile(latencies, 0.99) * 1000,
+                    })
+    return results
+
+
+def run(batch_sizes: tuple = (1, 10, 100), requests: int = 200) -> list:
+    return asyncio.run(measure(batch_sizes, requests))
+
+
+if __name__ == "__main__":
+    print(f"{'route':<8}{'batch':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in run():
+        print(f"{result['route']:<8}{result['batch_size']:>7}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
@@ -0,0 +1,64 @@
+"""
+Benchmark the POST /classify/ throughput through an in-process ASGI client.
+CSV files of synthetic_logs.csv replicated to each number of rows are uploaded by one client
+and by several concurrent clients, the LegacyCRM rows are classified by the local fake LLM server.
+
+Run from the project root:
+    python -m benchmarks.api_throughput
+"""
+import asyncio
+import io
+import json
+import statistics
+import time
+
+import httpx
+
+from benchmarks.common import load_logs, percentile
+from benchmarks.fake_llm import fake_llm_server
+
+
+async def upload(client: httpx.AsyncClient, csv_bytes: bytes) -> float:
+    start = time.perf_counter()
+    response = await client.post("/classify/", files={"file": ("logs.csv", io.BytesIO(csv_bytes), "text/csv")})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def measure(row_counts: tuple, concurrencies: tuple, warmup: int, repeats: int) -> list:
+    from app import app
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for rows in row_counts:
+                csv_bytes = load_logs(rows)[["source", "log_message"]].to_csv(index=False).encode()
+                for _ in range(warmup):
+                    await upload(client, csv_bytes)
+                for concurrency in concurrencies:
+                    latencies = []
+                    start = time.perf_counter()
+                    for _ in range(repeats):
+                        latencies.extend(await asyncio.gather(*[upload(client, csv_bytes)
+                                                                for _ in range(concurrency)]))
+                    seconds = time.perf_counter() - start
+                    results.append({
+                        "rows": rows,
+                        "concurrency": concurrency,
+                        "requests": len(latencies),
+                        "median_seconds": statistics.median(latencies),
+                        "p99_seconds": percentile(latencies, 0.99),
+                        "rows_per_second": rows * len(latencies) / seconds,
+                    })
+    return results
+
+
+def run(row_counts: tuple = (100, 10 ** 4), concurrencies: tuple = (1, 4), warmup: int = 1,
+        repeats: int = 5) -> list:
+    with fake_llm_server():
+        return asyncio.run(measure(row_counts, concurrencies, warmup, repeats))
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
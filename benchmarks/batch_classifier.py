@@ -0,0 +1,43 @@
+"""
+Benchmark the offline batch classifier on synthetic_logs.csv replicated to a number of rows.
+The file is classified with each number of worker processes, the time includes loading the models
+in the workers. The output of each run is compared with the output of the run in this process.
+The LegacyCRM rows are classified by the local fake LLM server.
+
+Run from the project root:
+    python -m benchmarks.batch_classifier
+"""
+import filecmp
+import json
+import os
+import tempfile
+
+from benchmarks.common import load_logs
+from benchmarks.fake_llm import fake_llm_server
+from src.log_classifier.utils.classifiers.batch_classifier import BatchClassifier
+
+
+def run(rows: int = 10 ** 6, chunk_size: int = 50000, worker_counts: tuple = (0, 2, 4)) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory, fake_llm_server():
+        input_path = os.path.join(directory, "logs.csv")
+        load_logs(rows).to_csv(input_path, index=False)
+        reference_path = None
+        for workers in worker_counts:
+            output_path = os.path.join(directory, f"output_{workers}.csv")
+            summary = BatchClassifier(input_path, output_path, chunk_size=chunk_size, workers=workers).run()
+            reference_path = reference_path or output_path
+            results.append({
+                "rows": rows,
+                "workers": workers,
+                "seconds": summary["seconds"],
+                "rows_per_second": summary["rows_per_second"],
+                # the BERT cache reuses the label of the first message with the same masked text,
+                # the labels of those messages can depend on which worker classified them first
+                "same_output": filecmp.cmp(reference_path, output_path, shallow=False),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,87 @@
+"""
+Measure how the time and the peak memory of the clustering of the training embeddings grow with the number of rows.
+Clustered random vectors with the dimension of the sentence encoder are clustered with scikit-learn DBSCAN,
+which is only run up to dbscan_max_rows rows, and with the "exact" and "approximate" radius clustering.
+Each run is in a new process, the peak memory is the growth of its maximum resident set size while clustering.
+The labels of the exact clustering are compared with DBSCAN, the approximate clustering is compared with the exact
+clustering by the adjusted Rand index, 1.0 when the clusters are the same.
+
+Run from the project root:
+    python -m benchmarks.clustering
+"""
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.log_classifier.constants import dbscan_eps, dbscan_min_samples, dbscan_metric
+
+dimension: int = 768
+# the vectors are spread around one center per rows_per_center rows, closer than eps to the other vectors of the center
+rows_per_center: int = 100
+noise: float = 0.4
+dbscan_max_rows: int = 20000
+
+
+def clustered_vectors(rows: int, seed: int = 42, chunk_size: int = 10000) -> np.ndarray:
+    # the vectors are made by chunks, so making them does not use more memory than clustering them
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, rows // rows_per_center), dimension), dtype=np.float32)
+    vectors = np.empty((rows, dimension), dtype=np.float32)
+    for start in range(0, rows, chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        chunk[:] = centers[rng.integers(len(centers), size=len(chunk))]
+        chunk += noise * rng.standard_normal(chunk.shape, dtype=np.float32)
+    return vectors
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def cluster(method: str, rows: int) -> dict:
+    from src.log_classifier.utils.classifiers.clustering import cluster_embeddings
+
+    embeddings = clustered_vectors(rows)
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    labels = cluster_embeddings(embeddings, dbscan_eps, dbscan_min_samples, dbscan_metric, method)
+    return {
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": max_rss_mb() - rss_before,
+        "labels": labels,
+    }
+
+
+def run(row_counts: tuple = (1000, 10000, 100000), methods: tuple = ("dbscan", "exact", "approximate")) -> list:
+    from sklearn.metrics import adjusted_rand_score
+
+    results = []
+    for rows in row_counts:
+        labels = {}
+        for method in methods:
+            if method == "dbscan" and rows > dbscan_max_rows:
+                continue
+            # a new process per run, the maximum resident set size of a process never goes down
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(cluster, method, rows).result()
+            labels[method] = result.pop("labels")
+            result.update(method=method, rows=rows, clusters=int(labels[method].max()) + 1)
+            if method == "exact" and "dbscan" in labels:
+                result["same_as_dbscan"] = bool((labels["exact"] == labels["dbscan"]).all())
+            if method == "approximate" and "exact" in labels:
+                result["adjusted_rand_index"] = adjusted_rand_score(labels["exact"], labels["approximate"])
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'method':<13}{'rows':>8}{'seconds':>10}{'peak MB':>10}{'clusters':>10}  check")
+    for result in run():
+        check = (f"same as dbscan: {result['same_as_dbscan']}" if "same_as_dbscan" in result else
+                 f"adjusted Rand index: {result['adjusted_rand_index']:.4f}" if "adjusted_rand_index" in result else "")
+        print(f"{result['method']:<13}{result['rows']:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.1f}"
+              f"{result['clusters']:>10}  {check}")
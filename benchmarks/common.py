@@ -0,0 +1,87 @@
+"""
+Helpers shared by the benchmarks: timing with warmup and repeated runs, the benchmark data,
+and the JSON results file that is compared across commits.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+import pandas as pd
+
+from src.log_classifier.constants import data_file_folder_name, data_file_name
+
+results_dir: str = os.path.join("benchmarks", "results")
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(function: Callable[[], object], warmup: int = 1, repeats: int = 5) -> dict:
+    """
+    Call the function warmup times without timing it, then repeats times.
+    Returns the timings in seconds, the median is the value to compare across commits.
+    """
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeats": repeats,
+        "min_seconds": min(timings),
+        "median_seconds": statistics.median(timings),
+        "mean_seconds": statistics.mean(timings),
+        "stdev_seconds": statistics.stdev(timings) if repeats > 1 else 0.0,
+        "p99_seconds": percentile(timings, 0.99),
+    }
+
+
+def load_logs(rows: int = None, include_llm: bool = True) -> pd.DataFrame:
+    """
+    Load synthetic_logs.csv, replicated to the number of rows.
+    Without include_llm the LegacyCRM rows, which are sent to the LLM, are left out.
+    """
+    df = pd.read_csv(os.path.join(data_file_folder_name, data_file_name))
+    if not include_llm:
+        df = df[df["source"] != "LegacyCRM"]
+    if rows:
+        df = pd.concat([df] * (rows // len(df) + 1), ignore_index=True).head(rows)
+    return df.reset_index(drop=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(results: dict, file_path: str = None) -> str:
+    """Write the results with the environment they were measured in, by default to results/<commit>.json."""
+    results = {"environment": environment(), **results}
+    file_path = file_path or os.path.join(results_dir, f"{results['environment']['commit']}.json")
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w") as file:
+        json.dump(results, file, indent=2, default=str)
+    return file_path
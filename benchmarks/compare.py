@@ -0,0 +1,50 @@
+"""
+Compare two benchmark results files, for example of two commits.
+The median times and the throughputs of each benchmark are printed side by side with their ratio.
+
+Run from the project root:
+    python -m benchmarks.compare benchmarks/results/<old commit>.json benchmarks/results/<new commit>.json
+"""
+import argparse
+import json
+
+# the values compared, the lower the better for the times and the higher the better for the throughputs
+compared_metrics = ("median_seconds", "rows_per_second")
+# the keys that tell apart the results of a list, like the batch size of a BERT latency
+identifying_keys = ("stage", "rows", "batch_size", "concurrency")
+
+
+def flatten(results, prefix: str = "") -> dict:
+    """Get the compared metrics of the results, keyed by their path in the results."""
+    metrics = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            if key in compared_metrics and isinstance(value, (int, float)):
+                metrics[f"{prefix}{key}"] = value
+            elif isinstance(value, (dict, list)):
+                metrics.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for index, item in enumerate(results):
+            labels = [f"{key}={item[key]}" for key in identifying_keys if isinstance(item, dict) and key in item]
+            metrics.update(flatten(item, f"{prefix}{','.join(labels) or index}."))
+    return metrics
+
+
+def compare(old_results: dict, new_results: dict) -> list:
+    old_metrics = flatten(old_results.get("benchmarks", old_results))
+    new_metrics = flatten(new_results.get("benchmarks", new_results))
+    return [{"metric": metric, "old": old_metrics[metric], "new": new_metrics[metric],
+             "ratio": new_metrics[metric] / old_metrics[metric] if old_metrics[metric] else float("nan")}
+            for metric in old_metrics if metric in new_metrics]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark results files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    with open(args.old) as old_file, open(args.new) as new_file:
+        old_results, new_results = json.load(old_file), json.load(new_file)
+    print(f"old: {old_results.get('environment', {}).get('commit')}  new: {new_results.get('environment', {}).get('commit')}")
+    for row in compare(old_results, new_results):
+        print(f"{row['metric']:<70}{row['old']:>14.4f}{row['new']:>14.4f}{row['ratio']:>8.2f}x")
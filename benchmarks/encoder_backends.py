@@ -0,0 +1,101 @@
+"""
+Compare the ONNX and int8 ONNX sentence encoders with the torch SentenceTransformer.
+The log messages of synthetic_logs.csv are encoded by each backend and compared with the torch embeddings:
+the cosine similarity of each embedding and the agreement of the labels of the logistic regression head.
+The throughput of each backend is measured on the same messages.
+
+Export the model first, then run from the project root:
+    python -m src.log_classifier.utils.classifiers.sentence_encoder --model-dir <saved model dir>
+    python -m benchmarks.encoder_backends --model-dir <saved model dir>
+
+A tiny locally saved SentenceTransformer can be used, so no network is needed. When its embedding dimension
+does not match final_model/logistic_regression.pkl, a head is fitted on its torch embeddings for the comparison.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from src.log_classifier.constants import (data_file_folder_name, data_file_name, y_target_feature,
+                                          sentence_encoder_onnx_dir, bert_classifier_batch_size)
+from src.log_classifier.utils.classifiers.bert_classifier import predict_labels, model_path
+from src.log_classifier.utils.classifiers.sentence_encoder import create_sentence_encoder
+from src.log_classifier.utils.utils import load_object
+
+# the ONNX backends must stay this close to the torch backend
+min_mean_cosine_similarity: float = 0.99
+min_label_agreement: float = 0.98
+
+
+def cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def load_head(embeddings: np.ndarray, labels: list):
+    head = load_object(model_path)
+    if head.n_features_in_ == embeddings.shape[1]:
+        return head
+    return LogisticRegression(max_iter=1000).fit(embeddings, labels)
+
+
+def encode(encoder, messages: list, batch_size: int) -> tuple:
+    # the first batch is not timed, it initializes the backend
+    encoder.encode(messages[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(messages, batch_size=batch_size))
+    return embeddings, len(messages) / (time.perf_counter() - start)
+
+
+def run(model_dir: str, onnx_dir: str = sentence_encoder_onnx_dir,
+        batch_size: int = bert_classifier_batch_size, rows: int = None) -> list:
+    df = pd.read_csv(f"{data_file_folder_name}/{data_file_name}")
+    if rows:
+        df = df.head(rows)
+    messages = df["log_message"].tolist()
+
+    torch_embeddings, torch_throughput = encode(create_sentence_encoder("torch", model_dir), messages, batch_size)
+    head = load_head(torch_embeddings, df[y_target_feature].tolist())
+    torch_labels = np.array(predict_labels(torch_embeddings, head))
+    results = [{"backend": "torch", "messages_per_second": torch_throughput, "speedup": 1.0,
+                "mean_cosine_similarity": 1.0, "min_cosine_similarity": 1.0, "label_agreement": 1.0}]
+
+    for backend in ("onnx", "onnx_int8"):
+        embeddings, throughput = encode(create_sentence_encoder(backend, onnx_dir=onnx_dir), messages, batch_size)
+        similarities = cosine_similarities(torch_embeddings, embeddings)
+        results.append({
+            "backend": backend,
+            "messages_per_second": throughput,
+            "speedup": throughput / torch_throughput,
+            "mean_cosine_similarity": float(similarities.mean()),
+            "min_cosine_similarity": float(similarities.min()),
+            "label_agreement": float((np.array(predict_labels(embeddings, head)) == torch_labels).mean()),
+        })
+    return results
+
+
+def check(results: list) -> None:
+    for result in results:
+        if result["mean_cosine_similarity"] < min_mean_cosine_similarity:
+            raise AssertionError(f"{result['backend']} mean cosine similarity was "
+                                 f"{result['mean_cosine_similarity']:.4f}, the minimum is {min_mean_cosine_similarity}")
+        if result["label_agreement"] < min_label_agreement:
+            raise AssertionError(f"{result['backend']} label agreement was "
+                                 f"{result['label_agreement']:.4f}, the minimum is {min_label_agreement}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the sentence encoder backends")
+    parser.add_argument("--model-dir", required=True, help="directory of the saved SentenceTransformer")
+    parser.add_argument("--onnx-dir", default=sentence_encoder_onnx_dir)
+    parser.add_argument("--batch-size", type=int, default=bert_classifier_batch_size)
+    parser.add_argument("--rows", type=int, default=None, help="only use the first rows of the data")
+    args = parser.parse_args()
+    results = run(args.model_dir, args.onnx_dir, args.batch_size, args.rows)
+    print(f"{'backend':<11}{'msgs/s':>10}{'speedup':>9}{'mean cos':>10}{'min cos':>10}{'labels':>9}")
+    for result in results:
+        print(f"{result['backend']:<11}{result['messages_per_second']:>10.1f}{result['speedup']:>9.2f}"
+              f"{result['mean_cosine_similarity']:>10.4f}{result['min_cosine_similarity']:>10.4f}"
+              f"{result['label_agreement']:>9.4f}")
+    check(results)
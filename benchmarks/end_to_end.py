@@ -0,0 +1,29 @@
+"""
+Benchmark the end to end classify throughput on synthetic_logs.csv replicated to each number of rows.
+The LegacyCRM rows are classified by the local fake LLM server.
+The first run fills the caches, so the timed runs measure the steady state with warm caches.
+
+Run from the project root:
+    python -m benchmarks.end_to_end
+"""
+import json
+
+from benchmarks.common import measure, load_logs
+from benchmarks.fake_llm import fake_llm_server
+from src.log_classifier.utils.classifiers.classifier import classify
+
+
+def run(row_counts: tuple = (10 ** 4, 10 ** 5, 10 ** 6), warmup: int = 1, repeats: int = 3,
+        llm_latency_seconds: float = 0.05) -> list:
+    results = []
+    with fake_llm_server(llm_latency_seconds):
+        for rows in row_counts:
+            df = load_logs(rows)
+            logs = list(zip(df["source"], df["log_message"]))
+            timings = measure(lambda: classify(logs), warmup, repeats)
+            results.append({"rows": rows, **timings, "rows_per_second": rows / timings["median_seconds"]})
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,98 @@
+"""
+Local fake of the Groq chat completions API, so the LLM tier is benchmarked offline.
+The server answers each prompt after latency_seconds, with a category for each numbered log message
+of a batch prompt, or one category for a single message prompt.
+A prompt that contains fail_marker is answered with a 429 rate limit error. The server counts the prompts
+and the most prompts in flight at a time, in requests and max_in_flight of its handler class.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# the numbered log messages of a batch prompt
+batch_message_pattern = re.compile(r"^(\d+)\. (.*)$", flags=re.MULTILINE)
+
+
+def fake_category(log_message: str) -> str:
+    if "retired" in log_message or "no longer supported" in log_message or "deprecated" in log_message:
+        return "Deprecation Warning"
+    return "Workflow Error"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency_seconds: float = 0.05
+    fail_marker: str = None
+    lock = threading.Lock()
+    requests: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        handler = type(self)
+        with handler.lock:
+            handler.requests += 1
+            handler.in_flight += 1
+            handler.max_in_flight = max(handler.max_in_flight, handler.in_flight)
+        try:
+            time.sleep(self.latency_seconds)
+        finally:
+            with handler.lock:
+                handler.in_flight -= 1
+        if self.fail_marker and self.fail_marker in prompt:
+            self.send_error(429, "Rate limit reached")
+            return
+        messages = batch_message_pattern.findall(prompt)
+        if messages:
+            content = "".join(f'<category id="{message_id}">{fake_category(log_message)}</category>'
+                              for message_id, log_message in messages)
+        else:
+            content = f"<category>{fake_category(prompt)}</category>"
+        response = json.dumps({
+            "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def start_fake_llm_server(latency_seconds: float = 0.05, fail_marker: str = None) -> ThreadingHTTPServer:
+    handler = type("FakeLLMHandler", (FakeLLMHandler,), {"latency_seconds": latency_seconds, "fail_marker": fail_marker,
+                                                          "lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="fake_llm", daemon=True).start()
+    return server
+
+
+@contextmanager
+def fake_llm_server(latency_seconds: float = 0.05, fail_marker: str = None):
+    """
+    Run the fake server and point the Groq clients to it.
+    It must be entered before the first LLM call, the clients read the base URL when they are created.
+    """
+    server = start_fake_llm_server(latency_seconds, fail_marker)
+    previous_environment = {key: os.environ.get(key) for key in ("GROQ_BASE_URL", "GROQ_API_KEY")}
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GROQ_API_KEY"] = previous_environment["GROQ_API_KEY"] or "fake"
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        for key, value in previous_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
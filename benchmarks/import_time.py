@@ -0,0 +1,45 @@
+"""
+Check that importing the API does not load the models.
+The import is timed with python -X importtime in a fresh interpreter and the
+cumulative import time of the app module is compared with the budget.
+
+Run from the project root:
+    python -m benchmarks.import_time
+"""
+import re
+import subprocess
+import sys
+
+# modules that must not be imported by the app module, they are loaded with the models
+heavy_modules = ("torch", "sentence_transformers", "sklearn", "groq")
+import_time_budget_seconds: float = 2.0
+
+
+def measure_import_time(module_name: str = "app") -> dict:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            capture_output=True, text=True, check=True)
+    # import time: self [us] | cumulative | imported package
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            imports[match.group(4)] = int(match.group(2))
+    return {
+        "cumulative_seconds": imports.get(module_name, 0) / 1e6,
+        "heavy_modules": sorted(name for name in imports if name.split(".")[0] in heavy_modules),
+    }
+
+
+def run(module_name: str = "app", budget_seconds: float = import_time_budget_seconds) -> dict:
+    result = measure_import_time(module_name)
+    heavy_top_level = sorted({name.split(".")[0] for name in result["heavy_modules"]})
+    if heavy_top_level:
+        raise AssertionError(f"Importing {module_name} imports {', '.join(heavy_top_level)}")
+    if result["cumulative_seconds"] > budget_seconds:
+        raise AssertionError(f"Importing {module_name} took {result['cumulative_seconds']:.2f} seconds, "
+                             f"the budget is {budget_seconds:.2f} seconds")
+    return {"module": module_name, "cumulative_seconds": result["cumulative_seconds"], "budget_seconds": budget_seconds}
+
+
+if __name__ == "__main__":
+    print(run())
@@ -0,0 +1,116 @@
+"""
+Compare the full batch training of the logistic regression head with the incremental training by SGD on chunks of
+the embedding store, in time, peak memory and accuracy, for growing row counts.
+Labelled random vectors with the dimension of the sentence encoder are written to an embedding store, then
+  * full_batch - LogisticRegression on all the training vectors in memory, like the "full_batch" trainer mode
+  * incremental - the SGD head on chunks of the store from zero, like the "incremental" trainer mode
+  * warm_start - the SGD head warm started from a LogisticRegression trained on the first half of the training rows,
+    then trained on the second half only, like new labelled data folded into the deployed model
+Each run is in a new process, the peak memory is the growth of its maximum resident set size while training.
+
+Run from the project root:
+    python -m benchmarks.incremental_training
+"""
+import multiprocessing
+import os
+import pickle
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+dimension: int = 768
+n_classes: int = 8
+# each class is spread around centers_per_class centers, with this noise the classes overlap
+centers_per_class: int = 4
+noise: float = 5.0
+test_size: float = 0.3
+
+
+def write_store(directory: str, rows: int, seed: int = 42, chunk_size: int = 10000) -> None:
+    from src.log_classifier.utils.classifiers.embedding_store import EmbeddingStore
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_classes * centers_per_class, dimension), dtype=np.float32)
+    store = EmbeddingStore(directory, "benchmark")
+    labels = np.empty(rows, dtype=object)
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        center_ids = rng.integers(len(centers), size=count)
+        vectors = centers[center_ids] + noise * rng.standard_normal((count, dimension), dtype=np.float32)
+        # unit vectors, like the sentence embeddings
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.add([f"log message {row}" for row in range(start, start + count)], vectors)
+        labels[start:start + count] = [f"class {center_id % n_classes}" for center_id in center_ids]
+    with open(os.path.join(directory, "labels.pkl"), "wb") as file:
+        pickle.dump(labels, file)
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def split(rows: int) -> tuple:
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(np.arange(rows), test_size=test_size, random_state=42)
+
+
+def train(method: str, directory: str) -> dict:
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import accuracy_score
+    from src.log_classifier.utils.classifiers.embedding_store import EmbeddingStore
+    from src.log_classifier.utils.classifiers.incremental_head import fit_incremental_head, predict_chunks
+
+    store = EmbeddingStore(directory, "benchmark")
+    with open(os.path.join(directory, "labels.pkl"), "rb") as file:
+        labels = pickle.load(file)
+    # the store rows are the positions of the messages
+    train_rows, test_rows = split(len(store))
+    half = len(train_rows) // 2
+    deployed_model = None
+    if method == "warm_start":
+        with open(os.path.join(directory, "deployed.pkl"), "rb") as file:
+            deployed_model = pickle.load(file)
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    if method in ("full_batch", "deployed"):
+        rows = train_rows if method == "full_batch" else train_rows[:half]
+        model = LogisticRegression(max_iter=1000).fit(store.vectors[np.sort(rows)], labels[np.sort(rows)])
+    elif method == "incremental":
+        model = fit_incremental_head(store, train_rows, labels[train_rows])
+    else:
+        model = fit_incremental_head(store, train_rows[half:], labels[train_rows[half:]],
+                                     warm_start_model=deployed_model)
+    result = {"seconds": time.perf_counter() - start, "peak_rss_mb": max_rss_mb() - rss_before,
+              "accuracy": accuracy_score(labels[test_rows], predict_chunks(model, store, test_rows))}
+    if method == "deployed":
+        with open(os.path.join(directory, "deployed.pkl"), "wb") as file:
+            pickle.dump(model, file)
+    return result
+
+
+def run(row_counts: tuple = (10000, 100000), methods: tuple = ("full_batch", "incremental", "warm_start")) -> list:
+    results = []
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            write_store(directory, rows)
+            # the model the warm start continues from, trained on the first half of the training rows
+            run_methods = (("deployed",) if "warm_start" in methods else ()) + tuple(methods)
+            for method in run_methods:
+                # a new process per run, the maximum resident set size of a process never goes down
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    result = executor.submit(train, method, directory).result()
+                result.update(method=method, rows=rows)
+                results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'method':<13}{'rows':>8}{'seconds':>10}{'peak MB':>10}{'accuracy':>10}")
+    for result in run():
+        print(f"{result['method']:<13}{result['rows']:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.1f}"
+              f"{result['accuracy']:>10.4f}")
@@ -0,0 +1,79 @@
+"""
+Measure the query latency of the kNN index as the index grows.
+Clustered random vectors with the dimension of the sentence encoder, like the embeddings of log templates,
+are indexed with the flat search and with IVF partitioning, and queried one at a time and in batches.
+The recall of the IVF search is the share of the flat search neighbours it finds.
+
+Run from the project root:
+    python -m benchmarks.knn_tier
+"""
+import statistics
+import time
+
+import numpy as np
+
+from src.log_classifier.constants import knn_k, knn_ivf_probe
+from src.log_classifier.utils.classifiers.knn_index import KNNIndex
+
+dimension: int = 768
+n_labels: int = 9
+# the vectors are spread around this many centers, each center has one label
+n_centers: int = 500
+noise: float = 0.5
+
+
+def query_latency(index: KNNIndex, queries: np.ndarray, batch_size: int, repeats: int) -> float:
+    latencies = []
+    for repeat in range(repeats):
+        batch = queries[(repeat * batch_size) % len(queries):][:batch_size]
+        start = time.perf_counter()
+        index.search(batch, knn_k)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+def recall(flat_index: KNNIndex, ivf_index: KNNIndex, queries: np.ndarray) -> float:
+    # the IVF index reorders its vectors, the neighbours are compared by their vectors
+    flat_neighbours = flat_index.vectors[flat_index.search(queries, knn_k)[1]]
+    ivf_neighbours = ivf_index.vectors[ivf_index.search(queries, knn_k)[1]]
+    found = (np.abs(flat_neighbours[:, :, None, :] - ivf_neighbours[:, None, :, :]).max(axis=3) == 0).any(axis=2)
+    return float(found.mean())
+
+
+def run(index_sizes: tuple = (1000, 10000, 100000), batch_sizes: tuple = (1, 64), repeats: int = 20) -> list:
+    rng = np.random.default_rng(42)
+    centers = rng.standard_normal((n_centers, dimension)).astype(np.float32)
+    center_labels = rng.integers(n_labels, size=n_centers).astype(str)
+    queries = centers[rng.integers(n_centers, size=256)] + noise * rng.standard_normal((256, dimension))
+    results = []
+    for size in index_sizes:
+        assignments = rng.integers(n_centers, size=size)
+        embeddings = (centers[assignments] + noise * rng.standard_normal((size, dimension))).astype(np.float32)
+        labels = center_labels[assignments]
+        flat_index = KNNIndex(embeddings, labels, ivf_lists=0)
+        build_start = time.perf_counter()
+        ivf_lists = max(1, int(np.sqrt(size)))
+        ivf_index = KNNIndex(embeddings, labels, ivf_lists=ivf_lists)
+        ivf_build_seconds = time.perf_counter() - build_start
+        ivf_recall = recall(flat_index, ivf_index, queries[:32])
+        for name, index in (("flat", flat_index), (f"ivf{ivf_lists}", ivf_index)):
+            for batch_size in batch_sizes:
+                latency = query_latency(index, queries, batch_size, repeats)
+                results.append({
+                    "index": name,
+                    "size": size,
+                    "batch_size": batch_size,
+                    "latency_ms": latency * 1000,
+                    "queries_per_second": batch_size / latency,
+                    "recall": 1.0 if name == "flat" else ivf_recall,
+                    "build_seconds": 0.0 if name == "flat" else ivf_build_seconds,
+                })
+    return results
+
+
+if __name__ == "__main__":
+    print(f"IVF indexes probe {knn_ivf_probe} lists, k={knn_k}")
+    print(f"{'index':<9}{'size':>8}{'batch':>7}{'ms':>10}{'queries/s':>12}{'recall':>8}{'build s':>9}")
+    for result in run():
+        print(f"{result['index']:<9}{result['size']:>8}{result['batch_size']:>7}{result['latency_ms']:>10.2f}"
+              f"{result['queries_per_second']:>12.0f}{result['recall']:>8.2f}{result['build_seconds']:>9.2f}")
@@ -0,0 +1,56 @@
+"""
+Compare the time a logging call takes in the thread that logs with the "sync" and the "queue" logging modes.
+Each mode logs to its own file handler in a temporary directory, with and without JSON records.
+In "queue" mode the time to write the queued records is measured separately, it is spent by the listener thread.
+
+Run from the project root:
+    python -m benchmarks.logging_modes
+"""
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import percentile
+from src.log_classifier.logging.logger import configure_logger, formatter
+
+
+def measure(mode: str, json_records: bool, messages: int, directory: str) -> dict:
+    logger = logging.getLogger(f"benchmark_{mode}_{json_records}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = logging.FileHandler(os.path.join(directory, f"{mode}_{json_records}.log"))
+    handler.setFormatter(formatter)
+    listener = configure_logger(logger, [handler], mode=mode, json_records=json_records,
+                                queue_max_size=messages, rate_limit_per_second=0, sample_rates={})
+    latencies = []
+    start = time.perf_counter()
+    for index in range(messages):
+        call_start = time.perf_counter()
+        logger.info("Classified %s logs of the request %s", index, "benchmark")
+        latencies.append(time.perf_counter() - call_start)
+    call_seconds = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    handler.close()
+    return {
+        "mode": mode,
+        "json_records": json_records,
+        "messages": messages,
+        "mean_call_microseconds": call_seconds / messages * 10 ** 6,
+        "p99_call_microseconds": percentile(latencies, 0.99) * 10 ** 6,
+        "total_seconds": time.perf_counter() - start,
+    }
+
+
+def run(messages: int = 10 ** 5) -> list:
+    with tempfile.TemporaryDirectory() as directory:
+        return [measure(mode, json_records, messages, directory)
+                for mode in ("sync", "queue") for json_records in (False, True)]
+
+
+if __name__ == "__main__":
+    print(f"{'mode':<7}{'json':>6}{'mean us':>10}{'p99 us':>10}{'total s':>10}")
+    for result in run():
+        print(f"{result['mode']:<7}{str(result['json_records']):>6}{result['mean_call_microseconds']:>10.2f}"
+              f"{result['p99_call_microseconds']:>10.2f}{result['total_seconds']:>10.2f}")
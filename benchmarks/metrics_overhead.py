@@ -0,0 +1,106 @@
+"""
+Measure the cost of the metrics on the classification path.
+The cost of recording one tier call is measured on its own, the metrics are recorded a few times per batch.
+The classify throughput and the POST /v1/classify latency are measured with the metrics registry
+enabled and disabled, the two are alternated on each repeat, in a different order on every other repeat,
+so they see the same warm caches and load.
+The LegacyCRM rows are classified by the local fake LLM server.
+
+Run from the project root:
+    python -m benchmarks.metrics_overhead
+"""
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+import orjson
+
+from benchmarks.common import load_logs
+from benchmarks.fake_llm import fake_llm_server
+from src.log_classifier.utils.classifiers.classifier import classify
+from src.log_classifier.utils.metrics import metrics_registry, observe_tier_call
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_order(repeat: int) -> tuple:
+    return (True, False) if repeat % 2 == 0 else (False, True)
+
+
+def overhead(seconds: dict) -> dict:
+    enabled_seconds, disabled_seconds = statistics.median(seconds[True]), statistics.median(seconds[False])
+    return {"enabled_median_seconds": enabled_seconds, "disabled_median_seconds": disabled_seconds,
+            "overhead_percent": (enabled_seconds / disabled_seconds - 1) * 100}
+
+
+def alternate(function, repeats: int) -> dict:
+    """Run the function with the metrics enabled and disabled in turn, returns the median seconds of each."""
+    seconds = {True: [], False: []}
+    try:
+        for repeat in range(repeats):
+            for enabled in run_order(repeat):
+                metrics_registry.enabled = enabled
+                seconds[enabled].append(timed(function))
+    finally:
+        metrics_registry.enabled = True
+    return overhead(seconds)
+
+
+def recording_cost(calls: int = 10 ** 5) -> dict:
+    seconds = timed(lambda: [observe_tier_call("benchmark", 64, 32, 0.01) for _ in range(calls)])
+    return {"calls": calls, "microseconds_per_call": seconds / calls * 10 ** 6}
+
+
+def classify_overhead(rows: int, repeats: int) -> dict:
+    df = load_logs(rows)
+    logs = list(zip(df["source"], df["log_message"]))
+    # the first run fills the caches
+    classify(logs)
+    return {"rows": rows, **alternate(lambda: classify(logs), repeats)}
+
+
+async def api_overhead(batch_size: int, requests: int, repeats: int) -> dict:
+    from app import app
+
+    df = load_logs(batch_size)
+    body = orjson.dumps(df[["source", "log_message"]].to_dict(orient="records"))
+    seconds = {True: [], False: []}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def send_requests() -> float:
+                start = time.perf_counter()
+                for _ in range(requests):
+                    response = await client.post("/v1/classify", content=body,
+                                                 headers={"content-type": "application/json"})
+                    response.raise_for_status()
+                return time.perf_counter() - start
+
+            await send_requests()
+            try:
+                for repeat in range(repeats):
+                    for enabled in run_order(repeat):
+                        metrics_registry.enabled = enabled
+                        seconds[enabled].append(await send_requests())
+            finally:
+                metrics_registry.enabled = True
+    return {"batch_size": batch_size, "requests": requests, **overhead(seconds)}
+
+
+def run(rows: int = 10 ** 5, batch_size: int = 10, requests: int = 200, repeats: int = 9) -> dict:
+    with fake_llm_server():
+        return {
+            "recording": recording_cost(),
+            "classify": classify_overhead(rows, repeats),
+            "api": asyncio.run(api_overhead(batch_size, requests, repeats)),
+        }
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,99 @@
+"""
+Benchmark the stages of the training pipeline in main.py.
+Each stage is run once per repeat with the artifact of the previous stage, like RunPipeline.run,
+and its time is recorded. A stage that fails is recorded with its error and the later stages are skipped.
+The stages run in a temporary working directory with a copy of the data, the schemas and final_model,
+so the artifacts, the embedding store and the pushed model of the benchmark never replace the ones of the project.
+A warmup run, not timed, loads the libraries and the sentence transformer first.
+
+Run from the project root:
+    python -m benchmarks.pipeline_stages
+"""
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from benchmarks.fake_llm import fake_llm_server
+from src.log_classifier.constants import (data_file_folder_name, data_file_name, model_pusher_dir_name,
+                                          schema_file_path, regex_rules_file_path, routing_table_file_path)
+
+
+@contextmanager
+def pipeline_directory(rows: int = None):
+    """
+    A temporary working directory with the inputs of the pipeline, the first rows of the data when rows is set.
+    The paths of the pipeline are relative, it writes its artifacts and final_model in this directory.
+    """
+    project_dir = os.getcwd()
+    # the modules imported after the change of directory are still found in the project
+    sys.path.insert(0, project_dir)
+    with tempfile.TemporaryDirectory(prefix="pipeline_benchmark_") as directory:
+        for file_path in (schema_file_path, regex_rules_file_path, routing_table_file_path):
+            os.makedirs(os.path.join(directory, os.path.dirname(file_path)), exist_ok=True)
+            shutil.copy(file_path, os.path.join(directory, file_path))
+        if os.path.exists(model_pusher_dir_name):
+            # the deployed model the incremental training warm starts from
+            shutil.copytree(model_pusher_dir_name, os.path.join(directory, model_pusher_dir_name))
+        os.makedirs(os.path.join(directory, data_file_folder_name))
+        df = pd.read_csv(os.path.join(data_file_folder_name, data_file_name))
+        df.head(rows).to_csv(os.path.join(directory, data_file_folder_name, data_file_name), index=False)
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(project_dir)
+            sys.path.remove(project_dir)
+
+
+def run_stages() -> list:
+    # the pipeline imports the training libraries, they are only imported when the stages are benchmarked
+    from main import RunPipeline
+
+    pipeline = RunPipeline()
+    stages = [
+        ("data_ingestion", pipeline.run_data_ingestion_pipeline),
+        ("data_validation", pipeline.run_data_validation_pipeline),
+        ("data_transformation", pipeline.run_data_transformation_pipeline),
+        ("model_trainer", pipeline.run_model_trainer_pipeline),
+        ("model_pusher", pipeline.run_model_pusher_pipeline),
+    ]
+    results = []
+    artifact = None
+    for stage_name, stage in stages:
+        start = time.perf_counter()
+        try:
+            artifact = stage() if artifact is None else stage(artifact)
+        except Exception as e:
+            results.append({"stage": stage_name, "seconds": time.perf_counter() - start, "error": str(e)})
+            break
+        results.append({"stage": stage_name, "seconds": time.perf_counter() - start})
+    return results
+
+
+def run(repeats: int = 3, rows: int = None, warmup: int = 1) -> list:
+    runs = []
+    with fake_llm_server(), pipeline_directory(rows):
+        for _ in range(warmup):
+            run_stages()
+        for _ in range(repeats):
+            runs.append(run_stages())
+    results = []
+    for stage_runs in zip(*runs):
+        stage_result = {"stage": stage_runs[0]["stage"], "rows": rows, "repeats": len(stage_runs),
+                        "median_seconds": statistics.median(stage_run["seconds"] for stage_run in stage_runs)}
+        errors = [stage_run["error"] for stage_run in stage_runs if "error" in stage_run]
+        if errors:
+            stage_result["error"] = errors[0]
+        results.append(stage_result)
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
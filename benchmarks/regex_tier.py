@@ -0,0 +1,66 @@
+"""
+Microbenchmark of the regex tier.
+Compares the compiled RegexRuleEngine with the previous regex_classifier, which rebuilt the
+pattern dict and ran re.search for each pattern on every call.
+
+Run from the project root:
+    python -m benchmarks.regex_tier
+"""
+import re
+import time
+
+import pandas as pd
+
+from src.log_classifier.constants import data_file_folder_name, data_file_name
+from src.log_classifier.utils.classifiers.regex_rule_engine import RegexRuleEngine
+
+
+def legacy_regex_classifier(log_message):
+    regex_patterns = {
+        r"User User\d+ logged (in|out).": "User Action",
+        r"Backup (started|ended) at .*": "System Notification",
+        r"Backup completed successfully.": "System Notification",
+        r"System updated to version .*": "System Notification",
+        r"File .* uploaded successfully by user .*": "System Notification",
+        r"Disk cleanup completed successfully.": "System Notification",
+        r"System reboot initiated by user .*": "System Notification",
+        r"Account with ID .* created by .*": "User Action"
+    }
+    for pattern, label in regex_patterns.items():
+        if re.search(pattern, log_message):
+            return label
+    return None
+
+
+def time_it(function, log_messages, repeat: int) -> float:
+    """Get the best time in seconds of classifying all the messages."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(log_messages)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(data_file_path: str = f"{data_file_folder_name}/{data_file_name}", repeat: int = 20) -> dict:
+    log_messages = pd.read_csv(data_file_path)["log_message"].tolist()
+    engine = RegexRuleEngine()
+
+    legacy_labels = [legacy_regex_classifier(log_message) for log_message in log_messages]
+    engine_labels = engine.classify_batch(log_messages)
+    if legacy_labels != engine_labels:
+        raise AssertionError("The regex rule engine labels do not match the legacy regex classifier")
+
+    legacy_seconds = time_it(lambda messages: [legacy_regex_classifier(m) for m in messages], log_messages, repeat)
+    engine_seconds = time_it(engine.classify_batch, log_messages, repeat)
+    return {
+        "rows": len(log_messages),
+        "legacy_rows_per_second": len(log_messages) / legacy_seconds,
+        "engine_rows_per_second": len(log_messages) / engine_seconds,
+        "speedup": legacy_seconds / engine_seconds,
+    }
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value:,.2f}")
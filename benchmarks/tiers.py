@@ -0,0 +1,57 @@
+"""
+Benchmark each classification tier on its own.
+- regex: throughput of the RegexRuleEngine on the log messages of synthetic_logs.csv
+- bert: latency of bert_classify_batch at each batch size, without the cache so every message is encoded
+- llm: latency of llm_classify_batch against the local fake LLM server, without the cache
+
+Run from the project root:
+    python -m benchmarks.tiers
+"""
+import json
+
+from benchmarks.common import measure, load_logs
+from benchmarks.fake_llm import fake_llm_server
+from src.log_classifier.utils.classifiers.bert_classifier import bert_classify_batch
+from src.log_classifier.utils.classifiers.llm_classifier import llm_classify_batch
+from src.log_classifier.utils.classifiers.regex_classifier import get_regex_rule_engine
+
+
+def regex_throughput(warmup: int = 1, repeats: int = 5) -> dict:
+    log_messages = load_logs()["log_message"].tolist()
+    engine = get_regex_rule_engine()
+    timings = measure(lambda: engine.classify_batch(log_messages), warmup, repeats)
+    return {"rows": len(log_messages), **timings,
+            "rows_per_second": len(log_messages) / timings["median_seconds"]}
+
+
+def bert_latency(batch_sizes: tuple = (1, 8, 64, 512), warmup: int = 1, repeats: int = 5) -> list:
+    log_messages = load_logs(max(batch_sizes), include_llm=False)["log_message"].tolist()
+    results = []
+    for batch_size in batch_sizes:
+        batch = log_messages[:batch_size]
+        timings = measure(lambda: bert_classify_batch(batch, use_cache=False), warmup, repeats)
+        results.append({"batch_size": batch_size, **timings,
+                        "rows_per_second": batch_size / timings["median_seconds"]})
+    return results
+
+
+def llm_latency(rows: int = 100, latency_seconds: float = 0.05, warmup: int = 1, repeats: int = 3) -> dict:
+    df = load_logs()
+    log_messages = df.loc[df["source"] == "LegacyCRM", "log_message"].tolist()
+    log_messages = (log_messages * (rows // len(log_messages) + 1))[:rows]
+    with fake_llm_server(latency_seconds):
+        timings = measure(lambda: llm_classify_batch(log_messages, use_cache=False), warmup, repeats)
+    return {"rows": rows, "server_latency_seconds": latency_seconds, **timings,
+            "rows_per_second": rows / timings["median_seconds"]}
+
+
+def run(batch_sizes: tuple = (1, 8, 64, 512), warmup: int = 1, repeats: int = 5) -> dict:
+    return {
+        "regex": regex_throughput(warmup, repeats),
+        "bert": bert_latency(batch_sizes, warmup, repeats),
+        "llm": llm_latency(warmup=warmup),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
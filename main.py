@@ -1,6 +1,14 @@
+import argparse
+import os
 import sys
+from functools import partial
 
 from config.set_config import Config
+from src.log_classifier.config.configuration import TrainingPipelineConfig
+from src.log_classifier.constants import (data_file_folder_name, data_file_name, schema_file_path,
+                                          regex_rules_file_path, routing_table_file_path, model_trainer_mode,
+                                          model_trainer_warm_start, model_pusher_dir_name,
+                                          model_trainer_model_file_name)
 from src.log_classifier.entity.artifact_entity import (DataIngestionArtifact,
                                                        DataValidationArtifact,
                                                        DataTransformationArtifact, ModelTrainerArtifact)
@@ -11,6 +19,22 @@ from src.log_classifier.pipeline.data_transformation import DataTransformationTr
 from src.log_classifier.pipeline.data_validation import DataValidationTrainingPipeline
 from src.log_classifier.pipeline.model_pusher import ModelPusherTrainingPipeline
 from src.log_classifier.pipeline.model_trainer import ModelTrainerTrainingPipeline
+from src.log_classifier.pipeline.dag import DAGExecutor
+from src.log_classifier.pipeline.stage_cache import StageCache, module_files
+
+
+# the cached stages, with the module of their pipeline
+stage_modules = {
+    "data_ingestion": "src.log_classifier.pipeline.data_ingestion",
+    "data_validation": "src.log_classifier.pipeline.data_validation",
+    "data_transformation": "src.log_classifier.pipeline.data_transformation",
+    "model_trainer": "src.log_classifier.pipeline.model_trainer",
+}
+cached_stages: tuple = tuple(stage_modules)
+# the code of a stage is the files of the modules its pipeline imports, and the constants module with the
+# parameters of all the stages, a change of any of them runs the stage again
+stage_code_files = {stage: module_files([module, "src.log_classifier.constants"])
+                    for stage, module in stage_modules.items()}
 
 
 class RunPipeline:
@@ -96,16 +120,47 @@ class RunPipeline:
             logger.error(f"{tag}::Error running the model pusher pipeline: {e}")
             raise CustomException(e, sys)
 
-    def run(self) -> None:
-        data_ingestion_artifact: DataIngestionArtifact = self.run_data_ingestion_pipeline()
-        data_validation_artifact: DataValidationArtifact = self.run_data_validation_pipeline(data_ingestion_artifact)
-        data_transformation_artifact: DataTransformationArtifact = self.run_data_transformation_pipeline(data_validation_artifact)
-        model_trainer_artifact: ModelTrainerArtifact = self.run_model_trainer_pipeline(data_transformation_artifact)
+    def run(self, force_stages: tuple = ()) -> None:
+        """
+        Run the stages, a stage whose inputs and code did not change since a completed run
+        is not run again, its outputs are linked from the stage cache. The model is always pushed.
+        """
+        stage_cache = StageCache(TrainingPipelineConfig().artifact_dir, force_stages=force_stages)
+        # each stage takes the artifact of the stage before it, the steps of a stage run as their own graph
+        dag = DAGExecutor(self.class_name)
+        dag.add("data_ingestion", partial(
+            stage_cache.run, "data_ingestion", self.run_data_ingestion_pipeline,
+            files=[os.path.join(data_file_folder_name, data_file_name)] + stage_code_files["data_ingestion"]))
+        dag.add("data_validation", partial(
+            stage_cache.run, "data_validation", self.run_data_validation_pipeline,
+            depends_on=["data_ingestion"], files=[schema_file_path] + stage_code_files["data_validation"]),
+            inputs=("data_ingestion",))
+        dag.add("data_transformation", partial(
+            stage_cache.run, "data_transformation", self.run_data_transformation_pipeline,
+            depends_on=["data_validation"], files=[regex_rules_file_path] + stage_code_files["data_transformation"]),
+            inputs=("data_validation",))
+        # the incremental training starts from the deployed model, a new deployed model makes a new fingerprint
+        warm_start_file_path = os.path.join(model_pusher_dir_name, model_trainer_model_file_name)
+        warm_start_files = ([warm_start_file_path] if model_trainer_mode == "incremental" and model_trainer_warm_start
+                            and os.path.exists(warm_start_file_path) else [])
+        dag.add("model_trainer", partial(
+            stage_cache.run, "model_trainer", self.run_model_trainer_pipeline,
+            depends_on=["data_transformation"],
+            files=[routing_table_file_path] + stage_code_files["model_trainer"] + warm_start_files),
+            inputs=("data_transformation",))
         # filepath = os.path.join("artifacts/25_03_2025_13_56_37/model_training/logistic_regression.pkl")
         # model_trainer_artifact = ModelTrainerArtifact(model_file_path=filepath)
-        self.run_model_pusher_pipeline(model_trainer_artifact)
+        dag.add("model_pusher", self.run_model_pusher_pipeline, inputs=("model_trainer",))
+        dag.run()
+        dag.log_report()
+        stage_cache.log_report()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the training pipeline")
+    parser.add_argument("--force-stage", action="append", default=[], choices=list(cached_stages) + ["all"],
+                        help="run the stage even when its outputs are in the stage cache, can be repeated")
+    args = parser.parse_args()
     try:
         config = Config()
         if config.set():
@@ -115,7 +170,7 @@ if __name__ == "__main__":
             raise CustomException("Environment variables NOT set", sys)
         # Run the pipelines
         run_pipeline = RunPipeline()
-        run_pipeline.run()
+        run_pipeline.run(force_stages=tuple(args.force_stage))
     except Exception as ex:
         logger.error(f"Error running the pipeline: {ex}")
         raise CustomException(ex, sys)
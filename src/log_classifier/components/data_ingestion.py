@@ -7,7 +7,8 @@ from src.log_classifier.entity.artifact_entity import DataIngestionArtifact
 from src.log_classifier.entity.config_entity import DataIngestionConfig
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
-from src.log_classifier.utils.utils import save_dataframe
+from src.log_classifier.pipeline.dag import DAGExecutor
+from src.log_classifier.utils.utils import save_dataframe, load_dataframe
 
 
 # In the future, if the datasource is changed to a different source, we can modify the class
@@ -27,7 +28,7 @@ class DataIngestion:
             if not os.path.exists(self.config.data_source_path):
                 raise FileNotFoundError(f"File not found: {self.config.data_source_path}")
             # read the data from the data source
-            df = pd.read_csv(self.config.data_source_path)
+            df = load_dataframe(self.config.data_source_path)
             return df
         except Exception as e:
             logger.error(f"{tag}::Error in exporting collection as dataframe: {e}")
@@ -46,7 +47,7 @@ class DataIngestion:
             os.makedirs(feature_store_dir, exist_ok=True)
             logger.info(f"{tag}::Created folder: {feature_store_dir}")
             # save the data into the feature store
-            save_dataframe(df, feature_store_file_path, f"{tag}::data feature store export")
+            save_dataframe(df, feature_store_file_path, f"{tag}::data feature store export", self.config.file_format)
             logger.info(f"{tag}::Exported data into feature store: {feature_store_file_path}")
             return df
         except Exception as e:
@@ -68,7 +69,7 @@ class DataIngestion:
             os.makedirs(train_test_dir, exist_ok=True)
             logger.info(f"{tag}::Created folder: {train_test_dir}")
             # save the train and test data
-            save_dataframe(df, training_file_path, f"{tag}::training data export")
+            save_dataframe(df, training_file_path, f"{tag}::training data export", self.config.file_format)
             logger.info(
                 f"{tag}::Exported data into train file: {training_file_path}")
             return training_file_path
@@ -80,16 +81,18 @@ class DataIngestion:
         tag = f"{self.class_name}::initiate_data_ingestion"
         try:
             logger.info(f"{tag}::Initiated data ingestion")
-            # read the collection from MongoDB as a dataframe
-            dataframe = self.export_collection_as_dataframe()
-            logger.info(f"{tag}::Completed exporting collection as dataframe")
-            df = self.export_data_into_feature_store(dataframe)
-            logger.info(f"{tag}::Completed exporting data into feature store")
-
-            training_file_path = self.export_data_into_train_test(df)
-            logger.info(f"{tag}::Completed exporting data into train and test files")
+            # read the collection from MongoDB as a dataframe, then export it to the feature store
+            # and the train file at the same time
+            dag = DAGExecutor(self.class_name)
+            dag.add("read", self.export_collection_as_dataframe)
+            dag.add("feature_store_export", self.export_data_into_feature_store, inputs=("read",))
+            dag.add("train_export", self.export_data_into_train_test, inputs=("read",))
+            results = dag.run()
+            dag.log_report()
+            training_file_path = results["train_export"]
+            logger.info(f"{tag}::Completed exporting data into feature store and train and test files")
             logger.info(f"{tag}::Completed data ingestion")
-            return DataIngestionArtifact(train_file_path=training_file_path)
+            return DataIngestionArtifact(train_file_path=training_file_path, file_format=self.config.file_format)
         except Exception as e:
             logger.error(f"{tag}::Error in initiating data ingestion: {e}")
             raise CustomException(e, sys)
@@ -1,20 +1,26 @@
 import os
 import sys
+import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-from sklearn.cluster import DBSCAN
 from src.log_classifier.constants import (sentence_transformer_model_name,
+                                          sentence_encoder_backend,
                                           dbscan_eps,
                                           dbscan_min_samples,
                                           dbscan_metric,
+                                          clustering_method,
                                           cluster_label,
                                           regex_label)
 from src.log_classifier.entity.artifact_entity import DataValidationArtifact, DataTransformationArtifact
 from src.log_classifier.entity.config_entity import DataTransformationConfig
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
+from src.log_classifier.pipeline.dag import DAGExecutor
+from src.log_classifier.utils.classifiers.clustering import cluster_embeddings
+from src.log_classifier.utils.classifiers.embedding_store import EmbeddingStore, embedding_model_id
 from src.log_classifier.utils.classifiers.regex_classifier import regex_classifier
-from src.log_classifier.utils.utils import save_numpy_array_data, sentence_transformer_save_object, save_dataframe
+from src.log_classifier.utils.classifiers.sentence_encoder import create_sentence_encoder
+from src.log_classifier.utils.utils import sentence_transformer_save_object, save_dataframe, load_dataframe
 
 
 class DataTransformation:
@@ -28,11 +34,11 @@ class DataTransformation:
             raise CustomException(e, sys)
 
     @staticmethod
-    def read_data(file_path: str) -> pd.DataFrame:
+    def read_data(file_path: str, file_format: str = None) -> pd.DataFrame:
         try:
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"File not found: {file_path}")
-            return pd.read_csv(file_path)
+            return load_dataframe(file_path, file_format=file_format)
         except Exception as e:
             raise CustomException(f"Error reading the data: {e}", sys) from e
 
@@ -45,24 +51,29 @@ class DataTransformation:
         except Exception as e:
             raise CustomException(f"Error saving model: {str(e)}", sys)
 
-    def generate_embeddings(self, model: SentenceTransformer, data: pd.DataFrame) -> list:
+    def generate_embeddings(self, model, data: pd.DataFrame, store: EmbeddingStore) -> np.ndarray:
+        """The embeddings of the messages from the store, only the messages that are not in it are encoded."""
         try:
             tag: str = f"{self.class_name}::generate_embeddings"
-            return model.encode(data['log_message'].values.tolist())
+            return store.encode(data['log_message'].tolist(), model)
         except Exception as e:
             raise CustomException(f"Error generating embeddings: {str(e)}", sys)
 
     def perform_clustering(self, embeddings: list) -> list:
         try:
             tag: str = f"{self.class_name}::perform_clustering"
-            dbscan = DBSCAN(eps=dbscan_eps,
-                            min_samples=dbscan_min_samples,
-                            metric=dbscan_metric)
-            logger.info(f"{tag}::Performing clustering")
-            return dbscan.fit_predict(embeddings)
+            logger.info(f"{tag}::Performing clustering with method {clustering_method}")
+            return cluster_embeddings(embeddings, eps=dbscan_eps, min_samples=dbscan_min_samples,
+                                      metric=dbscan_metric, method=clustering_method)
         except Exception as e:
             raise CustomException(f"Error performing clustering: {str(e)}", sys)
 
+    @staticmethod
+    def label_data(train_df: pd.DataFrame, cluster_labels: np.ndarray, regex_labels: pd.Series) -> pd.DataFrame:
+        train_df[cluster_label] = cluster_labels
+        train_df[regex_label] = regex_labels
+        return train_df
+
     def initiate_data_transformation(self) -> DataTransformationArtifact:
         tag: str = f"{self.class_name}::initiate_data_transformation"
         try:
@@ -71,41 +82,50 @@ class DataTransformation:
             if not self.data_validation_artifact.validation_status:
                 raise CustomException("Data validation failed", sys)
 
+            # the steps run as a graph, the regex labelling only needs the text so it runs while the
+            # model is loaded and the messages are encoded and clustered
+            store = EmbeddingStore(self.config.embedding_store_dir, embedding_model_id())
+            dag = DAGExecutor(self.class_name)
             # Step 1: Read data
-            train_df = self.read_data(self.data_validation_artifact.valid_train_file_path)
-
+            dag.add("read", lambda: self.read_data(self.data_validation_artifact.valid_train_file_path,
+                                                   self.data_validation_artifact.file_format))
             # Step 2: Load and save model
-            model = SentenceTransformer(sentence_transformer_model_name)
-            self.save_model(model)
-            logger.info(f"{tag}::Model saved successfully")
-
-            # Step 3: Generate and save embeddings
-            embeddings = self.generate_embeddings(model, train_df)
-            save_numpy_array_data(self.config.embeddings_file_path, embeddings)
-            logger.info(f"{tag}::Embeddings saved successfully")
-
+            dag.add("model", lambda: SentenceTransformer(sentence_transformer_model_name))
+            dag.add("save_model", self.save_model, inputs=("model",))
+            # Step 3: Generate and save embeddings, with the encoder backend the classifier uses,
+            # the model is not used while it is saved
+            dag.add("encoder", lambda model: model if sentence_encoder_backend == "torch" else create_sentence_encoder(),
+                    inputs=("model",), after=("save_model",))
+            dag.add("embeddings", lambda encoder, train_df: self.generate_embeddings(encoder, train_df, store),
+                    inputs=("encoder", "read"))
             # Step 4: Perform clustering
-            train_df[cluster_label] = self.perform_clustering(embeddings)
-
+            dag.add("clustering", self.perform_clustering, inputs=("embeddings",))
             # Step 5: Classify using regex
-            train_df[regex_label] = train_df['log_message'].apply(regex_classifier)
-
-            # Step 6: Split data
-            none_train_df = train_df[train_df[regex_label].isnull()]
-            classified_train_df = train_df[train_df[regex_label].notnull()]
-
-            # Step 7: Save data
-            os.makedirs(self.config.transformed_data_dir, exist_ok=True)
-            save_dataframe(train_df, self.config.transformed_data_file_path, f"{self.class_name}::Transformed data")
-            save_dataframe(none_train_df, self.config.transformed_none_regex_file_name, f"{self.class_name}::None regex data")
-            save_dataframe(classified_train_df, self.config.transformed_classified_regex_file_name, f"{self.class_name}::Classified regex data")
+            dag.add("regex", lambda train_df: train_df['log_message'].apply(regex_classifier), inputs=("read",))
+            # Step 6: Add the labels to the data
+            dag.add("labelled", self.label_data, inputs=("read", "clustering", "regex"))
+            # Step 7: Split and save data, the three files at the same time
+            dag.add("save_transformed", lambda train_df: save_dataframe(
+                train_df, self.config.transformed_data_file_path, f"{self.class_name}::Transformed data",
+                self.config.file_format), inputs=("labelled",))
+            dag.add("save_none_regex", lambda train_df: save_dataframe(
+                train_df[train_df[regex_label].isnull()], self.config.transformed_none_regex_file_name,
+                f"{self.class_name}::None regex data", self.config.file_format), inputs=("labelled",))
+            dag.add("save_classified_regex", lambda train_df: save_dataframe(
+                train_df[train_df[regex_label].notnull()], self.config.transformed_classified_regex_file_name,
+                f"{self.class_name}::Classified regex data", self.config.file_format), inputs=("labelled",))
+            dag.run()
+            dag.log_report()
+            logger.info(f"{tag}::Model, embeddings and data saved successfully")
 
             return DataTransformationArtifact(
-                model_embeddings_file_path=self.config.embeddings_file_path,
+                embedding_store_path=self.config.embedding_store_dir,
+                embedding_model_id=store.model_id,
                 transformed_data_file_path=self.config.transformed_data_file_path,
                 regex_none_classified_data_file_path=self.config.transformed_none_regex_file_name,
                 regex_classified_data_file_path=self.config.transformed_classified_regex_file_name,
-                sentence_transformer_file_path=self.config.data_transformation_sentence_transformer_file_path
+                sentence_transformer_file_path=self.config.data_transformation_sentence_transformer_file_path,
+                file_format=self.config.file_format
             )
         except Exception as e:
             logger.error(f"Error in data transformation: {str(e)}")
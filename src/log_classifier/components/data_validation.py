@@ -6,7 +6,8 @@ from src.log_classifier.entity.artifact_entity import DataIngestionArtifact, Dat
 from src.log_classifier.entity.config_entity import DataValidationConfig
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
-from src.log_classifier.utils.utils import read_yaml, save_dataframe
+from src.log_classifier.pipeline.dag import DAGExecutor
+from src.log_classifier.utils.utils import read_yaml, save_dataframe, load_dataframe
 
 
 class DataValidation:
@@ -21,9 +22,9 @@ class DataValidation:
             raise CustomException(e, sys)
 
     @staticmethod
-    def read_data(file_path: str) -> pd.DataFrame:
+    def read_data(file_path: str, file_format: str = None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return load_dataframe(file_path, file_format=file_format)
         except Exception as e:
             raise CustomException(e, sys)
 
@@ -73,6 +74,17 @@ class DataValidation:
             logger.error(f"{tag}::Data validation failed. Train data numerical columns are not same as schema")
         return is_columns_numbers_same_train and is_numerical_columns_same_train
 
+    def export_valid_data(self, train_data: pd.DataFrame) -> str:
+        tag: str = f"{self.class_name}::export_valid_data::"
+        valid_data_dir = self.data_validation_config.valid_data_dir
+        # create directory if not exists
+        os.makedirs(valid_data_dir, exist_ok=True)
+        logger.info(f"{tag}::Folder created: {valid_data_dir}")
+        save_dataframe(train_data, self.data_validation_config.valid_train_file_path, f"{tag}::validated training data export",
+                       self.data_validation_config.file_format)
+        logger.info(f"{tag}::Validated data saved to {self.data_validation_config.file_format} successfully")
+        return self.data_validation_config.valid_train_file_path
+
     def initiate_data_validation(self) -> DataValidationArtifact:
         tag: str = f"{self.class_name}::initiate_data_validation::"
         try:
@@ -85,30 +97,27 @@ class DataValidation:
             if not os.path.exists(train_file_path):
                 raise CustomException(f"Train file {train_file_path} does not exist", sys)
 
-            # read data from train and test file
-            train_data = DataValidation.read_data(train_file_path)
-
-            # validate train and test data
-            data_status = self.validate_data(train_data)
+            # read data from train and test file, then validate it against the schema and save it at the same time,
+            # the data is saved whatever the validation status
+            dag = DAGExecutor(self.class_name)
+            dag.add("read", lambda: DataValidation.read_data(train_file_path, self.data_ingestion_artifact.file_format))
+            dag.add("schema_validation", self.validate_data, inputs=("read",))
+            dag.add("valid_data_export", self.export_valid_data, inputs=("read",))
+            results = dag.run()
+            dag.log_report()
+            data_status = results["schema_validation"]
             if not data_status:
                 logger.error(f"{tag}::Data validation failed.")
                 logger.error(f"{tag}::Data columns are not same as schema")
                 # raise CustomException("Data validation failed", sys)
             logger.info(f"{tag}::Data validation for columns completed successfully")
 
-            # save test and train data
-            valid_data_dir = self.data_validation_config.valid_data_dir
-            # create directory if not exists
-            os.makedirs(valid_data_dir, exist_ok=True)
-            logger.info(f"{tag}::Folder created: {valid_data_dir}")
-            save_dataframe(train_data, self.data_validation_config.valid_train_file_path, f"{tag}::validated training data export")
-            logger.info(f"{tag}::Validated data saved to csv successfully")
-
             # create data validation artifact
             status = data_status
             data_validation_artifact = DataValidationArtifact(
                 validation_status=status,
-                valid_train_file_path=self.data_validation_config.valid_train_file_path)
+                valid_train_file_path=self.data_validation_config.valid_train_file_path,
+                file_format=self.data_validation_config.file_format)
             return data_validation_artifact
         except Exception as e:
             logger.error(f"{tag}::Error running the data validation pipeline: {e}")
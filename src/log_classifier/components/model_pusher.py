@@ -33,6 +33,12 @@ class ModelPusher:
             # copy the model file to the destination folder
             logger.info(f"{tag}::Copying the model file from {source} to the destination folder {destination}")
             copy_file_with_validation(source, destination, [".pkl"])
+
+            # the kNN index is published with the model
+            knn_index_source = self.model_trainer_artifact.knn_index_file_path
+            if knn_index_source:
+                logger.info(f"{tag}::Copying the kNN index from {knn_index_source} to the destination folder {destination}")
+                copy_file_with_validation(knn_index_source, destination, [".npz"])
             return destination
         except Exception as e:
             raise CustomException(f"{tag}::Error in pushing the model: {str(e)}", sys)
\ No newline at end of file
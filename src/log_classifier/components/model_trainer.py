@@ -1,16 +1,42 @@
+import hashlib
 import os.path
 import sys
+import time
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import classification_report
+from sklearn.metrics import accuracy_score, classification_report
+from src.log_classifier.constants import sentence_encoder_backend
 from src.log_classifier.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact
 from src.log_classifier.entity.config_entity import ModelTrainerConfig
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
-from src.log_classifier.utils.utils import sentence_transformer_load_object, save_object
+from src.log_classifier.utils.classifiers.embedding_store import EmbeddingStore
+from src.log_classifier.utils.classifiers.incremental_head import fit_incremental_head, predict_chunks
+from src.log_classifier.utils.classifiers.knn_index import KNNIndex
+from src.log_classifier.utils.classifiers.routing_table import RoutingTable
+from src.log_classifier.utils.classifiers.sentence_encoder import create_sentence_encoder
+from src.log_classifier.utils.utils import (sentence_transformer_load_object, save_object, load_object,
+                                           load_dataframe)
+
+def holdout_split(log_messages: list, test_share: float) -> tuple:
+    """
+    Split the positions of the messages into train and test positions by a hash of each message.
+    A message is in the test rows of every training run, so the deployed model never trained on the rows
+    the new model is compared with it on, and the copies of a message are all on the same side.
+    """
+    buckets = np.array([int.from_bytes(hashlib.blake2b(log_message.encode("utf-8"), digest_size=8).digest(), "big")
+                        for log_message in log_messages], dtype=np.uint64)
+    is_test = buckets < np.uint64(test_share * 2 ** 64)
+    train_positions, test_positions = np.flatnonzero(~is_test), np.flatnonzero(is_test)
+    if len(train_positions) == 0 or len(test_positions) == 0:
+        raise ValueError(f"The split of {len(log_messages)} messages with a test share of {test_share} "
+                         f"has no train or no test rows")
+    return train_positions, test_positions
+
 
 class ModelTrainer:
     def __init__(self, data_transformation_artifact: DataTransformationArtifact,
@@ -24,22 +50,42 @@ class ModelTrainer:
             logger.error(message)
             raise CustomException(message, sys)
 
-    def perform_bret_classification(self, non_legacy_crm_df: pd.DataFrame):
-        sentence_transformer_file_path = self.data_transformation_artifact.sentence_transformer_file_path
-        if not os.path.exists(sentence_transformer_file_path):
-            raise FileNotFoundError(f"Sentence transformer model file not found: {sentence_transformer_file_path}")
+    def open_embedding_store(self, log_messages: list) -> EmbeddingStore:
+        """
+        The embedding store written by the data transformation, with the embeddings of all the messages.
+        The messages that are not in the store are encoded and added to it, the encoder is only loaded for them.
+        """
+        tag: str = f"{self.class_name}::open_embedding_store"
+        store = EmbeddingStore(self.data_transformation_artifact.embedding_store_path,
+                               self.data_transformation_artifact.embedding_model_id)
+        missing = store.missing(log_messages)
+        if missing:
+            logger.warning(f"{tag}::{len(missing)} messages are not in the embedding store, encoding them")
+            sentence_transformer_file_path = self.data_transformation_artifact.sentence_transformer_file_path
+            if not os.path.exists(sentence_transformer_file_path):
+                raise FileNotFoundError(f"Sentence transformer model file not found: {sentence_transformer_file_path}")
+            # the same encoder backend as the data transformation
+            if sentence_encoder_backend == "torch":
+                encoder: SentenceTransformer = sentence_transformer_load_object(sentence_transformer_file_path)
+            else:
+                encoder = create_sentence_encoder()
+            store.add(missing, encoder.encode(missing))
+        return store
+
+    def load_embeddings(self, log_messages: list) -> np.ndarray:
+        """The embeddings of the messages from the embedding store written by the data transformation."""
+        return self.open_embedding_store(log_messages).get(log_messages)
 
-        # load the sentence transformer model
-        model: SentenceTransformer = sentence_transformer_load_object(sentence_transformer_file_path)
-        embeddings = model.encode(non_legacy_crm_df['log_message'].values)
+    def perform_bret_classification(self, non_legacy_crm_df: pd.DataFrame):
+        # the embeddings were computed by the data transformation, they are read from the embedding store
+        embeddings = self.load_embeddings(non_legacy_crm_df['log_message'].tolist())
         # train the model
         X = embeddings
-        y = non_legacy_crm_df['target_label']
-        # train the model
-        X_train, X_test, y_train, y_test = train_test_split(X,
-                                                            y,
-                                                            test_size=self.model_trainer_config.model_trainer_test_train_split,
-                                                            random_state=42)
+        y = non_legacy_crm_df['target_label'].to_numpy(dtype=object)
+        # the same split as the incremental training, the test messages are never trained on
+        train_positions, test_positions = holdout_split(non_legacy_crm_df['log_message'].tolist(),
+                                                        self.model_trainer_config.model_trainer_test_train_split)
+        X_train, X_test, y_train, y_test = X[train_positions], X[test_positions], y[train_positions], y[test_positions]
         reg = LogisticRegression(max_iter=1000)
         reg.fit(X_train, y_train)
         y_pred = reg.predict(X_test)
@@ -50,6 +96,79 @@ class ModelTrainer:
         logger.info(f"Model saved successfully at: {self.model_trainer_config.model_trainer_model_file_path}")
         return self.model_trainer_config.model_trainer_model_file_path
 
+    def load_deployed_model(self):
+        """The model in final_model to warm start the incremental training from, None when there is none."""
+        tag: str = f"{self.class_name}::load_deployed_model"
+        file_path = self.model_trainer_config.model_trainer_warm_start_file_path
+        if not self.model_trainer_config.model_trainer_warm_start or not os.path.exists(file_path):
+            logger.info(f"{tag}::No deployed model to warm start from")
+            return None
+        return load_object(file_path)
+
+    def perform_incremental_classification(self, non_legacy_crm_df: pd.DataFrame) -> str:
+        """
+        Train the logistic regression head by SGD on chunks of the embeddings read from the embedding store,
+        the memory used does not grow with the number of messages. The head is warm started from the deployed
+        model, so new labelled data is folded into it without training it again from zero.
+        The new head is only saved when its accuracy on the test rows is at least the accuracy of the deployed model,
+        otherwise the deployed model is saved again, so the model pusher keeps it. The test rows are chosen by a hash
+        of the message, so neither model trained on them, as long as the deployed model was trained with the same
+        split and the same model_trainer_test_train_split.
+        """
+        tag: str = f"{self.class_name}::perform_incremental_classification"
+        log_messages = non_legacy_crm_df['log_message'].tolist()
+        store = self.open_embedding_store(log_messages)
+        rows = store.rows(log_messages)
+        labels = non_legacy_crm_df['target_label'].to_numpy(dtype=object)
+        # the same split as the full batch training and as the training of the deployed model
+        train_positions, test_positions = holdout_split(log_messages,
+                                                        self.model_trainer_config.model_trainer_test_train_split)
+        deployed_model = self.load_deployed_model()
+        start = time.perf_counter()
+        reg = fit_incremental_head(store, rows[train_positions], labels[train_positions],
+                                   self.model_trainer_config.model_trainer_chunk_size,
+                                   self.model_trainer_config.model_trainer_sgd_epochs,
+                                   self.model_trainer_config.model_trainer_sgd_alpha, deployed_model)
+        logger.info(f"{tag}::Trained on {len(train_positions)} rows in {time.perf_counter() - start:.2f}s")
+        y_test = labels[test_positions]
+        y_pred = predict_chunks(reg, store, rows[test_positions], self.model_trainer_config.model_trainer_chunk_size)
+        report = classification_report(y_test, y_pred)
+        logger.info(f"Classification report for the non-legacy crm data: {report}")
+        if deployed_model is not None:
+            deployed_pred = predict_chunks(deployed_model, store, rows[test_positions],
+                                           self.model_trainer_config.model_trainer_chunk_size)
+            accuracy, deployed_accuracy = accuracy_score(y_test, y_pred), accuracy_score(y_test, deployed_pred)
+            logger.info(f"{tag}::Accuracy on the test rows: {accuracy:.4f}, the deployed model: {deployed_accuracy:.4f}")
+            if accuracy < deployed_accuracy:
+                logger.warning(f"{tag}::The new head is less accurate than the deployed model, keeping the deployed model")
+                reg = deployed_model
+        # save the model
+        save_object(self.model_trainer_config.model_trainer_model_file_path, reg)
+        logger.info(f"Model saved successfully at: {self.model_trainer_config.model_trainer_model_file_path}")
+        return self.model_trainer_config.model_trainer_model_file_path
+
+    def build_knn_index(self, train_df: pd.DataFrame) -> Optional[str]:
+        """
+        Build the kNN index from the training embeddings and the labels of the training rows of the sources that
+        the routing table sends to the kNN tier, so a log is only labelled by the neighbours of the sources it serves.
+        None when no source is routed to the kNN tier.
+        """
+        tag: str = f"{self.class_name}::build_knn_index"
+        routing_table = RoutingTable()
+        knn_sources = [source for source in train_df['source'].unique() if "knn" in routing_table.tiers_for(source)]
+        train_df = train_df[train_df['source'].isin(knn_sources)]
+        if train_df.empty:
+            logger.warning(f"{tag}::No training rows of the sources routed to the kNN tier, the index is not built")
+            return None
+        embeddings = self.load_embeddings(train_df['log_message'].tolist())
+        if len(embeddings) != len(train_df):
+            raise ValueError(f"{tag}::{len(embeddings)} embeddings for {len(train_df)} training rows")
+        index = KNNIndex(embeddings, train_df['target_label'].values, ivf_lists=self.model_trainer_config.knn_ivf_lists)
+        index.save(self.model_trainer_config.model_trainer_knn_index_file_path)
+        logger.info(f"{tag}::kNN index of {len(train_df)} rows of the sources {sorted(knn_sources)} saved successfully "
+                    f"at: {self.model_trainer_config.model_trainer_knn_index_file_path}")
+        return self.model_trainer_config.model_trainer_knn_index_file_path
+
     def initiate_model_trainer(self) -> ModelTrainerArtifact:
         tag: str = f"{self.class_name}::initiate_model_trainer"
         try:
@@ -57,14 +176,19 @@ class ModelTrainer:
             # Load data
             if not os.path.exists(self.data_transformation_artifact.transformed_data_file_path):
                 raise FileNotFoundError(f"{tag}::File not found: {self.data_transformation_artifact.transformed_data_file_path}")
-            train_df = pd.read_csv(self.data_transformation_artifact.transformed_data_file_path)
+            # only the sources, the messages and the labels of the training rows are needed for the kNN index
+            train_df = load_dataframe(self.data_transformation_artifact.transformed_data_file_path,
+                                      ['source', 'log_message', 'target_label'],
+                                      self.data_transformation_artifact.file_format)
             logger.info(f"{tag}::Data loaded successfully")
 
             # load the non-classified data
             if not os.path.exists(self.data_transformation_artifact.regex_none_classified_data_file_path):
                 raise FileNotFoundError(f"{tag}::File not found: {self.data_transformation_artifact.regex_none_classified_data_file_path}")
 
-            non_classified_df = pd.read_csv(self.data_transformation_artifact.regex_none_classified_data_file_path)
+            non_classified_df = load_dataframe(self.data_transformation_artifact.regex_none_classified_data_file_path,
+                                               ['source', 'log_message', 'target_label'],
+                                               self.data_transformation_artifact.file_format)
             # We are using the BERT model to classify the non-classified data, i.e., the data that is not classified by the regex model.
 
             """
@@ -85,8 +209,17 @@ class ModelTrainer:
                 logger.warning(f"{tag}::No data to classify for non-legacy crm")
             else:
                 # perform BERT classification on the non-legacy crm data
-                self.perform_bret_classification(non_legacy_crm_df)
-            return ModelTrainerArtifact(self.model_trainer_config.model_trainer_model_file_path)
+                if self.model_trainer_config.model_trainer_mode == "incremental":
+                    self.perform_incremental_classification(non_legacy_crm_df)
+                elif self.model_trainer_config.model_trainer_mode == "full_batch":
+                    self.perform_bret_classification(non_legacy_crm_df)
+                else:
+                    raise ValueError(f"{tag}::Unknown model trainer mode: {self.model_trainer_config.model_trainer_mode}, "
+                                     f"use 'full_batch' or 'incremental'")
+
+            # the embeddings of every training row are in the embedding store
+            knn_index_file_path = self.build_knn_index(train_df)
+            return ModelTrainerArtifact(self.model_trainer_config.model_trainer_model_file_path, knn_index_file_path)
         except Exception as e:
             logger.error(f"{tag}::Error in loading data: {str(e)}")
             raise CustomException(e, sys)
\ No newline at end of file
@@ -2,6 +2,12 @@ import os
 #  NAMES
 pipeline_name = "log_classifier"
 artifact_dir: str = "artifacts"
+# the outputs of the training stages are reused by the next runs with the same inputs, code and parameters
+stage_cache_enabled: bool = True
+stage_cache_dir: str = os.path.join(artifact_dir, "stage_cache")
+# the stages and their steps run as a graph, "thread" runs the independent steps at the same time, "serial" one by one
+pipeline_dag_executor_kind: str = "thread"
+pipeline_dag_max_workers: int = 4
 
 # FEATURE CONSTANTS
 x_feature_names = 'log_message'
@@ -13,7 +19,16 @@ regex_label = 'regex_label'
 data_file_folder_name="data"
 data_file_name="synthetic_logs.csv"
 train_file_name: str = "train_data.csv"
+# file format of the stage outputs of the training pipeline: "parquet", "arrow" (Arrow IPC) or "csv"
+artifact_file_format: str = "parquet"
+artifact_file_extensions: dict = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+# also write a CSV copy next to each Parquet or Arrow stage output, for reading it with other tools
+artifact_csv_export: bool = False
+# columns with few distinct values, stored as categoricals in the stage outputs
+artifact_categorical_columns: tuple = ("source", "target_label")
 schema_file_path: str = os.path.join("data_schema", "schema.yaml")
+regex_rules_file_path: str = os.path.join("data_schema", "regex_rules.yaml")
+routing_table_file_path: str = os.path.join("data_schema", "routing.yaml")
 sentence_transformer_model_name: str = "all-mpnet-base-v2"
 
 # DATA INGESTION CONSTANTS
@@ -27,8 +42,8 @@ data_validation_valid_dir: str = "validated"
 
 # DATA TRANSFORMATION CONSTANTS
 data_transformation_dir_name: str = "data_transformation"
-data_transformation_embeddings_dir: str = "embeddings"
-data_transformation_embeddings_file_name: str = "embeddings.npy"
+# the embeddings of the training messages are kept between the runs, keyed by the model and the message text
+embedding_store_dir: str = os.path.join("cache", "embeddings")
 data_transformation_data_dir: str = "transformed"
 data_transformation_regex_none_classified: str = "classified_none_" + train_file_name
 data_transformation_regex_classified: str = "classified_" + train_file_name
@@ -38,12 +53,132 @@ data_transformation_sentence_transformer_file_name: str = "sentence_transformer.
 dbscan_eps=0.2
 dbscan_min_samples=1
 dbscan_metric='cosine'
+# "dbscan" clusters with scikit-learn DBSCAN, its memory grows with the square of the rows, "exact" finds the same
+# clusters with a blocked radius search, "approximate" only searches the clustering_ivf_probe closest k-means lists
+clustering_method: str = "exact"
+clustering_block_size: int = 4096
+clustering_ivf_lists: int = 1024
+clustering_ivf_probe: int = 8
+clustering_ivf_iterations: int = 10
+clustering_ivf_sample_size: int = 100000
 
 # MODEL TRAINING CONSTANTS
 model_trainer_dir_name: str = "model_training"
 model_trainer_model_dir_name: str = "logistic_regression"
 model_trainer_model_file_name: str = "logistic_regression.pkl"
+# the share of the messages held out as test rows, chosen by a hash of the message so they are the same in every run
 model_trainer_test_train_split: float = 0.3
+# "full_batch" fits a LogisticRegression on all the embeddings in memory, "incremental" streams the embeddings
+# from the embedding store in chunks into an SGD logistic regression, warm started from the deployed model,
+# which is kept when the new head is less accurate on the test rows
+model_trainer_mode: str = "full_batch"
+model_trainer_chunk_size: int = 10000
+model_trainer_sgd_epochs: int = 5
+model_trainer_sgd_alpha: float = 1e-4
+model_trainer_warm_start: bool = True
 
 # MODEL PUSHER CONSTANTS
-model_pusher_dir_name: str = "final_model"
\ No newline at end of file
+model_pusher_dir_name: str = "final_model"
+
+# CLASSIFIER CONSTANTS
+bert_classifier_threshold: float = 0.5
+bert_classifier_batch_size: int = 64
+# number of rows classified at a time when a CSV is streamed
+classify_csv_chunk_size: int = 10000
+# maximum number of NDJSON lines classified at a time by /v1/classify/stream
+classify_ndjson_batch_size: int = 256
+# maximum number of logs in one /v1/classify request
+classify_json_max_logs: int = 10000
+# the regex and BERT tiers run on this executor in the API, "thread" or "process"; with "process" the counters and
+# histograms the workers record are sent back with the results, the worker caches are not on /metrics
+classify_executor_kind: str = "thread"
+classify_executor_max_workers: int = 4
+# in the API the BERT messages of the concurrent requests are encoded together in micro batches
+bert_micro_batching_enabled: bool = True
+bert_micro_batch_max_size: int = 64
+bert_micro_batch_max_wait_seconds: float = 0.005
+bert_micro_batch_max_queue_size: int = 10000
+regex_rules_supported_versions: tuple = (1,)
+routing_table_supported_versions: tuple = (1,)
+# the tiers a source can be routed to in the routing table
+routing_tiers: tuple = ("regex", "bert", "knn", "llm")
+# the BERT label cache is keyed by the exact log message and the version of the head and the encoder,
+# it is off by default so the labels never depend on the messages classified before
+bert_cache_enabled: bool = False
+bert_cache_max_size: int = 100000
+# with the label cache on, the embeddings are also cached by the exact log message and the encoder,
+# a message whose label was cached for an older head is not encoded again
+bert_cache_store_embeddings: bool = False
+bert_cache_persist: bool = False
+bert_cache_file_path: str = os.path.join("cache", "bert_cache.pkl")
+bert_embedding_cache_file_path: str = os.path.join("cache", "bert_embedding_cache.pkl")
+# the template miner classifies each log template once and reuses the label for the same template
+template_mining_enabled: bool = False
+template_miner_depth: int = 4
+template_miner_similarity_threshold: float = 0.7
+template_miner_max_children: int = 100
+template_miner_max_clusters: int = 10000
+template_miner_persist: bool = False
+template_miner_file_path: str = os.path.join("cache", "templates.json")
+llm_model_name: str = "deepseek-r1-distill-llama-70b"
+llm_temperature: float = 0.5
+# the LegacyCRM messages are packed into prompts and the prompts are sent concurrently
+llm_max_concurrency: int = 8
+llm_messages_per_prompt: int = 10
+# the LLM categories are cached in a SQLite database shared by the server workers
+llm_cache_enabled: bool = True
+llm_cache_file_path: str = os.path.join("cache", "llm_cache.sqlite")
+llm_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+llm_cache_max_entries: int = 100000
+# the sentence encoder backend, "torch" runs the SentenceTransformer, "onnx" and "onnx_int8" run the exported
+# graph with ONNX Runtime on the CPU, export it with python -m src.log_classifier.utils.classifiers.sentence_encoder
+sentence_encoder_backend: str = "torch"
+sentence_encoder_onnx_dir: str = os.path.join("final_model", "sentence_encoder_onnx")
+sentence_encoder_onnx_file_name: str = "model.onnx"
+sentence_encoder_onnx_int8_file_name: str = "model_int8.onnx"
+sentence_encoder_config_file_name: str = "sentence_encoder.json"
+sentence_encoder_onnx_opset_version: int = 17
+# the kNN tier labels the logs by the vote of their nearest training embeddings, it is routed before the LLM,
+# only the logs it is not confident about are sent to the LLM, when it is disabled it is skipped
+knn_tier_enabled: bool = False
+knn_index_file_name: str = "knn_index.npz"
+knn_k: int = 5
+# "majority" gives each neighbour one vote, "weighted" weights the votes by the cosine similarity
+knn_vote: str = "weighted"
+knn_min_similarity: float = 0.8
+knn_min_vote_share: float = 0.8
+# the flat search multiplies the queries by this many index vectors at a time
+knn_block_size: int = 4096
+# with knn_ivf_lists > 0 the index is partitioned by k-means and knn_ivf_probe lists are searched per query
+knn_ivf_lists: int = 0
+knn_ivf_probe: int = 8
+knn_ivf_iterations: int = 10
+# the metrics are exposed at GET /metrics in the Prometheus text format, they are recorded once per batch
+metrics_enabled: bool = True
+metrics_latency_buckets: tuple = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+metrics_batch_size_buckets: tuple = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+# the API requests are traced stage by stage, the stage durations are returned in the Server-Timing header
+tracing_enabled: bool = True
+tracing_server_timing_header: bool = True
+# share of the traces written to the JSON lines file, the requests slower than tracing_slow_request_seconds
+# are always written
+tracing_sample_rate: float = 0.01
+tracing_slow_request_seconds: float = 1.0
+tracing_export_file_path: str = os.path.join("logs", "traces.jsonl")
+tracing_export_max_queue_size: int = 1000
+# "sync" writes the log records in the thread that logs, "queue" puts them on a queue that a listener
+# thread writes, so the requests do not wait for the disk
+logging_mode: str = "sync"
+logging_json_records: bool = False
+logging_queue_max_size: int = 10000
+# at most this many records per second from each logging call, 0 turns the rate limit off
+logging_rate_limit_per_second: float = 0
+logging_rate_limit_burst: int = 10
+# share of the records kept for each level, e.g. {"DEBUG": 0.01}, the levels not listed are all kept
+logging_sample_rates: dict = {}
+# the offline batch classifier reads the input in chunks of this many rows and classifies them in worker processes
+batch_classify_chunk_size: int = 100000
+batch_classify_workers: int = 4
+# at most this many chunks wait to be classified or written at a time
+batch_classify_max_pending_chunks: int = 8
+batch_classify_progress_seconds: float = 10.0
@@ -1,27 +1,35 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     # these are the inputs to the data ingestion pipeline
     train_file_path: str
+    # "parquet", "arrow" or "csv", the format of the data files
+    file_format: str = "csv"
 
 @dataclass
 class DataValidationArtifact:
     validation_status: bool
     valid_train_file_path: str
+    file_format: str = "csv"
 
 @dataclass
 class DataTransformationArtifact:
-    model_embeddings_file_path: str
+    # the embedding store directory and the model id of the embeddings in it
+    embedding_store_path: str
+    embedding_model_id: str
     transformed_data_file_path: str
     regex_none_classified_data_file_path: str
     regex_classified_data_file_path: str
     sentence_transformer_file_path: str
+    file_format: str = "csv"
 
 @dataclass
 class ModelTrainerArtifact:
     logistic_regression_model_file_path: str
+    knn_index_file_path: Optional[str] = None
 
 @dataclass
 class ModelPusherArtifact:
@@ -8,17 +8,23 @@ from src.log_classifier.constants import (data_file_folder_name,
                                           train_file_name,
                                           data_validation_dir_name,
                                           data_validation_valid_dir, data_transformation_dir_name,
-                                          data_transformation_embeddings_file_name,
                                           dbscan_eps, dbscan_min_samples, dbscan_metric,
-                                          data_transformation_embeddings_dir, data_transformation_data_dir,
+                                          embedding_store_dir, data_transformation_data_dir,
                                           data_transformation_regex_none_classified,
                                           data_transformation_regex_classified, model_trainer_dir_name,
                                           data_transformation_sentence_transformer_folder,
                                           data_transformation_sentence_transformer_file_name,
                                           model_trainer_test_train_split, model_trainer_model_dir_name,
-                                          model_trainer_model_file_name, model_pusher_dir_name)
+                                          model_trainer_model_file_name, model_pusher_dir_name,
+                                          knn_index_file_name, knn_ivf_lists, artifact_file_format,
+                                          model_trainer_mode, model_trainer_chunk_size, model_trainer_sgd_epochs,
+                                          model_trainer_sgd_alpha, model_trainer_warm_start)
+from src.log_classifier.utils.utils import artifact_file_path
 global_data_file_name = data_file_name
 global_train_data_file_name = train_file_name
+# the stage outputs are saved in the artifact file format, the source data stays a CSV file
+global_artifact_data_file_name = artifact_file_path(data_file_name, artifact_file_format)
+global_artifact_train_data_file_name = artifact_file_path(train_file_name, artifact_file_format)
 class DataIngestionConfig:
     def __init__(self, config: TrainingPipelineConfig):
         self.class_name = self.__class__.__name__
@@ -26,20 +32,21 @@ class DataIngestionConfig:
                                                global_data_file_name)
         self.data_ingestion_dir = os.path.join(config.artifact_dir,
                                                data_ingestion_dir_name)
+        self.file_format = artifact_file_format
         self.feature_store_file_path = os.path.join(self.data_ingestion_dir,
                                                     data_ingestion_feature_store_dir_name,
-                                                    global_data_file_name)
+                                                    global_artifact_data_file_name)
         self.training_file_path = os.path.join(self.data_ingestion_dir,
                                                data_ingestion_ingested_data_dir_name,
-                                               global_train_data_file_name)
+                                               global_artifact_train_data_file_name)
 
-        # folder structure
+        # folder structure, with the extension of the artifact file format
         # artifacts
         #   - data_ingestion
         #       - feature_store
-        #           - synthetic_logs.csv
+        #           - synthetic_logs.parquet
         #       - ingested
-        #           - train_data.csv
+        #           - train_data.parquet
 
 class DataValidationConfig:
     def __init__(self, config: TrainingPipelineConfig):
@@ -48,24 +55,26 @@ class DataValidationConfig:
         self.data_validation_dir = os.path.join(config.artifact_dir,
                                                 data_validation_dir_name)
         self.valid_data_dir = os.path.join(self.data_validation_dir, data_validation_valid_dir)
+        self.file_format = artifact_file_format
         # files
-        self.valid_train_file_path: str = os.path.join(self.valid_data_dir, global_train_data_file_name)
+        self.valid_train_file_path: str = os.path.join(self.valid_data_dir, global_artifact_train_data_file_name)
         # folder structure
         # - artifacts
         #   - data_validation
         #       - validated
-        #           - train_data.csv
+        #           - train_data.parquet
 
 class DataTransformationConfig:
     def __init__(self, config: TrainingPipelineConfig):
         self.class_name = self.__class__.__name__
         self.data_transformation_dir = os.path.join(config.artifact_dir, data_transformation_dir_name)
-        self.saved_embeddings_dir = os.path.join(self.data_transformation_dir, data_transformation_embeddings_dir)
-        self.embeddings_file_path = os.path.join(self.saved_embeddings_dir, data_transformation_embeddings_file_name)
+        # the embedding store is shared by the runs, the messages encoded by an earlier run are not encoded again
+        self.embedding_store_dir = embedding_store_dir
         self.transformed_data_dir = os.path.join(self.data_transformation_dir, data_transformation_data_dir)
-        self.transformed_data_file_path = os.path.join(self.transformed_data_dir, global_train_data_file_name)
-        self.transformed_none_regex_file_name: str = os.path.join(self.transformed_data_dir, data_transformation_regex_none_classified)
-        self.transformed_classified_regex_file_name: str = os.path.join(self.transformed_data_dir, data_transformation_regex_classified)
+        self.file_format = artifact_file_format
+        self.transformed_data_file_path = os.path.join(self.transformed_data_dir, global_artifact_train_data_file_name)
+        self.transformed_none_regex_file_name: str = os.path.join(self.transformed_data_dir, artifact_file_path(data_transformation_regex_none_classified, artifact_file_format))
+        self.transformed_classified_regex_file_name: str = os.path.join(self.transformed_data_dir, artifact_file_path(data_transformation_regex_classified, artifact_file_format))
         self.data_transformation_sentence_transformer_folder: str = os.path.join(self.data_transformation_dir, data_transformation_sentence_transformer_folder)
         self.data_transformation_sentence_transformer_file_path: str = os.path.join(self.data_transformation_sentence_transformer_folder, data_transformation_sentence_transformer_file_name)
         # dbscan clustering
@@ -76,12 +85,10 @@ class DataTransformationConfig:
         # folder structure
         # - artifacts
         #   - data_transformation
-        #       - embeddings
-        #           - embeddings.npy
         #       - transformed
-        #           - classified_none_train_data.csv
-        #           - classified_train_data.csv
-        #           - train_data.csv
+        #           - classified_none_train_data.parquet
+        #           - classified_train_data.parquet
+        #           - train_data.parquet
 
 class ModelTrainerConfig:
     def __init__(self, config: TrainingPipelineConfig):
@@ -90,11 +97,21 @@ class ModelTrainerConfig:
         self.model_trainer_model_dir_path: str = os.path.join(self.model_trainer_dir, model_trainer_model_dir_name)
         self.model_trainer_model_file_path: str = os.path.join(self.model_trainer_dir, model_trainer_model_file_name)
         self.model_trainer_test_train_split = model_trainer_test_train_split
+        self.model_trainer_knn_index_file_path: str = os.path.join(self.model_trainer_dir, knn_index_file_name)
+        self.knn_ivf_lists = knn_ivf_lists
+        self.model_trainer_mode = model_trainer_mode
+        self.model_trainer_chunk_size = model_trainer_chunk_size
+        self.model_trainer_sgd_epochs = model_trainer_sgd_epochs
+        self.model_trainer_sgd_alpha = model_trainer_sgd_alpha
+        # the incremental training starts from the model the pusher deployed, when there is one
+        self.model_trainer_warm_start = model_trainer_warm_start
+        self.model_trainer_warm_start_file_path: str = os.path.join(model_pusher_dir_name, model_trainer_model_file_name)
         # folder structure
         # - artifacts
         #   - model_training
         #       - logistic_regression
         #           - logistic_regression.pkl
+        #       - knn_index.npz
 
 class ModelPusherConfig:
     def __init__(self):
@@ -1,7 +1,18 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
 from datetime import datetime
 
+from src.log_classifier.constants import (logging_mode, logging_json_records, logging_queue_max_size,
+                                          logging_rate_limit_per_second, logging_rate_limit_burst,
+                                          logging_sample_rates)
+
 # Define the project root directory
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
 
@@ -12,6 +23,149 @@ os.makedirs(logs_directory, exist_ok=True)
 # Define log file name with timestamp
 log_filename = datetime.now().strftime(os.path.join(logs_directory, "ml_project_%Y%m%d_%H%M%S.log"))
 
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object, for the log collectors that parse structured logs."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most rate_per_second records per second from each logging call, with bursts of burst records.
+    A call is identified by its logger, file and line, so a message logged in a loop does not flood the log
+    while the other messages still get through. The next record let through from a call has the number
+    of records suppressed since the previous one in its suppressed attribute, and a note for the text
+    formatter in its suppressed_note attribute. The message and its arguments are left as they are.
+    """
+    def __init__(self, rate_per_second: float, burst: int):
+        super().__init__()
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.lock = threading.Lock()
+        # (logger name, file, line) -> [tokens, last refill time, suppressed records]
+        self.buckets = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate_per_second)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.suppressed_note = f" [{suppressed} similar messages suppressed]"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records of each level, {level name: share}, the other levels are all kept."""
+    def __init__(self, sample_rates: dict):
+        super().__init__()
+        self.sample_rates = {logging.getLevelName(level_name): rate for level_name, rate in sample_rates.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.sample_rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+# the message arguments of these types cannot change after the call, so they can be formatted later
+lazy_argument_types = (str, int, float, bool, type(None))
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts the records on the queue without formatting them, the listener thread formats and writes them.
+    The records are only formatted before they are queued when an argument of the message could change
+    before the listener formats it. When the queue is full the record is dropped and counted.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, lazy_argument_types) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    """Queue listener that can be stopped more than once, it is stopped at exit and can be stopped before."""
+    running = False
+
+    def start(self) -> None:
+        super().start()
+        self.running = True
+
+    def stop(self) -> None:
+        if self.running:
+            self.running = False
+            super().stop()
+
+
+def configure_logger(logger: logging.Logger, handlers: list, mode: str = logging_mode,
+                     json_records: bool = logging_json_records, queue_max_size: int = logging_queue_max_size,
+                     rate_limit_per_second: float = logging_rate_limit_per_second,
+                     rate_limit_burst: int = logging_rate_limit_burst,
+                     sample_rates: dict = logging_sample_rates):
+    """
+    Attach the handlers to the logger.
+    With mode "sync" the handlers write in the thread that logs, with mode "queue" the logger only puts
+    the records on a queue and a listener thread writes them with the handlers.
+    Returns the queue listener, or None in "sync" mode.
+    """
+    if json_records:
+        for handler in handlers:
+            handler.setFormatter(JsonFormatter())
+    if rate_limit_per_second > 0:
+        logger.addFilter(RateLimitFilter(rate_limit_per_second, rate_limit_burst))
+    if sample_rates:
+        logger.addFilter(SamplingFilter(sample_rates))
+
+    if mode == "sync":
+        for handler in handlers:
+            logger.addHandler(handler)
+        return None
+    if mode != "queue":
+        raise ValueError(f"Unknown logging mode: {mode}, use 'sync' or 'queue'")
+    log_queue = queue.Queue(maxsize=queue_max_size)
+    logger.addHandler(LazyQueueHandler(log_queue))
+    listener = LogQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # the queued records are written before the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
 # Set up logger
 logger = logging.getLogger("CustomLogger")
 logger.setLevel(logging.DEBUG)
@@ -26,13 +180,14 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 
 # Define log message format
-formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] - %(message)s')
+# the note of the rate limit filter is empty when no record of the call was suppressed
+formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] - %(message)s%(suppressed_note)s',
+                              defaults={"suppressed_note": ""})
 file_handler.setFormatter(formatter)
 console_handler.setFormatter(formatter)
 
 # Add handlers to the logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+queue_listener = configure_logger(logger, [file_handler, console_handler])
 
 # Example usage
 if __name__ == "__main__":
@@ -46,5 +201,5 @@ if __name__ == "__main__":
         # Simulate an error
         # raise ValueError("This is an error message")
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
-    logger.info("Finished the machine learning project.")
\ No newline at end of file
+        logger.error("An error occurred: %s", e)
+    logger.info("Finished the machine learning project.")
@@ -0,0 +1,118 @@
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+
+from src.log_classifier.constants import pipeline_dag_executor_kind, pipeline_dag_max_workers
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+
+@dataclass
+class DAGNode:
+    name: str
+    function: Callable
+    # the nodes whose outputs are the arguments of the function, in this order
+    inputs: tuple = ()
+    # the nodes that must be completed before this one, their outputs are not passed
+    after: tuple = ()
+
+
+def timed_call(function: Callable, *args) -> tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, start, time.perf_counter()
+
+
+class DAGExecutor:
+    """
+    Runs the nodes of a graph of steps, each node declares the nodes it takes its inputs from.
+    A node is started as soon as its inputs are completed, with kind "thread" the independent nodes run at
+    the same time on a thread pool, the long steps (the encoder, the Parquet writes, the matrix products of the
+    clustering) release the GIL. With kind "serial" the nodes run one by one in the order they were added.
+    The time of each node and the critical path, the chain of nodes that decided the total time, are reported.
+    """
+    def __init__(self, name: str, kind: str = pipeline_dag_executor_kind, max_workers: int = pipeline_dag_max_workers):
+        self.class_name = self.__class__.__name__
+        if kind not in ("thread", "serial"):
+            raise ValueError(f"Unknown DAG executor kind: {kind}, use 'thread' or 'serial'")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.nodes = {}
+        # node -> (start, end) of its last run
+        self.timings = {}
+        self.start = self.end = 0.0
+
+    def add(self, name: str, function: Callable, inputs: tuple = (), after: tuple = ()) -> None:
+        """Add a node, the nodes it depends on must be added before it, so the graph has no cycle."""
+        if name in self.nodes:
+            raise ValueError(f"{self.name}::The node {name} is already in the graph")
+        unknown = [dependency for dependency in (*inputs, *after) if dependency not in self.nodes]
+        if unknown:
+            raise ValueError(f"{self.name}::The node {name} depends on nodes that are not in the graph: {unknown}")
+        self.nodes[name] = DAGNode(name, function, tuple(inputs), tuple(after))
+
+    def ready(self, node: DAGNode, results: dict) -> bool:
+        return all(dependency in results for dependency in (*node.inputs, *node.after))
+
+    def run(self) -> dict:
+        """Run the nodes, returns the output of each node."""
+        tag: str = f"{self.class_name}::run"
+        results = {}
+        self.timings = {}
+        self.start = time.perf_counter()
+        try:
+            if self.kind == "serial":
+                for node in self.nodes.values():
+                    results[node.name], *self.timings[node.name] = timed_call(
+                        node.function, *[results[name] for name in node.inputs])
+            else:
+                pending = dict(self.nodes)
+                running = {}
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as executor:
+                    try:
+                        while pending or running:
+                            for node in [node for node in pending.values() if self.ready(node, results)]:
+                                del pending[node.name]
+                                future = executor.submit(timed_call, node.function,
+                                                         *[results[name] for name in node.inputs])
+                                running[future] = node.name
+                            done, _ = wait(running, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                name = running.pop(future)
+                                results[name], *self.timings[name] = future.result()
+                    except Exception:
+                        # the nodes that have not started are not run after a node failed
+                        for future in running:
+                            future.cancel()
+                        raise
+            self.end = time.perf_counter()
+            return results
+        except Exception as e:
+            logger.error(f"{tag}::Error running the graph {self.name}: {e}")
+            raise CustomException(e, sys)
+
+    def critical_path(self) -> list:
+        """The chain of nodes that ended last, each node preceded by its dependency that completed last."""
+        if not self.timings:
+            return []
+        path = [max(self.timings, key=lambda name: self.timings[name][1])]
+        while True:
+            node = self.nodes[path[-1]]
+            dependencies = (*node.inputs, *node.after)
+            if not dependencies:
+                return path[::-1]
+            path.append(max(dependencies, key=lambda name: self.timings[name][1]))
+
+    def log_report(self) -> None:
+        tag: str = f"{self.class_name}::log_report"
+        node_seconds = sum(end - start for start, end in self.timings.values())
+        logger.info(f"{tag}::{self.name}: {len(self.timings)} nodes in {self.end - self.start:.2f}s, "
+                    f"{node_seconds:.2f}s of node time with the {self.kind} executor")
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            logger.info(f"{tag}::{self.name}: {name:<24} starts {start - self.start:>7.2f}s takes {end - start:>7.2f}s")
+        path = self.critical_path()
+        path_seconds = sum(self.timings[name][1] - self.timings[name][0] for name in path)
+        logger.info(f"{tag}::{self.name}: critical path {' -> '.join(path)}, {path_seconds:.2f}s")
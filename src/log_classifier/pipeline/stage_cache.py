@@ -0,0 +1,204 @@
+import ast
+import dataclasses
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Callable, Optional
+
+from src.log_classifier.constants import stage_cache_dir, stage_cache_enabled
+from src.log_classifier.entity import artifact_entity
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+stage_cache_artifact_file_name: str = "artifact.json"
+
+
+def file_hash(file_path: str) -> str:
+    """Hash of the content of a file, or of the relative paths and contents of the files of a directory."""
+    digest = hashlib.sha256()
+    if os.path.isdir(file_path):
+        for directory, directory_names, file_names in sorted(os.walk(file_path)):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(directory, file_name)
+                digest.update(os.path.relpath(path, file_path).encode("utf-8"))
+                digest.update(file_hash(path).encode("utf-8"))
+        return digest.hexdigest()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def module_files(modules: list, package: str = "src.log_classifier") -> list:
+    """
+    The files of the modules and of the modules of the package they import, directly or through the modules
+    they import. The imports are read from the source, the imports inside the functions are included.
+    """
+    files, visited, pending = [], set(), list(modules)
+    while pending:
+        module = pending.pop()
+        if module in visited:
+            continue
+        visited.add(module)
+        spec = importlib.util.find_spec(module)
+        if spec is None or not spec.has_location:
+            continue
+        file_path = os.path.relpath(spec.origin)
+        files.append(file_path)
+        with open(spec.origin) as file:
+            tree = ast.parse(file.read(), filename=file_path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names if alias.name.startswith(package))
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and (node.module or "").startswith(package):
+                pending.append(node.module)
+                imported_spec = importlib.util.find_spec(node.module)
+                if imported_spec is not None and imported_spec.submodule_search_locations is not None:
+                    # the names imported from a package can be its modules
+                    pending.extend(f"{node.module}.{alias.name}" for alias in node.names
+                                   if importlib.util.find_spec(f"{node.module}.{alias.name}") is not None)
+    return sorted(files)
+
+
+def link_path(source: str, destination: str) -> None:
+    """Hard link a file or the files of a directory, they are copied when they can not be linked."""
+    if os.path.isdir(source):
+        for directory, _, file_names in os.walk(source):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                link_path(path, os.path.join(destination, os.path.relpath(path, source)))
+        return
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # the cache and the artifacts are on different file systems
+        shutil.copy2(source, destination)
+
+
+class StageCache:
+    """
+    Content addressed cache of the outputs of the training pipeline stages.
+    The fingerprint of a stage is a hash of the output hashes of the stages it depends on, the content of its
+    input and code files, the code files include the constants module with the parameters. When a completed run
+    of the stage with the same fingerprint is in the cache, its output files are hard linked into the artifact
+    directory of this run and the stage is not run.
+    A stage that completes is saved at once, so a run that failed is resumed from the stage that failed.
+    The stages in force_stages are run even when they are in the cache.
+    """
+    def __init__(self, artifact_dir: str, cache_dir: str = stage_cache_dir, enabled: bool = stage_cache_enabled,
+                 force_stages: tuple = ()):
+        self.class_name = self.__class__.__name__
+        self.artifact_dir = artifact_dir
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.force_stages = set(force_stages)
+        # stage -> hash of its outputs, for the fingerprints of the next stages
+        self.output_hashes = {}
+        self.report = []
+
+    def fingerprint(self, stage: str, depends_on: list, files: list) -> str:
+        digest = hashlib.sha256(stage.encode("utf-8"))
+        for upstream_stage in depends_on:
+            digest.update(f"{upstream_stage}={self.output_hashes[upstream_stage]}".encode("utf-8"))
+        for path in files:
+            digest.update(f"{path}={file_hash(path)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def relative_path(self, value) -> Optional[str]:
+        """The path of an output file relative to the artifact directory, None for the other artifact values."""
+        if not isinstance(value, str) or not os.path.exists(value):
+            return None
+        relative_path = os.path.relpath(os.path.abspath(value), os.path.abspath(self.artifact_dir))
+        return None if relative_path.startswith("..") else relative_path
+
+    def save(self, stage: str, fingerprint: str, artifact) -> str:
+        """Save the outputs of the stage in the cache, returns the hash of the outputs."""
+        entry_dir = os.path.join(self.cache_dir, stage, fingerprint)
+        temporary_dir = f"{entry_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        fields, output_digest = {}, hashlib.sha256()
+        for name, value in dataclasses.asdict(artifact).items():
+            relative_path = self.relative_path(value)
+            if relative_path is None:
+                fields[name] = {"value": value}
+                output_digest.update(f"{name}={json.dumps(value, default=str)}".encode("utf-8"))
+            else:
+                link_path(value, os.path.join(temporary_dir, relative_path))
+                fields[name] = {"path": relative_path}
+                output_digest.update(f"{name}={file_hash(value)}".encode("utf-8"))
+        output_hash = output_digest.hexdigest()
+        os.makedirs(temporary_dir, exist_ok=True)
+        with open(os.path.join(temporary_dir, stage_cache_artifact_file_name), "w") as file:
+            json.dump({"artifact": type(artifact).__name__, "fields": fields, "output_hash": output_hash}, file, indent=2)
+        # the entry appears complete or not at all, a forced run replaces the entry of the same fingerprint
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(temporary_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+        return output_hash
+
+    def load(self, stage: str, fingerprint: str):
+        """Link the outputs of the cached stage into the artifact directory, returns the artifact and the output hash."""
+        entry_dir = os.path.join(self.cache_dir, stage, fingerprint)
+        entry_file_path = os.path.join(entry_dir, stage_cache_artifact_file_name)
+        if not os.path.exists(entry_file_path):
+            return None, None
+        with open(entry_file_path) as file:
+            entry = json.load(file)
+        values = {}
+        for name, field in entry["fields"].items():
+            if "path" in field:
+                path = os.path.join(self.artifact_dir, field["path"])
+                if not os.path.exists(path):
+                    link_path(os.path.join(entry_dir, field["path"]), path)
+                values[name] = path
+            else:
+                values[name] = field["value"]
+        return getattr(artifact_entity, entry["artifact"])(**values), entry["output_hash"]
+
+    def run(self, stage: str, function: Callable, *inputs, depends_on: list = (), files: list = ()):
+        """
+        Run the stage function with the input artifacts, or reuse its cached outputs.
+        depends_on are the stages that made the input artifacts, files the input and code files of the stage.
+        """
+        tag: str = f"{self.class_name}::run"
+        try:
+            start = time.perf_counter()
+            if not self.enabled:
+                artifact = function(*inputs)
+                self.report.append({"stage": stage, "status": "disabled", "seconds": time.perf_counter() - start})
+                return artifact
+            fingerprint = self.fingerprint(stage, list(depends_on), list(files))
+            forced = stage in self.force_stages or "all" in self.force_stages
+            artifact, output_hash = (None, None) if forced else self.load(stage, fingerprint)
+            status = "hit"
+            if artifact is None:
+                artifact = function(*inputs)
+                output_hash = self.save(stage, fingerprint, artifact)
+                status = "forced" if forced else "miss"
+            self.output_hashes[stage] = output_hash
+            self.report.append({"stage": stage, "status": status, "fingerprint": fingerprint[:12],
+                                "seconds": time.perf_counter() - start})
+            logger.info(f"{tag}::Stage {stage}: cache {status}, fingerprint {fingerprint[:12]}")
+            return artifact
+        except Exception as e:
+            logger.error(f"{tag}::Error running the stage {stage}: {e}")
+            raise CustomException(e, sys)
+
+    def log_report(self) -> None:
+        """Log the cache status and the time of each stage, and save them in the artifact directory."""
+        tag: str = f"{self.class_name}::log_report"
+        hits = sum(entry["status"] == "hit" for entry in self.report)
+        logger.info(f"{tag}::{hits} of {len(self.report)} stages were reused from the stage cache")
+        for entry in self.report:
+            logger.info(f"{tag}::{entry['stage']:<22}{entry['status']:<10}{entry['seconds']:>8.2f}s")
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        with open(os.path.join(self.artifact_dir, "stage_cache_report.json"), "w") as file:
+            json.dump(self.report, file, indent=2)
@@ -0,0 +1,348 @@
+import argparse
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from src.log_classifier.constants import (batch_classify_chunk_size, batch_classify_workers,
+                                          batch_classify_max_pending_chunks, batch_classify_progress_seconds)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+required_columns = ("source", "log_message")
+
+
+def file_format(file_path: str) -> str:
+    if file_path.endswith((".parquet", ".pq")):
+        return "parquet"
+    if file_path.endswith((".csv", ".csv.gz")):
+        return "csv"
+    raise ValueError(f"Unsupported file {file_path}, use a .csv, .csv.gz or .parquet file")
+
+
+def classify_chunk(sources: list, log_messages: list) -> list:
+    """
+    Classify the logs of one chunk, run in the worker processes.
+    Each log is classified on its own, the labels reused from the templates and the BERT cache depend on the
+    logs a worker classified before, so with several workers they could differ from the serial labels.
+    """
+    from src.log_classifier.utils.classifiers.classifier import classify
+    return classify(list(zip(sources, log_messages)), use_templates=False, use_bert_cache=False)
+
+
+class ChunkReader:
+    """
+    Reads the input file in chunks of chunk_size rows and tells how much of the file is read,
+    from the position in the file for CSV and from the number of rows in the metadata for Parquet.
+    The CSV columns are read as text, so the types of the columns do not depend on the rows of each chunk
+    and the columns that are not classified are written back as they were read.
+    """
+    def __init__(self, file_path: str, chunk_size: int):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.format = file_format(file_path)
+        self.rows_read = 0
+        self.file = None
+        self.total_rows = None
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(self.file_path)
+            self.total_rows = parquet_file.metadata.num_rows
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size):
+                self.rows_read += batch.num_rows
+                yield batch.to_pandas()
+            return
+        with open(self.file_path, "rb") as self.file:
+            compression = "gzip" if self.file_path.endswith(".gz") else None
+            with pd.read_csv(self.file, chunksize=self.chunk_size, compression=compression,
+                             dtype=str, keep_default_na=False) as csv_reader:
+                for chunk in csv_reader:
+                    self.rows_read += len(chunk)
+                    yield chunk
+
+    def fraction_read(self) -> float:
+        if self.total_rows:
+            return self.rows_read / self.total_rows
+        if self.file is not None and not self.file.closed:
+            return self.file.tell() / max(os.path.getsize(self.file_path), 1)
+        return 1.0
+
+
+class BatchCheckpoint:
+    """
+    Records the chunks whose output part is written, so a job that is stopped resumes after them.
+    The checkpoint is only used when the input file, its size and modification time and the chunk size match.
+    """
+    def __init__(self, file_path: str, fingerprint: dict):
+        self.class_name = self.__class__.__name__
+        self.file_path = file_path
+        self.fingerprint = fingerprint
+        # chunk index -> number of rows
+        self.completed = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> bool:
+        """Load the completed chunks, returns False when there is no checkpoint for this input."""
+        if not os.path.exists(self.file_path):
+            return False
+        with open(self.file_path) as file:
+            checkpoint = json.load(file)
+        if checkpoint.get("fingerprint") != self.fingerprint:
+            return False
+        self.completed = {int(index): rows for index, rows in checkpoint["completed"].items()}
+        return True
+
+    def mark_completed(self, index: int, rows: int) -> None:
+        with self.lock:
+            self.completed[index] = rows
+            temporary_file_path = self.file_path + ".tmp"
+            with open(temporary_file_path, "w") as file:
+                json.dump({"fingerprint": self.fingerprint, "completed": self.completed}, file)
+            os.replace(temporary_file_path, self.file_path)
+
+
+class BatchClassifier:
+    """
+    Classifies a CSV, gzip CSV or Parquet file in chunks of chunk_size rows and writes the file with
+    a target_label column, like csv_classifier does for a file that fits in memory.
+    A reader thread reads the chunks, the chunks are classified by worker processes that each load
+    their own models, and a writer thread writes each classified chunk to its own part file.
+    The threads and the workers are connected by queues of at most max_pending_chunks chunks,
+    so the memory used does not grow with the file size.
+    Each written part is recorded in a checkpoint, a job that is run again skips the recorded chunks.
+    When all the chunks are written the parts are joined into the output file in the order of the input.
+    With workers=0 the chunks are classified in this process.
+    """
+    def __init__(self, input_path: str, output_path: str, chunk_size: int = batch_classify_chunk_size,
+                 workers: int = batch_classify_workers,
+                 max_pending_chunks: int = batch_classify_max_pending_chunks,
+                 progress_seconds: float = batch_classify_progress_seconds):
+        self.class_name = self.__class__.__name__
+        self.input_path = input_path
+        self.output_path = output_path
+        self.output_format = file_format(output_path)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_pending_chunks = max_pending_chunks
+        self.progress_seconds = progress_seconds
+        self.parts_dir = output_path + ".parts"
+        input_stat = os.stat(input_path)
+        self.checkpoint = BatchCheckpoint(output_path + ".checkpoint.json", {
+            "input_path": os.path.abspath(input_path),
+            "input_size": input_stat.st_size,
+            "input_modified_ns": input_stat.st_mtime_ns,
+            "chunk_size": chunk_size,
+            "output_format": self.output_format,
+        })
+        self.reader = ChunkReader(input_path, chunk_size)
+        self.rows_skipped = 0
+        self.rows_classified = 0
+        self.start = None
+        self.last_progress = None
+
+    def part_path(self, index: int) -> str:
+        extension = "parquet" if self.output_format == "parquet" else "csv"
+        return os.path.join(self.parts_dir, f"part-{index:06d}.{extension}")
+
+    def run(self) -> dict:
+        tag: str = f"{self.class_name}::run"
+        try:
+            if self.checkpoint.load():
+                logger.info("%s::Resuming after %s completed chunks", tag, len(self.checkpoint.completed))
+            elif os.path.exists(self.parts_dir):
+                # the parts of another input or chunk size are not reused
+                shutil.rmtree(self.parts_dir)
+            os.makedirs(self.parts_dir, exist_ok=True)
+            self.start = self.last_progress = time.perf_counter()
+
+            executor = None
+            if self.workers > 0:
+                from src.log_classifier.utils.classifiers.classification_executor import (
+                    create_classification_executor)
+                executor = create_classification_executor("process", self.workers)
+            try:
+                chunk_count = self.classify_chunks(executor)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+
+            self.join_parts(chunk_count)
+            shutil.rmtree(self.parts_dir)
+            if os.path.exists(self.checkpoint.file_path):
+                os.remove(self.checkpoint.file_path)
+            seconds = time.perf_counter() - self.start
+            summary = {
+                "output_path": self.output_path,
+                "chunks": chunk_count,
+                "rows": self.rows_skipped + self.rows_classified,
+                "rows_classified": self.rows_classified,
+                "rows_resumed": self.rows_skipped,
+                "seconds": seconds,
+                "rows_per_second": self.rows_classified / seconds if seconds else 0.0,
+            }
+            logger.info("%s::Classified %s to %s: %s", tag, self.input_path, self.output_path, summary)
+            return summary
+        except Exception as e:
+            logger.error("%s::Error classifying %s: %s", tag, self.input_path, e)
+            raise CustomException(e, sys)
+
+    def classify_chunks(self, executor) -> int:
+        """Read, classify and write all the chunks, returns the number of chunks."""
+        read_queue = queue.Queue(maxsize=self.max_pending_chunks)
+        write_queue = queue.Queue(maxsize=self.max_pending_chunks)
+        errors = []
+        reader_thread = threading.Thread(target=self.read_worker, args=(read_queue, errors),
+                                         name="batch_reader", daemon=True)
+        writer_thread = threading.Thread(target=self.write_worker, args=(write_queue, errors),
+                                         name="batch_writer", daemon=True)
+        reader_thread.start()
+        writer_thread.start()
+
+        chunk_count = 0
+        # (index, chunk, future of the labels) in the order the chunks were read
+        pending = deque()
+        try:
+            while True:
+                item = read_queue.get()
+                if item is None:
+                    break
+                index, chunk = item
+                chunk_count = index + 1
+                if index in self.checkpoint.completed and os.path.exists(self.part_path(index)):
+                    self.rows_skipped += len(chunk)
+                    continue
+                missing_columns = set(required_columns) - set(chunk.columns)
+                if missing_columns:
+                    raise ValueError(f"The input must contain the columns {', '.join(required_columns)}")
+                pending.append((index, chunk, self.submit(executor, chunk)))
+                while len(pending) >= self.max_pending_chunks:
+                    self.put_classified(write_queue, pending.popleft(), errors)
+            while pending:
+                self.put_classified(write_queue, pending.popleft(), errors)
+        finally:
+            write_queue.put(None)
+            writer_thread.join()
+        if errors:
+            raise errors[0]
+        return chunk_count
+
+    def submit(self, executor, chunk: pd.DataFrame) -> Future:
+        sources, log_messages = chunk["source"].tolist(), chunk["log_message"].tolist()
+        if executor is not None:
+            return executor.submit(classify_chunk, sources, log_messages)
+        future = Future()
+        future.set_result(classify_chunk(sources, log_messages))
+        return future
+
+    def put_classified(self, write_queue: queue.Queue, item: tuple, errors: list) -> None:
+        if errors:
+            raise errors[0]
+        index, chunk, future = item
+        chunk["target_label"] = future.result()
+        write_queue.put((index, chunk))
+
+    def read_worker(self, read_queue: queue.Queue, errors: list) -> None:
+        try:
+            for index, chunk in enumerate(self.reader):
+                read_queue.put((index, chunk))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            read_queue.put(None)
+
+    def write_worker(self, write_queue: queue.Queue, errors: list) -> None:
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            index, chunk = item
+            try:
+                self.write_part(index, chunk)
+                self.checkpoint.mark_completed(index, len(chunk))
+                self.rows_classified += len(chunk)
+                self.report_progress()
+            except Exception as e:
+                errors.append(e)
+
+    def write_part(self, index: int, chunk: pd.DataFrame) -> None:
+        part_path = self.part_path(index)
+        temporary_path = part_path + ".tmp"
+        if self.output_format == "parquet":
+            chunk.to_parquet(temporary_path, index=False)
+        else:
+            chunk.to_csv(temporary_path, index=False)
+        os.replace(temporary_path, part_path)
+
+    def report_progress(self) -> None:
+        now = time.perf_counter()
+        if now - self.last_progress < self.progress_seconds:
+            return
+        self.last_progress = now
+        rows_per_second = self.rows_classified / (now - self.start)
+        fraction_read = self.reader.fraction_read()
+        message = f"{self.rows_skipped + self.rows_classified} rows, {rows_per_second:.0f} rows/s"
+        if 0 < fraction_read and rows_per_second > 0:
+            estimated_rows = self.reader.rows_read / fraction_read
+            remaining_rows = max(estimated_rows - self.rows_skipped - self.rows_classified, 0)
+            message += f", ETA {time.strftime('%H:%M:%S', time.gmtime(remaining_rows / rows_per_second))}"
+        logger.info("%s::report_progress::%s", self.class_name, message)
+
+    def join_parts(self, chunk_count: int) -> None:
+        """Join the parts into the output file in chunk order, the output file is replaced atomically."""
+        temporary_path = self.output_path + ".tmp"
+        part_paths = [self.part_path(index) for index in range(chunk_count)]
+        if self.output_format == "parquet":
+            self.join_parquet_parts(part_paths, temporary_path)
+        else:
+            open_output = gzip.open if self.output_path.endswith(".gz") else open
+            with open_output(temporary_path, "wb") as output_file:
+                for part_index, part_path in enumerate(part_paths):
+                    with open(part_path, "rb") as part_file:
+                        # every part has the header, only the one of the first part is kept
+                        if part_index > 0:
+                            part_file.readline()
+                        shutil.copyfileobj(part_file, output_file)
+        os.replace(temporary_path, self.output_path)
+
+    @staticmethod
+    def join_parquet_parts(part_paths: list, output_path: str) -> None:
+        import pyarrow.parquet as pq
+        writer: Optional[pq.ParquetWriter] = None
+        try:
+            for part_path in part_paths:
+                table = pq.read_table(part_path)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify a large CSV, gzip CSV or Parquet file of logs")
+    parser.add_argument("input_path", help="the .csv, .csv.gz or .parquet file with the source and log_message columns")
+    parser.add_argument("output_path", help="the .csv, .csv.gz or .parquet file to write")
+    parser.add_argument("--chunk-size", type=int, default=batch_classify_chunk_size)
+    parser.add_argument("--workers", type=int, default=batch_classify_workers,
+                        help="worker processes, 0 classifies in this process")
+    parser.add_argument("--max-pending-chunks", type=int, default=batch_classify_max_pending_chunks)
+    parser.add_argument("--progress-seconds", type=float, default=batch_classify_progress_seconds)
+    args = parser.parse_args()
+    batch_classifier = BatchClassifier(args.input_path, args.output_path, chunk_size=args.chunk_size,
+                                       workers=args.workers, max_pending_chunks=args.max_pending_chunks,
+                                       progress_seconds=args.progress_seconds)
+    print(json.dumps(batch_classifier.run(), indent=2))
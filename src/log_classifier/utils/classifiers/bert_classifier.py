@@ -1,33 +1,150 @@
+import atexit
+import hashlib
 import os.path
 
-from sentence_transformers import SentenceTransformer
-from sklearn.linear_model import LogisticRegression
+import numpy as np
 
-from src.log_classifier.constants import sentence_transformer_model_name
+from src.log_classifier.constants import (bert_classifier_threshold,
+                                          bert_classifier_batch_size,
+                                          bert_cache_enabled,
+                                          bert_cache_max_size,
+                                          bert_cache_store_embeddings,
+                                          bert_cache_persist,
+                                          bert_cache_file_path,
+                                          bert_embedding_cache_file_path,
+                                          bert_micro_batch_max_size,
+                                          bert_micro_batch_max_wait_seconds,
+                                          bert_micro_batch_max_queue_size)
+from src.log_classifier.utils.classifiers.embedding_store import embedding_model_id
+from src.log_classifier.utils.classifiers.lru_cache import LRUCache
+from src.log_classifier.utils.classifiers.micro_batcher import MicroBatcher
+from src.log_classifier.utils.classifiers.sentence_encoder import create_sentence_encoder
+from src.log_classifier.utils.lazy_loader import LazySingleton
+from src.log_classifier.utils.metrics import bert_predictions_total, register_cache_stats
+from src.log_classifier.utils.tracing import span
 from src.log_classifier.utils.utils import logistic_regression_load_object
 
-# Load the LogisticRegression model using pickle
 model_path: str = "final_model/logistic_regression.pkl"
-model: LogisticRegression = logistic_regression_load_object(model_path)
-model_embedding = SentenceTransformer(sentence_transformer_model_name)
+
+
+# the hash of the head file that is loaded, the labels in the BERT cache are versioned by it
+logistic_regression_version: str = ""
+
+
+def load_logistic_regression():
+    """Load the logistic regression head and the hash of its file."""
+    global logistic_regression_version
+    model = logistic_regression_load_object(model_path)
+    with open(model_path, "rb") as file:
+        logistic_regression_version = hashlib.sha256(file.read()).hexdigest()[:16]
+    return model
+
+
+# the models are loaded on the first classification or on warmup
+logistic_regression_model = LazySingleton("logistic_regression", load_logistic_regression)
+sentence_transformer_model = LazySingleton("sentence_transformer", create_sentence_encoder)
+
+
+# (head version, encoder id, log message) -> label
+bert_cache = LRUCache(bert_cache_max_size, bert_cache_file_path if bert_cache_persist else None)
+# (encoder id, log message) -> embedding
+bert_embedding_cache = LRUCache(bert_cache_max_size, bert_embedding_cache_file_path if bert_cache_persist else None)
+if bert_cache_persist:
+    bert_cache.load()
+    bert_embedding_cache.load()
+    atexit.register(bert_cache.save)
+    atexit.register(bert_embedding_cache.save)
+register_cache_stats("bert", bert_cache.stats)
+register_cache_stats("bert_embeddings", bert_embedding_cache.stats)
+
 
 def bert_classifier(log_message):
+    if not log_message:
+        raise ValueError("log_message must be provided")
+    return bert_classify_batch([log_message])[0]
+
+
+def predict_labels(embeddings: np.ndarray, model=None) -> list:
+    """Run the logistic regression head on the embeddings, below the threshold the label is "Unclassified"."""
+    model = model if model is not None else logistic_regression_model.get()
+    with span("head", logs=len(embeddings)):
+        probabilities = model.predict_proba(embeddings)
+    # the predicted label is the class with the highest probability
+    predicted_labels = model.classes_[probabilities.argmax(axis=1)]
+    below_threshold = probabilities.max(axis=1) < bert_classifier_threshold
+    below_threshold_count = int(below_threshold.sum())
+    bert_predictions_total.inc(("classified",), len(below_threshold) - below_threshold_count)
+    bert_predictions_total.inc(("below_threshold",), below_threshold_count)
+    labels = np.where(below_threshold, "Unclassified", predicted_labels)
+    return labels.tolist()
+
+
+def bert_classify_batch(log_messages, batch_size: int = bert_classifier_batch_size,
+                        use_cache: bool = bert_cache_enabled) -> list:
+    """
+    Classify many log messages with a single encoder call.
+    The messages are encoded in batches of batch_size, the logistic regression head is run once
+    on the full embedding matrix and the labels are returned in the same order as the input.
+    Messages whose highest class probability is below the threshold are labelled "Unclassified".
+    With use_cache, a message that was classified before by the same head and encoder reuses its label,
+    and with bert_cache_store_embeddings a message that was encoded before by the same encoder reuses its
+    embedding, so a new head does not encode the cached messages again.
+    """
+    log_messages = list(log_messages)
+    if not log_messages:
+        return []
+
     # check a file in the model path exists
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"The file: {model_path} is not exists")
 
+    model = logistic_regression_model.get()
+    model_embedding = sentence_transformer_model.get()
     if not model or not model_embedding:
         raise ValueError("Model and model_embedding must be provided")
 
-    if not log_message:
-        raise ValueError("log_message must be provided")
+    if not use_cache:
+        with span("encode", logs=len(log_messages)):
+            embeddings = model_embedding.encode(log_messages, batch_size=batch_size)
+        return predict_labels(embeddings)
+
+    # a label is only reused for the same message, classified by the same head and encoder
+    version = (logistic_regression_version, embedding_model_id())
+    labels = [bert_cache.get((*version, log_message)) for log_message in log_messages]
+    # the distinct messages that are not in the cache, each one is classified once
+    missed_messages = list(dict.fromkeys(log_message for log_message, label in zip(log_messages, labels)
+                                         if label is None))
+    if missed_messages:
+        embeddings = [None] * len(missed_messages)
+        embedding_keys = [(version[1], log_message) for log_message in missed_messages]
+        if bert_cache_store_embeddings:
+            embeddings = [bert_embedding_cache.get(key) for key in embedding_keys]
+        to_encode = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if to_encode:
+            with span("encode", logs=len(to_encode)):
+                encoded = model_embedding.encode([missed_messages[index] for index in to_encode], batch_size=batch_size)
+            for index, embedding in zip(to_encode, encoded):
+                embeddings[index] = embedding
+                if bert_cache_store_embeddings:
+                    bert_embedding_cache.put(embedding_keys[index], embedding)
+        missed_labels = dict(zip(missed_messages, predict_labels(np.asarray(embeddings))))
+        for log_message, label in missed_labels.items():
+            bert_cache.put((*version, log_message), label)
+        labels = [missed_labels[log_message] if label is None else label
+                  for log_message, label in zip(log_messages, labels)]
+    return labels
+
+
+def bert_cache_stats() -> dict:
+    return {**bert_cache.stats(), "embeddings": bert_embedding_cache.stats()}
+
 
-    embeddings = model_embedding.encode([log_message])
-    probabilities = model.predict_proba(embeddings)[0]
-    if max(probabilities) < 0.5:
-        return "Unclassified"
-    predicted_label = model.predict(embeddings)[0]
-    return predicted_label
+# groups the BERT messages of the requests that are classified at the same time into one encoder call
+bert_micro_batcher = MicroBatcher(bert_classify_batch,
+                                  max_batch_size=bert_micro_batch_max_size,
+                                  max_wait_seconds=bert_micro_batch_max_wait_seconds,
+                                  max_queue_size=bert_micro_batch_max_queue_size,
+                                  name="bert_micro_batcher")
 
 
 if __name__ == "__main__":
@@ -40,6 +157,6 @@ if __name__ == "__main__":
         "Multiple login failures occurred on user 6454 account",
         "Server A790 was restarted unexpectedly during the process of data transfer"
     ]
-    for log in logs:
-        label = bert_classifier(log)
-        print(log, "->", label)
\ No newline at end of file
+    for log, label in zip(logs, bert_classify_batch(logs)):
+        print(log, "->", label)
+    print(bert_cache_stats())
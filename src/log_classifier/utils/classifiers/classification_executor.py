@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import multiprocessing
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+from src.log_classifier.constants import classify_executor_kind, classify_executor_max_workers
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.metrics import metrics_registry
+from src.log_classifier.utils.tracing import in_trace_context
+
+
+def warmup_worker() -> None:
+    """Load the models in a worker process, so each worker holds its own replica before the first request."""
+    from src.log_classifier.utils.classifiers.classifier import warmup
+    warmup()
+
+
+def call_collecting_metrics(function: Callable) -> tuple:
+    """
+    Call the function in a worker process, returns its result with the metrics it recorded.
+    A worker runs one call at a time, so the metrics collected after the call are the ones of the call.
+    """
+    result = function()
+    return result, metrics_registry.collect()
+
+
+async def run_in_classification_executor(executor: Executor, function: Callable):
+    """
+    Run the function on the classification executor without blocking the event loop.
+    On a process executor the tier, the regex rule and the BERT prediction metrics recorded in the worker
+    are returned with the result and added to the metrics of this process, the one that serves /metrics.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, ProcessPoolExecutor):
+        result, collected = await loop.run_in_executor(executor, functools.partial(call_collecting_metrics, function))
+        metrics_registry.merge(collected)
+        return result
+    return await loop.run_in_executor(executor, in_trace_context(function, executor))
+
+
+def create_classification_executor(kind: str = classify_executor_kind,
+                                   max_workers: int = classify_executor_max_workers) -> Executor:
+    """
+    Create the executor the CPU bound classification runs on, so it does not block the event loop.
+    With "thread" the workers share the models of this process, torch releases the GIL while it encodes.
+    With "process" every worker process loads its own replica of the models when it starts.
+    """
+    tag: str = "create_classification_executor"
+    try:
+        if kind == "thread":
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="classify")
+        elif kind == "process":
+            # fork is not safe in a process that already runs threads, the workers are spawned
+            executor = ProcessPoolExecutor(max_workers=max_workers,
+                                           mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=warmup_worker)
+            # the worker processes are started now, so they load the models before the first request
+            executor.submit(int)
+        else:
+            raise ValueError(f"Unknown classification executor kind: {kind}, use 'thread' or 'process'")
+        logger.info("%s::Created a %s classification executor with %s workers", tag, kind, max_workers)
+        return executor
+    except Exception as e:
+        logger.error("%s::Error creating the classification executor: %s", tag, e)
+        raise CustomException(e, sys)
@@ -1,35 +1,317 @@
-from src.log_classifier.utils.classifiers.bert_classifier import bert_classifier
-from src.log_classifier.utils.classifiers.llm_classifier import llm_classifier
-from src.log_classifier.utils.classifiers.regex_classifier import regex_classifier
+import asyncio
+import atexit
+import functools
+import os
+import time
 
+import numpy as np
 
-def classify(logs):
-    labels = []
-    for source, log_msg in logs:
-        label = log_classifier(source, log_msg)
-        labels.append(label)
+from src.log_classifier.constants import (template_mining_enabled, template_miner_persist, template_miner_file_path,
+                                          bert_micro_batching_enabled, knn_tier_enabled, bert_cache_enabled)
+from src.log_classifier.utils.classifiers.bert_classifier import (bert_classifier, bert_classify_batch,
+                                                                 bert_micro_batcher,
+                                                                 logistic_regression_model, sentence_transformer_model)
+from src.log_classifier.utils.classifiers.classification_executor import run_in_classification_executor
+from src.log_classifier.utils.classifiers.knn_classifier import knn_classify_batch
+from src.log_classifier.utils.classifiers.llm_classifier import (llm_classifier, llm_classify_batch,
+                                                                llm_classify_batch_async)
+from src.log_classifier.utils.classifiers.regex_classifier import regex_classifier, regex_classify_batch
+from src.log_classifier.utils.classifiers.routing_table import RoutingTable
+from src.log_classifier.utils.classifiers.template_miner import TemplateMiner
+from src.log_classifier.utils.lazy_loader import LazySingleton, lazy_singletons, load_status
+from src.log_classifier.utils.metrics import observe_tier_call
+from src.log_classifier.utils.tracing import span
+
+
+# tier name -> function that classifies a batch of messages, the label is None for the messages it does not label
+tier_classifiers = {
+    "regex": regex_classify_batch,
+    "bert": bert_classify_batch,
+    "knn": knn_classify_batch,
+    "llm": llm_classify_batch,
+}
+# tier name -> function that classifies one message
+tier_log_classifiers = {
+    "regex": regex_classifier,
+    "bert": bert_classifier,
+    "knn": lambda log_msg: knn_classify_batch([log_msg])[0],
+    "llm": llm_classifier,
+}
+
+# the routing table is loaded once, on the first call
+routing_table = LazySingleton("routing_table", RoutingTable)
+
+
+def get_routing_table() -> RoutingTable:
+    return routing_table.get()
+
+
+def load_template_miner() -> TemplateMiner:
+    if template_miner_persist and os.path.exists(template_miner_file_path):
+        miner = TemplateMiner.load(template_miner_file_path)
+    else:
+        miner = TemplateMiner()
+    if template_miner_persist:
+        atexit.register(miner.save, template_miner_file_path)
+    return miner
+
+
+# the templates are mined across calls, so a template seen in an earlier call is not classified again
+template_miner = LazySingleton("template_miner", load_template_miner)
+
+
+def get_template_miner() -> TemplateMiner:
+    return template_miner.get()
+
+
+def warmup() -> dict:
+    """
+    Load all the models and clients, then classify a log to warm up the encoder.
+    Returns the load status of each of them, with the error for the ones that could not be loaded.
+    """
+    status = {}
+    for name, singleton in list(lazy_singletons.items()):
+        try:
+            singleton.get()
+            status[name] = singleton.status()
+        except Exception as e:
+            status[name] = {**singleton.status(), "error": str(e)}
+    if sentence_transformer_model.loaded and logistic_regression_model.loaded:
+        bert_classify_batch(["Warmup log message"], use_cache=False)
+    return status
+
+
+# tier -> the models and clients its batched classification loads
+tier_singletons = {
+    "regex": ("regex_rule_engine",),
+    "bert": ("logistic_regression", "sentence_transformer"),
+    "knn": ("knn_index",),
+    # the batched LLM tier creates its own async client, the groq_client is only used to classify one log
+    "llm": ("llm_environment",),
+}
+
+
+def required_singletons() -> list:
+    """The names of the models and clients the tiers of the routing table need to classify the logs."""
+    names = ["routing_table"] + (["template_miner"] if template_mining_enabled else [])
+    for tier in active_tiers(sorted(get_routing_table().used_tiers())):
+        names.extend(tier_singletons[tier])
+    return names
+
+
+def is_ready() -> bool:
+    """Ready when the models and clients of the configured routes are loaded, by warmup or by the classifications."""
+    status = load_status()
+    return all(status[name]["loaded"] for name in required_singletons() if name in status)
+
+
+def template_stats(top_n: int = None) -> list:
+    return get_template_miner().template_stats(top_n)
+
+
+def classify(logs, batch: bool = True, use_templates: bool = template_mining_enabled,
+             use_bert_cache: bool = bert_cache_enabled):
+    if not batch and not use_templates:
+        return [log_classifier(source, log_msg) for source, log_msg in logs]
+    labels, _ = classify_with_tiers(logs, batch, use_templates, use_bert_cache)
+    return labels
+
+
+def classify_with_tiers(logs, batch: bool = True, use_templates: bool = template_mining_enabled,
+                        use_bert_cache: bool = bert_cache_enabled):
+    """
+    Classify the logs and return the labels with the tier that produced each label,
+    "regex", "bert", "knn", "llm" or "template" for a label reused from the template of an earlier log.
+    The logs are grouped by the route of their source and each tier of a route classifies its logs in one batch.
+    With use_bert_cache the batched BERT tier reuses the cached labels, see bert_classify_batch.
+    """
+    if use_templates:
+        return classify_with_templates(logs, batch, use_bert_cache)
+
+    if not batch:
+        labels = [log_classifier(source, log_msg) for source, log_msg in logs]
+        return labels, [None] * len(labels)
+
+    sources, log_messages = split_logs(logs)
+    route_results = [(indices, classify_cascade(take(log_messages, indices), active_tiers(tiers),
+                                                use_bert_cache=use_bert_cache))
+                     for tiers, indices in get_routing_table().group_by_route(sources).items()]
+    return scatter_results(len(logs), route_results)
+
+
+async def classify_async(logs, executor=None, use_templates: bool = template_mining_enabled):
+    """
+    Classify the logs without blocking the event loop.
+    The regex, BERT and kNN tiers run on the executor, the LLM requests are awaited on the event loop.
+    """
+    labels, _ = await classify_with_tiers_async(logs, executor, use_templates)
     return labels
 
 
+async def classify_with_tiers_async(logs, executor=None, use_templates: bool = template_mining_enabled):
+    """Same as classify_async, also returns the tier that produced each label. The routes run concurrently."""
+    if use_templates:
+        return await run_in_classification_executor(
+            executor, functools.partial(classify_with_tiers, logs, use_templates=True))
+
+    sources, log_messages = split_logs(logs)
+    routes = get_routing_table().group_by_route(sources)
+    cascades = [classify_cascade_async(take(log_messages, indices), active_tiers(tiers), executor)
+                for tiers, indices in routes.items()]
+    return scatter_results(len(logs), list(zip(routes.values(), await asyncio.gather(*cascades))))
+
+
+def split_logs(logs):
+    if not logs:
+        return [], []
+    sources, log_messages = zip(*logs)
+    return list(sources), list(log_messages)
+
+
+def take(log_messages: list, indices) -> list:
+    return [log_messages[index] for index in indices]
+
+
+def scatter_results(n_logs: int, route_results):
+    """
+    Put the labels and tiers of each route back in the order of the logs,
+    the logs that no tier of their route labels are "Unclassified" with no tier.
+    """
+    labels = np.full(n_logs, "Unclassified", dtype=object)
+    tiers = np.full(n_logs, None, dtype=object)
+    for indices, (route_labels, route_tiers) in route_results:
+        labelled = np.array([label is not None for label in route_labels], dtype=bool)
+        labels[indices[labelled]] = np.array(route_labels, dtype=object)[labelled]
+        tiers[indices] = route_tiers
+    return labels.tolist(), tiers.tolist()
+
+
+def active_tiers(tiers) -> list:
+    # a disabled tier passes all its logs to the next tier, so it is skipped
+    return [tier for tier in tiers if tier != "knn" or knn_tier_enabled]
+
+
+def run_tier(tier: str, log_messages: list, use_micro_batcher: bool = False,
+             use_bert_cache: bool = bert_cache_enabled) -> list:
+    """Classify the messages with one tier, the label is None for the messages the tier does not label."""
+    start = time.perf_counter()
+    with span(tier, logs=len(log_messages)):
+        if tier == "bert" and use_micro_batcher:
+            tier_labels = bert_micro_batcher.process(log_messages)
+        elif tier == "bert":
+            tier_labels = tier_classifiers[tier](log_messages, use_cache=use_bert_cache)
+        else:
+            tier_labels = tier_classifiers[tier](log_messages)
+    observe_tier_call(tier, len(log_messages), len(tier_labels) - tier_labels.count(None),
+                      time.perf_counter() - start)
+    return tier_labels
+
+
+def classify_cascade(log_messages: list, tiers, use_micro_batcher: bool = False,
+                     use_bert_cache: bool = bert_cache_enabled):
+    """
+    Classify the messages with the tiers in order, each tier gets the messages the earlier tiers did not label
+    in one batch. Returns the labels, None for the messages no tier labels, and the tier of each label.
+    """
+    labels = [None] * len(log_messages)
+    label_tiers = [None] * len(log_messages)
+    remaining = list(range(len(log_messages)))
+    for tier in tiers:
+        if not remaining:
+            break
+        tier_labels = run_tier(tier, take(log_messages, remaining), use_micro_batcher, use_bert_cache)
+        remaining = assign_tier_labels(labels, label_tiers, remaining, tier_labels, [tier] * len(remaining))
+    return labels, label_tiers
+
+
+async def classify_cascade_async(log_messages: list, tiers, executor=None):
+    """
+    Same as classify_cascade, the consecutive tiers before an LLM tier run in one executor call
+    and the LLM tier is awaited on the event loop.
+    """
+    labels = [None] * len(log_messages)
+    label_tiers = [None] * len(log_messages)
+    remaining = list(range(len(log_messages)))
+    # the tiers are split into runs of local tiers, each followed by an LLM tier or the end of the cascade
+    local_tiers = []
+    for tier in tiers + [None]:
+        if tier not in ("llm", None):
+            local_tiers.append(tier)
+            continue
+        if local_tiers and remaining:
+            run_local_tiers = functools.partial(classify_cascade, take(log_messages, remaining), local_tiers,
+                                                use_micro_batcher=bert_micro_batching_enabled)
+            # the executor span includes the time the call waits for a free worker
+            with span("executor", logs=len(remaining)):
+                local_labels, local_label_tiers = await run_in_classification_executor(executor, run_local_tiers)
+            remaining = assign_tier_labels(labels, label_tiers, remaining, local_labels, local_label_tiers)
+        local_tiers = []
+        if tier == "llm" and remaining:
+            start = time.perf_counter()
+            with span(tier, logs=len(remaining)):
+                llm_labels = await llm_classify_batch_async(take(log_messages, remaining))
+            observe_tier_call(tier, len(remaining), len(llm_labels) - llm_labels.count(None),
+                              time.perf_counter() - start)
+            remaining = assign_tier_labels(labels, label_tiers, remaining, llm_labels, [tier] * len(remaining))
+    return labels, label_tiers
+
+
+def assign_tier_labels(labels: list, label_tiers: list, remaining: list, tier_labels: list, tiers: list) -> list:
+    """
+    Set the labels and tiers of the remaining messages from the results of the tiers.
+    Returns the indexes of the messages that are still not labelled.
+    """
+    still_remaining = []
+    for index, label, label_tier in zip(remaining, tier_labels, tiers):
+        if label is None:
+            still_remaining.append(index)
+        else:
+            labels[index] = label
+            label_tiers[index] = label_tier
+    return still_remaining
+
+
+def classify_with_templates(logs, batch: bool = True, use_bert_cache: bool = bert_cache_enabled):
+    """
+    Classify the logs by their template.
+    Each log message is mapped to its template by the template miner, only the first message of a template
+    that has no label for its source yet goes through the classifiers, the other messages reuse the label.
+    Returns the labels and the tiers, "template" for the reused labels.
+    """
+    miner = get_template_miner()
+    clusters = [miner.add_log_message(log_msg) for _, log_msg in logs]
+
+    # (source, cluster id) -> index of the first log with the template
+    new_templates = {}
+    for index, ((source, _), cluster) in enumerate(zip(logs, clusters)):
+        if source not in cluster.labels:
+            new_templates.setdefault((source, cluster.cluster_id), index)
+    new_labels, new_tiers = classify_with_tiers([logs[index] for index in new_templates.values()], batch,
+                                                use_templates=False, use_bert_cache=use_bert_cache)
+    tiers = ["template"] * len(logs)
+    for ((source, _), index), label, tier in zip(new_templates.items(), new_labels, new_tiers):
+        clusters[index].labels[source] = label
+        tiers[index] = tier
+    return [cluster.labels[source] for (source, _), cluster in zip(logs, clusters)], tiers
+
+
 def log_classifier(source, log_msg):
-    if source == "LegacyCRM":
-        label = llm_classifier(log_msg)
-    else:
-        label = regex_classifier(log_msg)
-        if not label:
-            label = bert_classifier(log_msg)
-    return label
+    for tier in active_tiers(get_routing_table().tiers_for(source)):
+        label = tier_log_classifiers[tier](log_msg)
+        if label:
+            return label
+    return "Unclassified"
 
-def csv_classifier(input_file):
+def csv_classifier(input_file, output_file="output.csv"):
     import pandas as pd
-    df = pd.read_csv(input_file)
+    # the other columns are written back as they were read
+    df = pd.read_csv(input_file, dtype=str, keep_default_na=False)
 
     # Perform classification
     logs = list(zip(df["source"], df["log_message"]))
     df["target_label"] = classify(logs)
 
     # Save the modified file
-    output_file = "output.csv"
     df.to_csv(output_file, index=False)
 
     return output_file
@@ -0,0 +1,200 @@
+import sys
+from typing import Iterator, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.log_classifier.constants import (dbscan_eps, dbscan_min_samples, dbscan_metric, clustering_method,
+                                          clustering_block_size, clustering_ivf_lists, clustering_ivf_probe,
+                                          clustering_ivf_iterations, clustering_ivf_sample_size)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.classifiers.knn_index import normalize_vectors, top_k
+
+clustering_methods: tuple = ("dbscan", "exact", "approximate")
+
+
+def find_roots(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """The roots of the nodes in the union find forest, found by following the parents of all the nodes at once."""
+    roots = parent[nodes]
+    while True:
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+
+def union(parent: np.ndarray, sources: np.ndarray, targets: np.ndarray) -> None:
+    """Merge the sets of the ends of each edge, every set is rooted at its smallest node."""
+    while len(sources):
+        source_roots = find_roots(parent, sources)
+        target_roots = find_roots(parent, targets)
+        # the nodes point at their roots, the next searches are shorter
+        parent[sources] = source_roots
+        parent[targets] = target_roots
+        different = source_roots != target_roots
+        low = np.minimum(source_roots[different], target_roots[different])
+        high = np.maximum(source_roots[different], target_roots[different])
+        # a root merged with several sets keeps the smallest, the other merges are done by the next iteration
+        pairs = np.unique(low * len(parent) + high)
+        sources, targets = pairs // len(parent), pairs % len(parent)
+        np.minimum.at(parent, targets, sources)
+
+
+def spherical_kmeans(vectors: np.ndarray, n_lists: int, iterations: int, block_size: int,
+                     sample_size: int, seed: int = 42) -> np.ndarray:
+    """The centroids of the normalized vectors, trained on a sample of them."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignments = nearest_lists(sample, centroids, 1, block_size)[:, 0]
+        # the sums of the vectors of each list, as the product of the sparse list membership matrix and the vectors
+        membership = csr_matrix((np.ones(len(sample), dtype=np.float32), (assignments, np.arange(len(sample)))),
+                                shape=(n_lists, len(sample)))
+        sums = np.asarray(membership @ sample)
+        # a list that lost all its vectors keeps its centroid
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = normalize_vectors(sums)
+    return centroids
+
+
+def nearest_lists(vectors: np.ndarray, centroids: np.ndarray, n_probe: int, block_size: int) -> np.ndarray:
+    """The n_probe lists with the closest centroids of each vector, the closest first."""
+    blocks = (vectors[start:start + block_size] @ centroids.T for start in range(0, len(vectors), block_size))
+    if n_probe == 1:
+        return np.concatenate([scores.argmax(axis=1)[:, None] for scores in blocks])
+    list_ids = np.broadcast_to(np.arange(len(centroids)), (block_size, len(centroids)))
+    return np.concatenate([top_k(scores, list_ids[:len(scores)], n_probe)[1] for scores in blocks])
+
+
+class RadiusClustering:
+    """
+    DBSCAN with the cosine distance for large inputs, the clusters are the same as scikit-learn DBSCAN.
+    The vectors are normalized, so the cosine distance is at most eps when the dot product is at least 1 - eps,
+    and the radius neighbours are found by multiplying blocks of block_size vectors, so the memory used does not
+    grow with the square of the number of vectors. The core points are joined with a union find forest.
+    With method "approximate" the vectors are partitioned by spherical k-means into ivf_lists lists and each vector
+    is only compared with the vectors of its ivf_probe closest lists, two close vectors in lists that are not
+    probed are not neighbours, so a cluster can be split.
+    """
+    def __init__(self, eps: float = dbscan_eps, min_samples: int = dbscan_min_samples,
+                 method: str = clustering_method, block_size: int = clustering_block_size,
+                 ivf_lists: int = clustering_ivf_lists, ivf_probe: int = clustering_ivf_probe,
+                 ivf_iterations: int = clustering_ivf_iterations, ivf_sample_size: int = clustering_ivf_sample_size):
+        self.class_name = self.__class__.__name__
+        if method not in ("exact", "approximate"):
+            raise ValueError(f"Unknown radius clustering method: {method}, use 'exact' or 'approximate'")
+        self.threshold = np.float32(1.0 - eps)
+        self.min_samples = min_samples
+        self.method = method
+        self.block_size = block_size
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.ivf_iterations = ivf_iterations
+        self.ivf_sample_size = ivf_sample_size
+
+    def partition(self, vectors: np.ndarray) -> Tuple[list, list]:
+        """
+        The members and the queries of each list for the "approximate" method, each vector is a member of the list of
+        its closest centroid and a query of its ivf_probe closest lists.
+        """
+        tag: str = f"{self.class_name}::partition"
+        n_lists = max(1, min(self.ivf_lists, len(vectors) // 100))
+        n_probe = min(self.ivf_probe, n_lists)
+        centroids = spherical_kmeans(vectors, n_lists, self.ivf_iterations, self.block_size, self.ivf_sample_size)
+        probed_lists = nearest_lists(vectors, centroids, n_probe, self.block_size)
+        members = np.argsort(probed_lists[:, 0], kind="stable")
+        member_offsets = np.searchsorted(probed_lists[members, 0], np.arange(n_lists + 1))
+        probes = np.argsort(probed_lists.ravel(), kind="stable")
+        probe_offsets = np.searchsorted(probed_lists.ravel()[probes], np.arange(n_lists + 1))
+        logger.info("%s::Partitioned %s vectors into %s lists, probing %s lists",
+                    tag, len(vectors), n_lists, n_probe)
+        return ([members[member_offsets[list_id]:member_offsets[list_id + 1]] for list_id in range(n_lists)],
+                [probes[probe_offsets[list_id]:probe_offsets[list_id + 1]] // n_probe for list_id in range(n_lists)])
+
+    def tiles(self, vectors: np.ndarray,
+              partition: Tuple[list, list] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        The neighbours of the vectors by tiles of at most block_size queries and block_size candidates, with the
+        positions of the queries, of the candidates and whether each candidate is a neighbour of each query.
+        The candidates of a query are all the vectors, or the members of its probed lists with a partition.
+        Every candidate of a query is in exactly one tile of the query, the query is its own neighbour.
+        """
+        if partition is not None:
+            for list_members, list_queries in zip(*partition):
+                for query_start in range(0, len(list_queries), self.block_size):
+                    query_rows = list_queries[query_start:query_start + self.block_size]
+                    for start in range(0, len(list_members), self.block_size):
+                        candidate_rows = list_members[start:start + self.block_size]
+                        yield query_rows, candidate_rows, vectors[query_rows] @ vectors[candidate_rows].T >= self.threshold
+            return
+        # the tiles above the diagonal are computed once and given for the queries of both blocks
+        for query_start in range(0, len(vectors), self.block_size):
+            query_rows = np.arange(query_start, min(query_start + self.block_size, len(vectors)))
+            for start in range(query_start, len(vectors), self.block_size):
+                candidate_rows = np.arange(start, min(start + self.block_size, len(vectors)))
+                neighbours = vectors[query_rows] @ vectors[candidate_rows].T >= self.threshold
+                yield query_rows, candidate_rows, neighbours
+                if start != query_start:
+                    yield candidate_rows, query_rows, neighbours.T
+
+    def fit_predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """The cluster label of each embedding, numbered like scikit-learn DBSCAN, -1 for the noise."""
+        tag: str = f"{self.class_name}::fit_predict"
+        vectors = normalize_vectors(embeddings)
+        n_vectors = len(vectors)
+        parent = np.arange(n_vectors)
+        partition = self.partition(vectors) if self.method == "approximate" else None
+        if self.min_samples <= 1:
+            core = np.ones(n_vectors, dtype=bool)
+        else:
+            counts = np.zeros(n_vectors, dtype=np.int64)
+            for query_rows, candidate_rows, neighbours in self.tiles(vectors, partition):
+                counts[query_rows] += neighbours.sum(axis=1)
+            core = counts >= self.min_samples
+        # the core points within eps of each other are in the same cluster
+        for query_rows, candidate_rows, neighbours in self.tiles(vectors, partition):
+            queries, candidates = np.nonzero(neighbours)
+            queries, candidates = query_rows[queries], candidate_rows[candidates]
+            keep = (queries < candidates) & core[queries] & core[candidates]
+            union(parent, queries[keep], candidates[keep])
+        roots = find_roots(parent, np.arange(n_vectors))
+        # DBSCAN gives a border point the cluster of its core neighbours that was started first
+        border_roots = np.full(n_vectors, n_vectors, dtype=np.int64)
+        if not core.all():
+            for query_rows, candidate_rows, neighbours in self.tiles(vectors, partition):
+                if core[query_rows].all():
+                    continue
+                candidate_roots = np.where(core[candidate_rows], roots[candidate_rows], n_vectors)
+                nearest_roots = np.where(neighbours, candidate_roots[None, :], n_vectors).min(axis=1)
+                border_roots[query_rows] = np.minimum(border_roots[query_rows], nearest_roots)
+        roots = np.where(core, roots, border_roots)
+        # the clusters are numbered in the order of their first core point, like DBSCAN starts them
+        cluster_roots, labels = np.unique(roots, return_inverse=True)
+        labels = np.where(roots == n_vectors, -1, labels)
+        logger.info("%s::Found %s clusters and %s noise points in %s vectors with method %s",
+                    tag, len(cluster_roots) - int((roots == n_vectors).any()), int((labels == -1).sum()),
+                    n_vectors, self.method)
+        return labels
+
+
+def cluster_embeddings(embeddings: np.ndarray, eps: float = dbscan_eps, min_samples: int = dbscan_min_samples,
+                       metric: str = dbscan_metric, method: str = clustering_method) -> np.ndarray:
+    """
+    Cluster the embeddings like DBSCAN, with "dbscan" by scikit-learn on the whole matrix, with "exact" and
+    "approximate" by RadiusClustering, which only supports the cosine metric.
+    """
+    try:
+        if method == "dbscan":
+            from sklearn.cluster import DBSCAN
+            return DBSCAN(eps=eps, min_samples=min_samples, metric=metric).fit_predict(embeddings)
+        if method not in clustering_methods:
+            raise ValueError(f"Unknown clustering method: {method}, use one of {clustering_methods}")
+        if metric != "cosine":
+            raise ValueError(f"The {method} clustering only supports the cosine metric, not {metric}")
+        return RadiusClustering(eps, min_samples, method).fit_predict(embeddings)
+    except Exception as e:
+        logger.error("cluster_embeddings::Error clustering the embeddings: %s", e)
+        raise CustomException(e, sys)
@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from src.log_classifier.constants import (embedding_store_dir, sentence_transformer_model_name,
+                                          sentence_encoder_backend)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+# the content key is a 16 byte hash, the files are raw arrays so they can be appended to and memory mapped
+embedding_key_size: int = 16
+embedding_store_vectors_file_name: str = "vectors.f32"
+embedding_store_keys_file_name: str = "keys.bin"
+embedding_store_meta_file_name: str = "store.json"
+# the processes that append to the same store take an exclusive lock on this file
+embedding_store_lock_file_name: str = "store.lock"
+# rows closer than this in the file are read together by EmbeddingStore.read, with the rows between them
+embedding_store_read_gap: int = 8
+
+
+def embedding_model_id(model_name: str = sentence_transformer_model_name, backend: str = sentence_encoder_backend) -> str:
+    """The model id of the embeddings, the backends do not give exactly the same vectors."""
+    return f"{model_name}/{backend}"
+
+
+def embedding_key(model_id: str, log_message: str) -> bytes:
+    """Hash of the model id and the message text, the row of the message in the store."""
+    return hashlib.blake2b(f"{model_id}\x1f{log_message}".encode("utf-8"), digest_size=embedding_key_size).digest()
+
+
+class EmbeddingStore:
+    """
+    Persistent store of the sentence embeddings, keyed by a hash of the model id and the message text.
+    The float32 vectors are appended to a raw file that is memory mapped, with the keys in a second file
+    in the same order. A row index from the keys to the rows is kept in memory, so the stages read only
+    the rows of their messages and a run of consecutive rows is returned without copying it.
+    Several processes can append to the same store, each append holds an exclusive lock on the lock file.
+    """
+    def __init__(self, directory: str = embedding_store_dir, model_id: Optional[str] = None):
+        self.class_name = self.__class__.__name__
+        tag: str = f"{self.class_name}::__init__"
+        try:
+            self.directory = directory
+            self.model_id = model_id or embedding_model_id()
+            self.vectors_file_path = os.path.join(directory, embedding_store_vectors_file_name)
+            self.keys_file_path = os.path.join(directory, embedding_store_keys_file_name)
+            self.meta_file_path = os.path.join(directory, embedding_store_meta_file_name)
+            self.lock_file_path = os.path.join(directory, embedding_store_lock_file_name)
+            self.lock = threading.Lock()
+            self.dimension = None
+            self.row_index = {}
+            self.vectors = None
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.meta_file_path):
+                with open(self.meta_file_path) as file:
+                    self.dimension = json.load(file)["dimension"]
+                self.load()
+            logger.info("%s::Embedding store opened at %s with %s vectors", tag, directory, len(self))
+        except Exception as e:
+            logger.error("%s::Error opening the embedding store: %s", tag, e)
+            raise CustomException(e, sys)
+
+    def __len__(self) -> int:
+        return len(self.row_index)
+
+    def load(self) -> None:
+        """Build the row index and map the vectors, a row written partly by an interrupted append is ignored."""
+        keys = b""
+        if os.path.exists(self.keys_file_path):
+            with open(self.keys_file_path, "rb") as file:
+                keys = file.read()
+        vector_bytes = os.path.getsize(self.vectors_file_path) if os.path.exists(self.vectors_file_path) else 0
+        rows = min(len(keys) // embedding_key_size, vector_bytes // (4 * self.dimension))
+        self.row_index = {keys[row * embedding_key_size:(row + 1) * embedding_key_size]: row for row in range(rows)}
+        self.vectors = (np.memmap(self.vectors_file_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+                        if rows else np.empty((0, self.dimension), dtype=np.float32))
+
+    def keys(self, log_messages: List[str]) -> List[bytes]:
+        return [embedding_key(self.model_id, log_message) for log_message in log_messages]
+
+    def missing(self, log_messages: List[str]) -> List[str]:
+        """The distinct messages that are not in the store, in the order they first appear."""
+        missing = {}
+        for log_message, key in zip(log_messages, self.keys(log_messages)):
+            if key not in self.row_index:
+                missing.setdefault(key, log_message)
+        return list(missing.values())
+
+    def add(self, log_messages: List[str], vectors: np.ndarray) -> None:
+        """
+        Append the vectors of the messages that are not in the store yet.
+        The rows another process appended since the store was loaded are loaded first, under the file lock,
+        so the rows are counted from the files and a message another process added is not added again.
+        """
+        tag: str = f"{self.class_name}::add"
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) != len(log_messages):
+            raise ValueError(f"{tag}::{len(vectors)} vectors for {len(log_messages)} messages")
+        with self.lock, open(self.lock_file_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if os.path.exists(self.meta_file_path):
+                with open(self.meta_file_path) as file:
+                    self.dimension = json.load(file)["dimension"]
+                self.load()
+            else:
+                self.dimension = int(vectors.shape[1])
+                with open(self.meta_file_path, "w") as file:
+                    json.dump({"dimension": self.dimension}, file)
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"{tag}::The vectors have {vectors.shape[1]} dimensions, the store has {self.dimension}")
+            new_keys, new_rows = {}, []
+            for row, key in enumerate(self.keys(log_messages)):
+                if key not in self.row_index and key not in new_keys:
+                    new_keys[key] = row
+                    new_rows.append(row)
+            if not new_rows:
+                return
+            # the vectors are written before the keys, a key is never in the file without its vector,
+            # what an interrupted append wrote after the last complete row is removed first
+            rows = len(self.row_index)
+            with open(self.vectors_file_path, "ab") as file:
+                file.truncate(rows * self.dimension * 4)
+                file.write(np.ascontiguousarray(vectors[new_rows]).tobytes())
+            with open(self.keys_file_path, "ab") as file:
+                file.truncate(rows * embedding_key_size)
+                file.write(b"".join(new_keys))
+            self.load()
+        logger.info("%s::Added %s vectors, the store has %s vectors", tag, len(new_rows), len(self))
+
+    def rows(self, log_messages: List[str]) -> np.ndarray:
+        """The rows of the messages in the store, -1 for the messages that are not in it."""
+        return np.fromiter((self.row_index.get(key, -1) for key in self.keys(log_messages)),
+                           dtype=np.int64, count=len(log_messages))
+
+    def get(self, log_messages: List[str]) -> np.ndarray:
+        """
+        The vectors of the messages, all of them must be in the store.
+        When the messages are consecutive rows the memory mapped rows are returned without a copy,
+        otherwise only the rows of the messages are read.
+        """
+        tag: str = f"{self.class_name}::get"
+        rows = self.rows(log_messages)
+        if (rows < 0).any():
+            raise KeyError(f"{tag}::{int((rows < 0).sum())} messages are not in the embedding store")
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and (np.diff(rows) == 1).all():
+            return self.vectors[rows[0]:rows[-1] + 1]
+        return np.asarray(self.vectors[rows])
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """
+        The vectors of the rows of the store, in the order of the rows.
+        The rows are read from the file instead of the memory map, so the pages that were read are not kept in
+        the memory of the process, a stage that streams all the vectors in chunks only holds one chunk at a time.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.empty((len(rows), self.dimension or 0), dtype=np.float32)
+        if not len(rows):
+            return vectors
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        row_bytes = 4 * self.dimension
+        with open(self.vectors_file_path, "rb") as file:
+            for run in np.split(np.arange(len(rows)), np.flatnonzero(np.diff(sorted_rows) > embedding_store_read_gap) + 1):
+                first, last = sorted_rows[run[0]], sorted_rows[run[-1]]
+                block = np.frombuffer(os.pread(file.fileno(), int(last - first + 1) * row_bytes, int(first) * row_bytes),
+                                      dtype=np.float32).reshape(-1, self.dimension)
+                vectors[order[run]] = block[sorted_rows[run] - first]
+        return vectors
+
+    def encode(self, log_messages: List[str], encoder) -> np.ndarray:
+        """The vectors of the messages, only the messages that are not in the store are encoded with the encoder."""
+        tag: str = f"{self.class_name}::encode"
+        missing = self.missing(log_messages)
+        logger.info("%s::Encoding %s distinct messages that are not in the store, of %s messages",
+                    tag, len(missing), len(log_messages))
+        if missing:
+            self.add(missing, encoder.encode(missing))
+        return self.get(log_messages)
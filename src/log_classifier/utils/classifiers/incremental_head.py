@@ -0,0 +1,97 @@
+import copy
+import sys
+from typing import Optional
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+from src.log_classifier.constants import (model_trainer_chunk_size, model_trainer_sgd_epochs,
+                                          model_trainer_sgd_alpha)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.classifiers.embedding_store import EmbeddingStore
+
+
+def warm_start_head(model, labels: np.ndarray, n_features: int, alpha: float,
+                    n_updates: int, seed: int = 42) -> Optional[SGDClassifier]:
+    """
+    An SGD logistic regression that continues from the weights of the deployed model, None when it can not.
+    The deployed model must have the same number of features and every label of the new data in its classes.
+    A LogisticRegression is a softmax over the classes while the SGD head is one-vs-rest, so its weights are only
+    a starting point, the head moves them to the one-vs-rest optimum of the new data. Its L2 penalty 1 / C is on
+    the sum of the losses of the rows, the head gets the same regularization per row, alpha = 1 / (C * rows).
+    """
+    tag: str = "warm_start_head"
+    if model is None:
+        return None
+    if not isinstance(model, (LogisticRegression, SGDClassifier)) or model.coef_.shape[1] != n_features:
+        logger.warning("%s::The deployed model is not a linear head on %s features, starting from zero",
+                       tag, n_features)
+        return None
+    new_labels = np.setdiff1d(np.unique(labels), model.classes_)
+    if len(new_labels):
+        logger.warning("%s::The labels %s are not classes of the deployed model, starting from zero",
+                       tag, new_labels.tolist())
+        return None
+    if isinstance(model, SGDClassifier):
+        # a head trained incrementally before carries on with its own learning rate schedule
+        return copy.deepcopy(model)
+    # with the alpha of the configuration the head fits the new rows with a weaker penalty than the deployed model
+    # and moves away from its weights, which was less accurate than the deployed model
+    alpha = 1.0 / (model.C * len(labels))
+    logger.info("%s::Warm starting the one-vs-rest head from the softmax weights of the deployed model, "
+                "alpha %.3g for its penalty C %s on %s rows", tag, alpha, model.C, len(labels))
+    head = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+    head.classes_ = model.classes_.copy()
+    head.coef_ = np.array(model.coef_, dtype=np.float64, order="C")
+    head.intercept_ = np.array(model.intercept_, dtype=np.float64)
+    head.n_features_in_ = n_features
+    # the "optimal" learning rate decreases with t_, starting it as if the head had been trained by all the
+    # updates of this training keeps the first chunks from moving the weights far from the deployed ones
+    head.t_ = float(n_updates)
+    return head
+
+
+def fit_incremental_head(store: EmbeddingStore, rows: np.ndarray, labels: np.ndarray,
+                         chunk_size: int = model_trainer_chunk_size, epochs: int = model_trainer_sgd_epochs,
+                         alpha: float = model_trainer_sgd_alpha, warm_start_model=None,
+                         seed: int = 42) -> SGDClassifier:
+    """
+    Train a logistic regression head by SGD on the vectors of the store rows, chunk_size rows at a time.
+    The chunks are runs of rows in the order of the store, so they are read sequentially, the order of the chunks
+    is shuffled at each epoch and partial_fit shuffles the rows of a chunk. Only one chunk is in memory at a time.
+    With a warm_start_model the head starts from its weights, see warm_start_head.
+    """
+    tag: str = "fit_incremental_head"
+    try:
+        rows, labels = np.asarray(rows), np.asarray(labels)
+        rng = np.random.default_rng(seed)
+        head = warm_start_head(warm_start_model, labels, store.dimension, alpha, epochs * len(rows), seed)
+        logger.info("%s::Training on %s rows in chunks of %s for %s epochs, %s",
+                    tag, len(rows), chunk_size, epochs,
+                    "warm started from the deployed model" if head is not None else "from zero")
+        if head is None:
+            head = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+            classes = np.unique(labels)
+        else:
+            classes = head.classes_
+        positions = np.argsort(rows, kind="stable")
+        chunks = [positions[start:start + chunk_size] for start in range(0, len(positions), chunk_size)]
+        for _ in range(epochs):
+            for chunk_id in rng.permutation(len(chunks)):
+                chunk = chunks[chunk_id]
+                head.partial_fit(store.read(rows[chunk]).astype(np.float64), labels[chunk], classes=classes)
+        return head
+    except Exception as e:
+        logger.error("%s::Error training the incremental head: %s", tag, e)
+        raise CustomException(e, sys)
+
+
+def predict_chunks(model, store: EmbeddingStore, rows: np.ndarray,
+                   chunk_size: int = model_trainer_chunk_size) -> np.ndarray:
+    """The labels the model predicts for the vectors of the store rows, chunk_size rows at a time."""
+    rows = np.asarray(rows)
+    if not len(rows):
+        return np.empty(0, dtype=object)
+    return np.concatenate([model.predict(store.read(rows[start:start + chunk_size]))
+                           for start in range(0, len(rows), chunk_size)])
@@ -0,0 +1,32 @@
+import os.path
+
+from src.log_classifier.constants import (model_pusher_dir_name, knn_index_file_name, knn_tier_enabled, knn_k,
+                                          knn_vote, knn_min_similarity, knn_min_vote_share)
+from src.log_classifier.utils.classifiers.bert_classifier import sentence_transformer_model
+from src.log_classifier.utils.classifiers.knn_index import KNNIndex
+from src.log_classifier.utils.lazy_loader import LazySingleton
+
+knn_index_path: str = os.path.join(model_pusher_dir_name, knn_index_file_name)
+
+
+def load_knn_index():
+    # the index is only loaded when the tier is enabled, so a missing index does not make the server not ready
+    return KNNIndex.load(knn_index_path) if knn_tier_enabled else None
+
+
+knn_index = LazySingleton("knn_index", load_knn_index)
+
+
+def knn_classify_batch(log_messages) -> list:
+    """
+    Label the messages by the vote of their nearest training embeddings.
+    The label is None for the messages the tier is not confident about, and for all of them when it is disabled,
+    so they can be sent to the next tier.
+    """
+    log_messages = list(log_messages)
+    index: KNNIndex = knn_index.get()
+    if index is None or not log_messages:
+        return [None] * len(log_messages)
+    embeddings = sentence_transformer_model.get().encode(log_messages)
+    return index.classify(embeddings, k=knn_k, vote=knn_vote,
+                          min_similarity=knn_min_similarity, min_vote_share=knn_min_vote_share)
@@ -0,0 +1,173 @@
+import os
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.log_classifier.constants import (knn_k, knn_vote, knn_block_size, knn_ivf_lists, knn_ivf_probe,
+                                          knn_ivf_iterations)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(scores: np.ndarray, indices: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k highest scores of each row with their indices, sorted from the highest."""
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        indices = np.take_along_axis(indices, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class KNNIndex:
+    """
+    In memory nearest neighbour index of labelled embeddings, searched by cosine similarity.
+    The vectors are normalized float32, so the similarity is a dot product and the flat search is a
+    matrix multiplication done in blocks of block_size vectors, keeping the top k of each block.
+    With ivf_lists > 0 the vectors are partitioned by spherical k-means into ivf_lists lists and only
+    the ivf_probe lists with the closest centroids are searched for each query.
+    """
+    def __init__(self, embeddings: np.ndarray, labels, ivf_lists: int = knn_ivf_lists,
+                 ivf_probe: int = knn_ivf_probe, block_size: int = knn_block_size,
+                 centroids: Optional[np.ndarray] = None, list_offsets: Optional[np.ndarray] = None):
+        self.class_name = self.__class__.__name__
+        self.vectors = normalize_vectors(embeddings)
+        self.classes, self.label_codes = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        self.ivf_probe = ivf_probe
+        self.block_size = block_size
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        if centroids is None and ivf_lists > 0:
+            self.build_ivf(ivf_lists)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def build_ivf(self, ivf_lists: int, iterations: int = knn_ivf_iterations, seed: int = 42) -> None:
+        """Partition the vectors with spherical k-means and store them grouped by list."""
+        tag: str = f"{self.class_name}::build_ivf"
+        ivf_lists = min(ivf_lists, len(self.vectors))
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(len(self.vectors), ivf_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = self.assign(centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.vectors)
+            # a list that lost all its vectors keeps its centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize_vectors(sums)
+        assignments = self.assign(centroids)
+        order = np.argsort(assignments, kind="stable")
+        self.vectors = self.vectors[order]
+        self.label_codes = self.label_codes[order]
+        self.centroids = centroids
+        self.list_offsets = np.searchsorted(assignments[order], np.arange(ivf_lists + 1))
+        logger.info("%s::Partitioned %s vectors into %s lists", tag, len(self.vectors), ivf_lists)
+
+    def assign(self, centroids: np.ndarray) -> np.ndarray:
+        return np.concatenate([(self.vectors[start:start + self.block_size] @ centroids.T).argmax(axis=1)
+                               for start in range(0, len(self.vectors), self.block_size)])
+
+    def search(self, queries: np.ndarray, k: int = knn_k) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest vectors of each query.
+        Returns the similarities and the positions of the neighbours in the index, sorted from the nearest,
+        a query with fewer than k candidates is padded with -inf similarities and -1 positions.
+        """
+        queries = normalize_vectors(queries)
+        if self.centroids is not None:
+            return self.search_ivf(queries, k)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for query_start in range(0, len(queries), self.block_size):
+            query_block = queries[query_start:query_start + self.block_size]
+            block_scores = scores[query_start:query_start + self.block_size]
+            block_indices = indices[query_start:query_start + self.block_size]
+            for start in range(0, len(self.vectors), self.block_size):
+                similarities = query_block @ self.vectors[start:start + self.block_size].T
+                positions = np.broadcast_to(np.arange(start, start + similarities.shape[1]), similarities.shape)
+                block_scores, block_indices = top_k(np.hstack([block_scores, similarities]),
+                                                    np.hstack([block_indices, positions]), k)
+            scores[query_start:query_start + self.block_size] = block_scores
+            indices[query_start:query_start + self.block_size] = block_indices
+        return scores, indices
+
+    def search_ivf(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_probe = min(self.ivf_probe, len(self.centroids))
+        probed_lists = top_k(queries @ self.centroids.T,
+                             np.broadcast_to(np.arange(len(self.centroids)), (len(queries), len(self.centroids))),
+                             n_probe)[1]
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        # each probed list is multiplied once by all the queries that probe it
+        for list_id in np.unique(probed_lists):
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            rows = np.nonzero((probed_lists == list_id).any(axis=1))[0]
+            similarities = queries[rows] @ self.vectors[start:end].T
+            positions = np.broadcast_to(np.arange(start, end), similarities.shape)
+            scores[rows], indices[rows] = top_k(np.hstack([scores[rows], similarities]),
+                                                np.hstack([indices[rows], positions]), k)
+        return scores, indices
+
+    def vote(self, scores: np.ndarray, indices: np.ndarray, vote: str = knn_vote) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vote on the label of each query with its neighbours, each neighbour has one vote with "majority"
+        or its similarity with "weighted". Returns the labels and the share of the votes of each label.
+        """
+        found = indices >= 0
+        weights = np.where(found, 1.0 if vote == "majority" else np.clip(scores, 0.0, None), 0.0)
+        votes = np.zeros((len(indices), len(self.classes)))
+        rows = np.broadcast_to(np.arange(len(indices))[:, None], indices.shape)
+        np.add.at(votes, (rows[found], self.label_codes[indices[found]]), weights[found])
+        totals = votes.sum(axis=1)
+        winners = votes.argmax(axis=1)
+        shares = np.divide(votes[np.arange(len(votes)), winners], totals, out=np.zeros(len(votes)), where=totals > 0)
+        return self.classes[winners], shares
+
+    def classify(self, queries: np.ndarray, k: int = knn_k, vote: str = knn_vote,
+                 min_similarity: float = 0.0, min_vote_share: float = 0.0) -> list:
+        """
+        Label the queries by the vote of their k nearest neighbours.
+        The label is None when the nearest neighbour is less similar than min_similarity
+        or the winning label has less than min_vote_share of the votes.
+        """
+        scores, indices = self.search(queries, k)
+        labels, shares = self.vote(scores, indices, vote)
+        confident = (scores[:, 0] >= min_similarity) & (shares >= min_vote_share) & (indices[:, 0] >= 0)
+        return [label if is_confident else None for label, is_confident in zip(labels.tolist(), confident)]
+
+    def save(self, file_path: str) -> None:
+        tag: str = f"{self.class_name}::save"
+        try:
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            arrays = {"vectors": self.vectors, "labels": self.classes[self.label_codes]}
+            if self.centroids is not None:
+                arrays.update(centroids=self.centroids, list_offsets=self.list_offsets)
+            with open(file_path, "wb") as file:
+                np.savez(file, **arrays)
+            logger.info("%s::Saved the kNN index of %s vectors to %s", tag, len(self), file_path)
+        except Exception as e:
+            logger.error("%s::Error saving the kNN index: %s", tag, e)
+            raise CustomException(e, sys)
+
+    @classmethod
+    def load(cls, file_path: str, ivf_probe: int = knn_ivf_probe, block_size: int = knn_block_size) -> "KNNIndex":
+        try:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"The file: {file_path} is not exists")
+            with np.load(file_path) as arrays:
+                return cls(arrays["vectors"], arrays["labels"], ivf_probe=ivf_probe, block_size=block_size,
+                           centroids=arrays["centroids"] if "centroids" in arrays else None,
+                           list_offsets=arrays["list_offsets"] if "list_offsets" in arrays else None)
+        except Exception as e:
+            logger.error("KNNIndex::load::Error loading the kNN index: %s", e)
+            raise CustomException(e, sys)
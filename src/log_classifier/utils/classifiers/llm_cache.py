@@ -0,0 +1,119 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+from src.log_classifier.constants import llm_cache_file_path, llm_cache_ttl_seconds, llm_cache_max_entries
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.classifiers.log_normalizer import normalize_log_message
+
+
+def llm_cache_key(log_message: str, prompt_template: str, model_name: str, temperature: float) -> str:
+    """Hash of everything that decides the LLM response: the normalized message, the prompt, the model and the temperature."""
+    key = "\x1f".join([normalize_log_message(log_message), prompt_template, model_name, repr(temperature)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of the LLM categories in a SQLite database.
+    The database is in WAL mode so the server worker processes can share it,
+    the entries expire after ttl_seconds and the least recently used entries are removed above max_entries.
+    The hit and miss counters and the estimated LLM latency saved are kept for this process.
+    """
+    def __init__(self, file_path: str = llm_cache_file_path,
+                 ttl_seconds: float = llm_cache_ttl_seconds,
+                 max_entries: int = llm_cache_max_entries):
+        self.class_name = self.__class__.__name__
+        tag: str = f"{self.class_name}::__init__"
+        try:
+            self.file_path = file_path
+            self.ttl_seconds = ttl_seconds
+            self.max_entries = max_entries
+            self.lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self.llm_calls = 0
+            self.llm_seconds = 0.0
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            with self.connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                          key TEXT PRIMARY KEY,
+                                          category TEXT NOT NULL,
+                                          created_at REAL NOT NULL,
+                                          last_used_at REAL NOT NULL)""")
+                connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used_at ON llm_cache (last_used_at)")
+            logger.info("%s::LLM cache opened at %s", tag, file_path)
+        except Exception as e:
+            logger.error("%s::Error opening the LLM cache: %s", tag, e)
+            raise CustomException(e, sys)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per operation, sqlite connections can not be shared between threads
+        connection = sqlite3.connect(self.file_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Get the categories of the keys that are in the cache and not expired."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self.connect() as connection:
+            # sqlite limits the number of parameters of a query
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT key, category FROM llm_cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                    [*chunk, now - self.ttl_seconds]).fetchall()
+                found.update(rows)
+            if found:
+                connection.executemany("UPDATE llm_cache SET last_used_at = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, categories: Dict[str, str]) -> None:
+        if not categories:
+            return
+        now = time.time()
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, category, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                [(key, category, now, now) for key, category in categories.items()])
+            connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            connection.execute("""DELETE FROM llm_cache WHERE key IN (
+                                      SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)""",
+                               (self.max_entries,))
+
+    def record_llm_latency(self, seconds: float, number_of_messages: int) -> None:
+        """Record the latency of an LLM call, the average latency per message is used to estimate the latency saved."""
+        with self.lock:
+            self.llm_calls += number_of_messages
+            self.llm_seconds += seconds
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            seconds_per_message = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": self.hits * seconds_per_message,
+            }
@@ -1,24 +1,48 @@
+import asyncio
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from groq import Groq
 import re
 
 from config.set_config import Config
+from src.log_classifier.constants import (llm_model_name,
+                                          llm_temperature,
+                                          llm_max_concurrency,
+                                          llm_messages_per_prompt,
+                                          llm_cache_enabled)
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.classifiers.llm_cache import LLMResponseCache, llm_cache_key
+from src.log_classifier.utils.lazy_loader import LazySingleton
+from src.log_classifier.utils.metrics import llm_requests_total, llm_request_duration_seconds, register_cache_stats
+from src.log_classifier.utils.tracing import span
 
-try:
-    config = Config()
-    if config.set():
-        logger.info("Environment variables set")
-    else:
-        logger.error("Environment variables NOT set")
-        raise CustomException("Environment variables NOT set", sys)
-except Exception as ex:
-    logger.error(f"Error running the pipeline: {ex}")
-    raise CustomException(ex, sys)
 
-groq = Groq()
+def set_environment() -> bool:
+    try:
+        config = Config()
+        if config.set():
+            logger.info("Environment variables set")
+        else:
+            logger.error("Environment variables NOT set")
+            raise CustomException("Environment variables NOT set", sys)
+    except Exception as ex:
+        logger.error("Error running the pipeline: %s", ex)
+        raise CustomException(ex, sys)
+    return True
+
+
+def create_groq_client():
+    # the groq client reads the key from the environment, the client library is imported on first use
+    llm_environment.get()
+    from groq import Groq
+    return Groq()
+
+
+# the environment is set and the client is created on the first LLM call or on warmup
+llm_environment = LazySingleton("llm_environment", set_environment)
+groq_client = LazySingleton("groq_client", create_groq_client)
 
 def llm_classifier(log_msg):
     """
@@ -32,11 +56,11 @@ def llm_classifier(log_msg):
     Put the category inside <category> </category> tags. 
     Log message: {log_msg}'''
 
-    chat_completion = groq.chat.completions.create(
+    chat_completion = groq_client.get().chat.completions.create(
         messages=[{"role": "user", "content": prompt}],
         # model="llama-3.3-70b-versatile",
-        model="deepseek-r1-distill-llama-70b",
-        temperature=0.5
+        model=llm_model_name,
+        temperature=llm_temperature
     )
 
     content = chat_completion.choices[0].message.content
@@ -48,9 +72,148 @@ def llm_classifier(log_msg):
     return category
 
 
+llm_batch_prompt_template: str = '''Classify each log message into one of these categories:
+    (1) Workflow Error, (2) Deprecation Warning.
+    If you can't figure out a category, use "Unclassified".
+    For each log message put the category inside <category id="N"> </category> tags, where N is the number of the log message.
+    Log messages:
+{numbered_messages}'''
+
+# the cache is opened on the first call
+llm_cache = LazySingleton("llm_cache", LLMResponseCache)
+
+
+def get_llm_cache() -> LLMResponseCache:
+    return llm_cache.get()
+
+
+# the stats are only exposed once the cache is loaded, reading the metrics does not open the database
+register_cache_stats("llm", lambda: get_llm_cache().stats() if llm_cache.loaded else None)
+
+
+def build_batch_prompt(log_messages: list) -> str:
+    """Build one prompt that asks for an indexed category for each of the log messages."""
+    numbered_messages = "\n".join(f"{index}. {log_msg}" for index, log_msg in enumerate(log_messages, start=1))
+    return llm_batch_prompt_template.format(numbered_messages=numbered_messages)
+
+
+def parse_batch_response(content: str, number_of_messages: int) -> list:
+    """
+    Get the category of each log message from the response, None for the messages the response left out
+    or that could not be parsed, a truncated or garbled response is not an answer that can be cached.
+    """
+    # reasoning models think out loud first, the tags in the reasoning are not the answer
+    content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
+    categories = [None] * number_of_messages
+    for index, category in re.findall(r'<category id="?(\d+)"?>(.*?)</category>', content, flags=re.DOTALL):
+        index = int(index) - 1
+        if 0 <= index < number_of_messages:
+            categories[index] = category.strip()
+    return categories
+
+
+async def llm_classify_chunk(client, semaphore: asyncio.Semaphore, log_messages: list) -> list:
+    """The categories of a prompt of log messages, None for all of them when the request failed."""
+    tag: str = "llm_classify_chunk"
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            with span("llm_request", logs=len(log_messages)):
+                chat_completion = await client.chat.completions.create(
+                    messages=[{"role": "user", "content": build_batch_prompt(log_messages)}],
+                    model=llm_model_name,
+                    temperature=llm_temperature
+                )
+        except Exception as e:
+            # a rate limit or a timeout only fails the messages of this prompt, the other prompts are kept
+            llm_requests_total.inc(("error",))
+            llm_request_duration_seconds.observe(time.perf_counter() - start)
+            logger.error("%s::Error classifying %s log messages with the LLM: %s", tag, len(log_messages), e)
+            return [None] * len(log_messages)
+        seconds = time.perf_counter() - start
+        llm_requests_total.inc(("ok",))
+        llm_request_duration_seconds.observe(seconds)
+        if llm_cache.loaded:
+            get_llm_cache().record_llm_latency(seconds, len(log_messages))
+    return parse_batch_response(chat_completion.choices[0].message.content, len(log_messages))
+
+
+async def llm_classify_batch_async(log_messages, client=None,
+                                   max_concurrency: int = llm_max_concurrency,
+                                   messages_per_prompt: int = llm_messages_per_prompt,
+                                   use_cache: bool = llm_cache_enabled) -> list:
+    """
+    Classify the log messages with the LLM, messages_per_prompt messages are sent in each prompt
+    and at most max_concurrency prompts are in flight at a time.
+    The client is any async chat completions client, by default an AsyncGroq client.
+    With use_cache, the categories are looked up in the persistent LLM cache first.
+    The categories are returned in the same order as the log messages, the messages of a prompt whose request
+    failed and the messages the response did not answer are "Unclassified" and are not cached.
+    """
+    log_messages = list(log_messages)
+    if client is None:
+        # the environment of the client is set even when every message is cached, the tier is then ready
+        llm_environment.get()
+    # log message -> cache key, identical messages are looked up and sent once
+    keys = {log_msg: llm_cache_key(log_msg, llm_batch_prompt_template, llm_model_name, llm_temperature)
+            for log_msg in dict.fromkeys(log_messages)}
+    if not keys:
+        return []
+
+    # the SQLite calls can wait on the lock of another worker process, they do not run on the event loop
+    categories = await asyncio.to_thread(lambda: get_llm_cache().get_many(keys.values())) if use_cache else {}
+    # cache key -> the first log message with it
+    missed_messages = {}
+    for log_msg, key in keys.items():
+        if key not in categories:
+            missed_messages.setdefault(key, log_msg)
+
+    if missed_messages:
+        own_client = client is None
+        if own_client:
+            from groq import AsyncGroq
+            client = AsyncGroq()
+        try:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            missed_keys = list(missed_messages.keys())
+            chunks = [missed_keys[start:start + messages_per_prompt]
+                      for start in range(0, len(missed_keys), messages_per_prompt)]
+            chunk_categories = await asyncio.gather(*(
+                llm_classify_chunk(client, semaphore, [missed_messages[key] for key in chunk]) for chunk in chunks))
+        finally:
+            if own_client:
+                await client.close()
+
+        new_categories = {}
+        for chunk, chunk_category in zip(chunks, chunk_categories):
+            new_categories.update(zip(chunk, chunk_category))
+        # the messages of the failed prompts and the messages the response did not answer are not cached,
+        # they are sent again by the next call
+        new_categories = {key: category for key, category in new_categories.items() if category is not None}
+        if use_cache:
+            await asyncio.to_thread(get_llm_cache().put_many, new_categories)
+        categories.update(new_categories)
+    return [categories.get(keys[log_msg], "Unclassified") for log_msg in log_messages]
+
+
+def llm_classify_batch(log_messages, client=None, **kwargs) -> list:
+    """Synchronous version of llm_classify_batch_async, it can also be called while an event loop is running."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(llm_classify_batch_async(log_messages, client, **kwargs))
+    # asyncio.run can not be nested, so run the requests in their own event loop on another thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, llm_classify_batch_async(log_messages, client, **kwargs)).result()
+
+
 if __name__ == "__main__":
     print(llm_classifier(
         "Case escalation for ticket ID 7324 failed because the assigned support agent is no longer active."))
     print(llm_classifier(
         "The 'ReportGenerator' module will be retired in version 4.0. Please migrate to the 'AdvancedAnalyticsSuite' by Dec 2025"))
-    print(llm_classifier("System reboot initiated by user 12345."))
\ No newline at end of file
+    print(llm_classifier("System reboot initiated by user 12345."))
+    print(llm_classify_batch([
+        "Case escalation for ticket ID 7324 failed because the assigned support agent is no longer active.",
+        "The 'ReportGenerator' module will be retired in version 4.0. Please migrate to the 'AdvancedAnalyticsSuite' by Dec 2025",
+        "System reboot initiated by user 12345."]))
@@ -0,0 +1,23 @@
+import re
+
+# variable tokens in the log messages and the masks that replace them
+# the order matters, the more specific patterns are masked first
+log_variable_patterns = [
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<UUID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{16,}\b"), "<HEX>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<NUM>"),
+]
+
+
+def normalize_log_message(log_message: str) -> str:
+    """
+    Mask the variable tokens (UUIDs, IPs, hex ids and numbers) in the log message.
+    Log messages that only differ in these tokens get the same normalized message.
+    For example,
+    "File data_5312.csv uploaded successfully by user User620." is normalized to
+    "File data_<NUM>.csv uploaded successfully by user User<NUM>."
+    """
+    for pattern, mask in log_variable_patterns:
+        log_message = pattern.sub(mask, log_message)
+    return log_message
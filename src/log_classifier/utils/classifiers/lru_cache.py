@@ -0,0 +1,100 @@
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache with a bounded number of entries.
+    When the cache is full the least recently used entry is evicted.
+    If a file path is given the entries can be saved to and loaded from the file,
+    so a restarted process starts with a warm cache.
+    """
+    def __init__(self, max_size: int, file_path: Optional[str] = None):
+        self.class_name = self.__class__.__name__
+        if max_size <= 0:
+            raise ValueError(f"max_size must be positive, got {max_size}")
+        self.max_size = max_size
+        self.file_path = file_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self) -> None:
+        """Save the entries to the file, the file is replaced atomically."""
+        tag: str = f"{self.class_name}::save"
+        if not self.file_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with self.lock:
+                items = list(self.entries.items())
+            temp_file_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(temp_file_path, "wb") as file_obj:
+                pickle.dump(items, file_obj)
+            os.replace(temp_file_path, self.file_path)
+            logger.info("%s::Saved %s cache entries to %s", tag, len(items), self.file_path)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def load(self) -> None:
+        """Load the entries from the file, if the file exists."""
+        tag: str = f"{self.class_name}::load"
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "rb") as file_obj:
+                items = pickle.load(file_obj)
+            # keep the most recently used entries if the file has more entries than the cache holds
+            for key, value in items[-self.max_size:]:
+                self.put(key, value)
+            logger.info("%s::Loaded %s cache entries from %s", tag, len(self.entries), self.file_path)
+        except Exception as e:
+            # a corrupt cache file only means a cold start
+            logger.warning("%s::Could not load the cache from %s: %s", tag, self.file_path, e)
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from src.log_classifier.utils.metrics import (micro_batch_size, micro_batch_queue_wait_seconds,
+                                              register_micro_batcher)
+from src.log_classifier.utils.tracing import Trace, current_trace, record_spans
+
+
+class BatchItem:
+    def __init__(self, value: Any):
+        self.value = value
+        self.future = Future()
+        # the spans of the batch that processed the item, only timed when the item was submitted in a trace
+        self.future.spans = []
+        self.traced = current_trace.get() is not None
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Groups the items submitted by many threads into batches.
+    A worker thread takes the first item from the queue and waits up to max_wait_seconds after it was
+    submitted for more items, or until max_batch_size items are collected, then processes the batch
+    with one call to process_batch and sets the result of each item on its future.
+    The queue holds at most max_queue_size items, submit blocks when it is full.
+    The batch sizes, the queueing delay of the items and the queue depth are exposed on /metrics by the name.
+    The worker thread does not run in the trace of the requests, when an item was submitted in a trace the spans
+    of process_batch are timed in a trace of the batch and added to the trace of each request by process.
+    """
+    def __init__(self, process_batch: Callable[[list], list], max_batch_size: int,
+                 max_wait_seconds: float, max_queue_size: int, name: str = "micro_batcher"):
+        self.class_name = self.__class__.__name__
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.name = name
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        # batch size -> number of batches of that size
+        self.batch_sizes = Counter()
+        self.items = 0
+        self.queue_delay_seconds_total = 0.0
+        self.queue_delay_seconds_max = 0.0
+        register_micro_batcher(name, self.queue.qsize)
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run_worker, name=self.name, daemon=True)
+                self.thread.start()
+
+    def submit(self, value: Any) -> Future:
+        if self.thread is None:
+            self.start()
+        item = BatchItem(value)
+        self.queue.put(item)
+        return item.future
+
+    def process(self, values: list) -> list:
+        """Submit the values and wait for their results, the results are in the same order as the values."""
+        futures = [self.submit(value) for value in values]
+        results = [future.result() for future in futures]
+        # the values can be split over several batches, the spans of each batch are added once
+        batch_spans = {id(future.spans): future.spans for future in futures}
+        for spans in batch_spans.values():
+            record_spans(spans)
+        return results
+
+    def collect_batch(self) -> List[BatchItem]:
+        batch = [self.queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # past the deadline only the items already in the queue are taken
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run_worker(self) -> None:
+        while True:
+            batch = self.collect_batch()
+            started_at = time.perf_counter()
+            queue_delays = [started_at - item.enqueued_at for item in batch]
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+                self.items += len(batch)
+                self.queue_delay_seconds_total += sum(queue_delays)
+                self.queue_delay_seconds_max = max(self.queue_delay_seconds_max, *queue_delays)
+            micro_batch_size.observe(len(batch), (self.name,))
+            micro_batch_queue_wait_seconds.observe_many(queue_delays, (self.name,))
+            batch_trace = Trace(self.name) if any(item.traced for item in batch) else None
+            token = current_trace.set(batch_trace)
+            try:
+                results = self.process_batch([item.value for item in batch])
+                self.set_spans(batch, batch_trace)
+                for item, result in zip(batch, results):
+                    item.future.set_result(result)
+            except Exception as e:
+                self.set_spans(batch, batch_trace)
+                for item in batch:
+                    item.future.set_exception(e)
+            finally:
+                current_trace.reset(token)
+
+    def set_spans(self, batch: List[BatchItem], batch_trace: Trace) -> None:
+        if batch_trace is None:
+            return
+        with batch_trace.lock:
+            spans = [(record["name"], batch_trace.start + record["start"], record["duration"],
+                      {**{key: value for key, value in record.items()
+                          if key not in ("name", "parent_id", "start", "duration", "span_id")},
+                       "batch_size": len(batch)})
+                     for record in batch_trace.spans if record["duration"] is not None]
+        for item in batch:
+            item.future.spans = spans
+
+    def stats(self) -> dict:
+        with self.lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "batches": batches,
+                "items": self.items,
+                "mean_batch_size": self.items / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_delay_seconds": self.queue_delay_seconds_total / self.items if self.items else 0.0,
+                "max_queue_delay_seconds": self.queue_delay_seconds_max,
+                "queue_depth": self.queue.qsize(),
+            }
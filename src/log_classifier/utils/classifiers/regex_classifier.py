@@ -1,22 +1,32 @@
-import re
+from collections import Counter
+
+from src.log_classifier.utils.classifiers.regex_rule_engine import RegexRuleEngine
+from src.log_classifier.utils.lazy_loader import LazySingleton
+from src.log_classifier.utils.metrics import regex_rule_hits_total
+
+# the rules are loaded and compiled once, on the first call
+regex_rule_engine = LazySingleton("regex_rule_engine", RegexRuleEngine)
+
+
+def get_regex_rule_engine() -> RegexRuleEngine:
+    return regex_rule_engine.get()
+
+
 def regex_classifier(log_message):
-    regex_patterns = {
-        r"User User\d+ logged (in|out).": "User Action",
-        r"Backup (started|ended) at .*": "System Notification",
-        r"Backup completed successfully.": "System Notification",
-        r"System updated to version .*": "System Notification",
-        r"File .* uploaded successfully by user .*": "System Notification",
-        r"Disk cleanup completed successfully.": "System Notification",
-        r"System reboot initiated by user .*": "System Notification",
-        r"Account with ID .* created by .*": "User Action"
-    }
-    for pattern, label in regex_patterns.items():
-        if re.search(pattern, log_message):
-            return label
-    return None
+    return get_regex_rule_engine().classify(log_message)
+
+
+def regex_classify_batch(log_messages) -> list:
+    engine = get_regex_rule_engine()
+    rule_indexes = [engine.match(log_message) for log_message in log_messages]
+    # the hits of each rule are counted once per batch
+    for index, hits in Counter(rule_indexes).items():
+        if index is not None:
+            regex_rule_hits_total.inc((engine.rules[index].name,), hits)
+    return [None if index is None else engine.rules[index].label for index in rule_indexes]
+
 
 if __name__ == "__main__":
     print(regex_classifier("Backup completed successfully."))
     print(regex_classifier("Account with ID 1234 created by User1."))
     print(regex_classifier("Hello World!"))
-
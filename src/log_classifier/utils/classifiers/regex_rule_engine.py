@@ -0,0 +1,157 @@
+import re
+import sys
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from src.log_classifier.constants import regex_rules_file_path, regex_rules_supported_versions
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.utils import read_yaml
+
+# characters that end the literal prefix of a pattern
+regex_meta_characters = set(".^$*+?{}[]\\|()")
+# quantifiers that make the character before them optional
+regex_optional_quantifiers = set("*?{")
+
+
+@dataclass
+class RegexRule:
+    name: str
+    pattern: str
+    label: str
+    literal: Optional[str] = None
+
+
+def has_top_level_alternation(pattern: str) -> bool:
+    """Check if the pattern has a | outside any group, such patterns do not have a single required literal."""
+    depth = 0
+    escaped = False
+    in_class = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+def leading_literal(pattern: str) -> Optional[str]:
+    """
+    Get the literal text every match of the pattern must contain.
+    This is the text at the start of the pattern up to the first regex meta character.
+    Returns None if the pattern does not start with a literal.
+    """
+    if pattern.startswith("(?") or has_top_level_alternation(pattern):
+        return None
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    literal = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            # an escaped punctuation character is a literal, \d \w \s etc. are not
+            if index + 1 < len(pattern) and not pattern[index + 1].isalnum():
+                literal.append(pattern[index + 1])
+                index += 2
+                continue
+            break
+        if char in regex_meta_characters:
+            if char in regex_optional_quantifiers and literal:
+                literal.pop()
+            break
+        literal.append(char)
+        index += 1
+    return "".join(literal) or None
+
+
+class RegexRuleEngine:
+    """
+    Regex classifier that compiles the rules from the rules file once.
+    All the rules are combined into one pattern with a named group per rule,
+    and a literal prefilter skips the rules whose literal text is not in the message.
+    The rules are tried in file order and the first rule that matches wins.
+    """
+    def __init__(self, rules_file_path: str = regex_rules_file_path):
+        self.class_name = self.__class__.__name__
+        tag: str = f"{self.class_name}::__init__"
+        try:
+            self.rules_file_path = rules_file_path
+            rules_config = read_yaml(rules_file_path)
+            self.version = rules_config.get("version")
+            if self.version not in regex_rules_supported_versions:
+                raise ValueError(f"Unsupported regex rules version {self.version} in {rules_file_path}")
+            self.rules: List[RegexRule] = [RegexRule(**rule) for rule in rules_config["rules"]]
+            if not self.rules:
+                raise ValueError(f"No regex rules found in {rules_file_path}")
+            self.compile()
+            logger.info("%s::Compiled %s regex rules version %s from %s",
+                        tag, len(self.rules), self.version, rules_file_path)
+        except Exception as e:
+            logger.error("%s::Error loading the regex rules: %s", tag, e)
+            raise CustomException(e, sys)
+
+    def compile(self) -> None:
+        self.group_names = [f"rule_{index}" for index in range(len(self.rules))]
+        self.group_indexes = {group_name: index for index, group_name in enumerate(self.group_names)}
+        self.patterns = [re.compile(rule.pattern) for rule in self.rules]
+        self.combined_pattern = re.compile("|".join(
+            f"(?P<{group_name}>{rule.pattern})" for group_name, rule in zip(self.group_names, self.rules)))
+        # rules without a literal are always candidates
+        self.always_candidates = []
+        # literal -> indexes of the rules that need it
+        self.literal_rules = {}
+        for index, rule in enumerate(self.rules):
+            literal = rule.literal if rule.literal is not None else leading_literal(rule.pattern)
+            if literal:
+                self.literal_rules.setdefault(literal, []).append(index)
+            else:
+                self.always_candidates.append(index)
+
+    def candidate_rules(self, log_message: str) -> List[int]:
+        """Get the indexes of the rules whose literal is in the message, in rule order."""
+        candidates = list(self.always_candidates)
+        for literal, indexes in self.literal_rules.items():
+            if literal in log_message:
+                candidates.extend(indexes)
+        candidates.sort()
+        return candidates
+
+    def match(self, log_message: str) -> Optional[int]:
+        """Get the index of the first rule that matches the message, or None."""
+        candidates = self.candidate_rules(log_message)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            index = candidates[0]
+            return index if self.patterns[index].search(log_message) else None
+        # the combined pattern tells if any rule matches, and which one matches first in the message
+        combined_match = self.combined_pattern.search(log_message)
+        if not combined_match:
+            return None
+        # the rule group encloses any group inside the rule pattern, so it is the last group to close
+        matched_index = self.group_indexes[combined_match.lastgroup]
+        # a rule that comes earlier in the file can still match later in the message
+        for index in candidates:
+            if index >= matched_index:
+                break
+            if self.patterns[index].search(log_message):
+                return index
+        return matched_index
+
+    def classify(self, log_message: str) -> Optional[str]:
+        index = self.match(log_message)
+        return None if index is None else self.rules[index].label
+
+    def classify_batch(self, log_messages: Iterable[str]) -> List[Optional[str]]:
+        return [self.classify(log_message) for log_message in log_messages]
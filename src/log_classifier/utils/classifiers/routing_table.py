@@ -0,0 +1,62 @@
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.log_classifier.constants import routing_table_file_path, routing_table_supported_versions, routing_tiers
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.utils import read_yaml
+
+
+class RoutingTable:
+    """
+    Maps each log source to the ordered tiers that classify its logs, loaded from the routing file.
+    The sources that are not in the file use the default tiers.
+    """
+    def __init__(self, file_path: str = routing_table_file_path):
+        self.class_name = self.__class__.__name__
+        tag: str = f"{self.class_name}::__init__"
+        try:
+            self.file_path = file_path
+            routing_config = read_yaml(file_path)
+            self.version = routing_config.get("version")
+            if self.version not in routing_table_supported_versions:
+                raise ValueError(f"Unsupported routing table version {self.version} in {file_path}")
+            self.default_tiers = self.validate_tiers("default", routing_config.get("default"))
+            self.source_tiers: Dict[str, Tuple[str, ...]] = {
+                source: self.validate_tiers(source, tiers)
+                for source, tiers in (routing_config.get("sources") or {}).items()}
+            logger.info("%s::Loaded the routes of %s sources version %s from %s",
+                        tag, len(self.source_tiers), self.version, file_path)
+        except Exception as e:
+            logger.error("%s::Error loading the routing table: %s", tag, e)
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def validate_tiers(source: str, tiers) -> Tuple[str, ...]:
+        if not tiers:
+            raise ValueError(f"No tiers for {source}")
+        unknown_tiers = [tier for tier in tiers if tier not in routing_tiers]
+        if unknown_tiers:
+            raise ValueError(f"Unknown tiers {unknown_tiers} for {source}, the tiers are {routing_tiers}")
+        return tuple(tiers)
+
+    def tiers_for(self, source: str) -> Tuple[str, ...]:
+        return self.source_tiers.get(source, self.default_tiers)
+
+    def used_tiers(self) -> set:
+        """The tiers of the default route and of the routes of the sources."""
+        return {tier for tiers in (self.default_tiers, *self.source_tiers.values()) for tier in tiers}
+
+    def group_by_route(self, sources) -> Dict[Tuple[str, ...], np.ndarray]:
+        """
+        Group the logs by the tiers of their source.
+        Returns the indexes of the logs of each route, the sources with the same tiers are grouped together
+        so each tier gets one batch.
+        """
+        unique_sources, source_codes = np.unique(np.asarray(sources, dtype=str), return_inverse=True)
+        routes: Dict[Tuple[str, ...], List[int]] = {}
+        for code, source in enumerate(unique_sources.tolist()):
+            routes.setdefault(self.tiers_for(source), []).append(code)
+        return {tiers: np.nonzero(np.isin(source_codes, codes))[0] for tiers, codes in routes.items()}
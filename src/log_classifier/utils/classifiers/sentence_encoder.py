@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from src.log_classifier.constants import (sentence_transformer_model_name,
+                                          bert_classifier_batch_size,
+                                          sentence_encoder_backend,
+                                          sentence_encoder_onnx_dir,
+                                          sentence_encoder_onnx_file_name,
+                                          sentence_encoder_onnx_int8_file_name,
+                                          sentence_encoder_config_file_name,
+                                          sentence_encoder_onnx_opset_version)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+sentence_encoder_backends: tuple = ("torch", "onnx", "onnx_int8")
+
+
+class TorchSentenceEncoder:
+    """Encode the sentences with the SentenceTransformer, from a model name or a locally saved model directory."""
+    def __init__(self, model_name_or_path: str = sentence_transformer_model_name):
+        # torch is imported with the model, not when this module is imported
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name_or_path)
+
+    def encode(self, sentences, batch_size: int = bert_classifier_batch_size) -> np.ndarray:
+        return self.model.encode(list(sentences), batch_size=batch_size)
+
+
+class OnnxSentenceEncoder:
+    """
+    Encode the sentences with the transformer graph exported by export_onnx, on the CPU with ONNX Runtime.
+    The pooling and the normalization of the SentenceTransformer are done in numpy,
+    as set in the sentence_encoder.json written by the export.
+    """
+    def __init__(self, onnx_dir: str = sentence_encoder_onnx_dir, quantized: bool = False):
+        self.class_name = self.__class__.__name__
+        tag: str = f"{self.class_name}::__init__"
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+
+            onnx_file_path = os.path.join(onnx_dir, sentence_encoder_onnx_int8_file_name if quantized
+                                          else sentence_encoder_onnx_file_name)
+            if not os.path.exists(onnx_file_path):
+                raise FileNotFoundError(f"The file: {onnx_file_path} is not exists, export the model first")
+            with open(os.path.join(onnx_dir, sentence_encoder_config_file_name)) as file:
+                self.config = json.load(file)
+            self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+            self.session = onnxruntime.InferenceSession(onnx_file_path, providers=["CPUExecutionProvider"])
+            self.input_names = [session_input.name for session_input in self.session.get_inputs()]
+            logger.info("%s::Loaded the ONNX sentence encoder from %s", tag, onnx_file_path)
+        except Exception as e:
+            logger.error("%s::Error loading the ONNX sentence encoder: %s", tag, e)
+            raise CustomException(e, sys)
+
+    def pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        pooling = self.config["pooling"]
+        if pooling == "cls":
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(token_embeddings.dtype)
+        if pooling == "max":
+            return np.where(mask > 0, token_embeddings, -np.inf).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size: int = bert_classifier_batch_size) -> np.ndarray:
+        sentences = list(sentences)
+        embeddings = np.zeros((len(sentences), self.config["dimension"]), dtype=np.float32)
+        # the sentences of similar length are batched together, so there is less padding to encode
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        for start in range(0, len(sentences), batch_size):
+            indices = order[start:start + batch_size]
+            tokens = self.tokenizer([sentences[index] for index in indices], padding=True, truncation=True,
+                                    max_length=self.config["max_seq_length"], return_tensors="np")
+            inputs = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            embeddings[indices] = self.pool(token_embeddings, tokens["attention_mask"])
+        if self.config["normalize"]:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+def create_sentence_encoder(backend: str = sentence_encoder_backend,
+                            model_name_or_path: str = sentence_transformer_model_name,
+                            onnx_dir: str = sentence_encoder_onnx_dir):
+    """Create the sentence encoder of the backend, "torch", "onnx" or "onnx_int8"."""
+    if backend == "torch":
+        return TorchSentenceEncoder(model_name_or_path)
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxSentenceEncoder(onnx_dir, quantized=backend == "onnx_int8")
+    raise ValueError(f"Unknown sentence encoder backend: {backend}, use one of {sentence_encoder_backends}")
+
+
+def pooling_mode(pooling_module) -> str:
+    # the newer sentence-transformers versions keep the mode as a string, the older ones as flags
+    mode = getattr(pooling_module, "pooling_mode", None)
+    return mode if isinstance(mode, str) else pooling_module.get_pooling_mode_str()
+
+
+def export_onnx(model_dir: str, output_dir: str = sentence_encoder_onnx_dir, quantize: bool = True) -> str:
+    """
+    Export the transformer of a locally saved SentenceTransformer to ONNX, with its tokenizer and pooling settings.
+    With quantize, the int8 dynamically quantized graph is written next to it.
+    Returns the output directory.
+    """
+    tag: str = "export_onnx"
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer, models
+
+        if not os.path.exists(model_dir):
+            raise FileNotFoundError(f"The file: {model_dir} is not exists")
+        model = SentenceTransformer(model_dir, device="cpu")
+        transformer = model[0]
+        pooling_modules = [module for module in model if isinstance(module, models.Pooling)]
+        pooling = pooling_mode(pooling_modules[0]) if pooling_modules else "mean"
+        if pooling not in ("mean", "cls", "max"):
+            raise ValueError(f"The {pooling} pooling of {model_dir} can not be exported")
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self, auto_model, input_names):
+                super().__init__()
+                self.auto_model = auto_model
+                self.input_names = input_names
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+        example = model.tokenizer(["Export the sentence encoder"], return_tensors="pt")
+        input_names = list(example.keys())
+        os.makedirs(output_dir, exist_ok=True)
+        onnx_file_path = os.path.join(output_dir, sentence_encoder_onnx_file_name)
+        with torch.no_grad():
+            torch.onnx.export(LastHiddenState(transformer.auto_model.eval(), input_names),
+                              tuple(example[name] for name in input_names),
+                              onnx_file_path,
+                              input_names=input_names,
+                              output_names=["last_hidden_state"],
+                              dynamic_axes={name: {0: "batch", 1: "sequence"}
+                                            for name in input_names + ["last_hidden_state"]},
+                              opset_version=sentence_encoder_onnx_opset_version,
+                              dynamo=False)
+        logger.info("%s::Exported %s to %s", tag, model_dir, onnx_file_path)
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            int8_file_path = os.path.join(output_dir, sentence_encoder_onnx_int8_file_name)
+            quantize_dynamic(onnx_file_path, int8_file_path, weight_type=QuantType.QInt8)
+            logger.info("%s::Quantized %s to %s", tag, onnx_file_path, int8_file_path)
+
+        model.tokenizer.save_pretrained(output_dir)
+        with open(os.path.join(output_dir, sentence_encoder_config_file_name), "w") as file:
+            json.dump({
+                "model_dir": model_dir,
+                "pooling": pooling,
+                "normalize": any(isinstance(module, models.Normalize) for module in model),
+                "max_seq_length": model.max_seq_length,
+                "dimension": model.get_sentence_embedding_dimension(),
+            }, file, indent=2)
+        return output_dir
+    except Exception as e:
+        logger.error("%s::Error exporting the sentence encoder: %s", tag, e)
+        raise CustomException(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a saved SentenceTransformer to ONNX")
+    parser.add_argument("--model-dir", required=True,
+                        help="directory of the saved SentenceTransformer, e.g. the data transformation artifact")
+    parser.add_argument("--output-dir", default=sentence_encoder_onnx_dir)
+    parser.add_argument("--no-quantize", action="store_true", help="do not write the int8 quantized graph")
+    args = parser.parse_args()
+    print(export_onnx(args.model_dir, args.output_dir, quantize=not args.no_quantize))
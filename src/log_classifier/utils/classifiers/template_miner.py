@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.log_classifier.constants import (template_miner_depth,
+                                          template_miner_similarity_threshold,
+                                          template_miner_max_children,
+                                          template_miner_max_clusters)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+from src.log_classifier.utils.classifiers.log_normalizer import normalize_log_message
+
+wildcard: str = "<*>"
+
+
+class LogCluster:
+    """A group of log messages that share a template."""
+    def __init__(self, cluster_id: int, template_tokens: List[str], path: tuple, hits: int = 0, labels: dict = None):
+        self.cluster_id = cluster_id
+        self.template_tokens = template_tokens
+        # the keys of the parse tree nodes that lead to the leaf holding this cluster
+        self.path = path
+        self.hits = hits
+        # source -> label, a template is classified once for each source
+        self.labels = labels or {}
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.template_tokens)
+
+    def to_dict(self) -> dict:
+        return {"cluster_id": self.cluster_id, "template_tokens": self.template_tokens, "path": list(self.path),
+                "hits": self.hits, "labels": self.labels}
+
+    @staticmethod
+    def from_dict(data: dict) -> "LogCluster":
+        return LogCluster(data["cluster_id"], data["template_tokens"], tuple(data["path"]), data["hits"], data["labels"])
+
+
+class TemplateMiner:
+    """
+    Online log template miner based on the Drain algorithm.
+    The log messages are normalized and split into tokens, then routed through a fixed depth parse tree:
+    the first level is the number of tokens and the next levels are the leading tokens of the message.
+    The leaf holds the clusters, the message joins the most similar cluster or starts a new one,
+    and the tokens that differ between the cluster template and the message become wildcards.
+    The number of clusters is bounded, the least recently matched cluster is evicted first.
+    """
+    def __init__(self, depth: int = template_miner_depth,
+                 similarity_threshold: float = template_miner_similarity_threshold,
+                 max_children: int = template_miner_max_children,
+                 max_clusters: int = template_miner_max_clusters):
+        self.class_name = self.__class__.__name__
+        if depth < 3:
+            raise ValueError(f"depth must be at least 3, got {depth}")
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        # nested dicts, the leaves are lists of cluster ids
+        self.root = {}
+        # cluster id -> LogCluster, ordered from the least to the most recently matched
+        self.clusters = OrderedDict()
+        self.next_cluster_id = 1
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def tokenize(log_message: str) -> List[str]:
+        return normalize_log_message(log_message).split()
+
+    @staticmethod
+    def has_variable(token: str) -> bool:
+        return any(char.isdigit() for char in token) or (token.startswith("<") and token.endswith(">"))
+
+    def tree_path(self, tokens: List[str]) -> tuple:
+        """Get the keys of the parse tree nodes for the tokens, without creating the nodes."""
+        path = [len(tokens)]
+        for token in tokens[:self.depth - 2]:
+            path.append(wildcard if self.has_variable(token) else token)
+        return tuple(path)
+
+    def find_leaf(self, path: tuple) -> Optional[list]:
+        """Get the leaf for the path, following the wildcard child for unknown tokens."""
+        node = self.root
+        for key in path:
+            if key in node:
+                node = node[key]
+            elif wildcard in node:
+                node = node[wildcard]
+            else:
+                return None
+        return node
+
+    def add_leaf(self, path: tuple) -> Tuple[list, tuple]:
+        """Get or create the leaf for the path, a full node sends new tokens to its wildcard child."""
+        node = self.root
+        resolved_path = []
+        for level, key in enumerate(path):
+            if key not in node and level > 0 and len(node) >= self.max_children:
+                key = wildcard
+            if key not in node:
+                node[key] = [] if level == len(path) - 1 else {}
+            node = node[key]
+            resolved_path.append(key)
+        return node, tuple(resolved_path)
+
+    def similarity(self, template_tokens: List[str], tokens: List[str]) -> float:
+        same_tokens = sum(1 for template_token, token in zip(template_tokens, tokens)
+                          if template_token == token or template_token == wildcard)
+        return same_tokens / len(tokens) if tokens else 1.0
+
+    def best_cluster(self, leaf: list, tokens: List[str]) -> Optional[LogCluster]:
+        best_cluster = None
+        best_similarity = -1.0
+        for cluster_id in leaf:
+            cluster = self.clusters[cluster_id]
+            cluster_similarity = self.similarity(cluster.template_tokens, tokens)
+            if cluster_similarity > best_similarity:
+                best_cluster, best_similarity = cluster, cluster_similarity
+        if best_cluster is not None and best_similarity >= self.similarity_threshold:
+            return best_cluster
+        return None
+
+    def evict(self) -> None:
+        while len(self.clusters) > self.max_clusters:
+            cluster_id, cluster = self.clusters.popitem(last=False)
+            leaf = self.find_leaf(cluster.path)
+            if leaf is not None and cluster_id in leaf:
+                leaf.remove(cluster_id)
+            self.evictions += 1
+
+    def add_log_message(self, log_message: str) -> LogCluster:
+        """Get the cluster of the log message, creating or updating the template as needed."""
+        tokens = self.tokenize(log_message)
+        with self.lock:
+            path = self.tree_path(tokens)
+            leaf = self.find_leaf(path)
+            cluster = self.best_cluster(leaf, tokens) if leaf is not None else None
+            if cluster is None:
+                leaf, path = self.add_leaf(path)
+                cluster = LogCluster(self.next_cluster_id, tokens, path)
+                self.next_cluster_id += 1
+                self.clusters[cluster.cluster_id] = cluster
+                leaf.append(cluster.cluster_id)
+                self.evict()
+            else:
+                cluster.template_tokens = [template_token if template_token == token else wildcard
+                                           for template_token, token in zip(cluster.template_tokens, tokens)]
+                self.clusters.move_to_end(cluster.cluster_id)
+            cluster.hits += 1
+            return cluster
+
+    def template_stats(self, top_n: Optional[int] = None) -> List[dict]:
+        """Get the templates with their hit counts, the most frequent templates first."""
+        with self.lock:
+            clusters = sorted(self.clusters.values(), key=lambda cluster: cluster.hits, reverse=True)
+        return [{"cluster_id": cluster.cluster_id, "template": cluster.template,
+                 "hits": cluster.hits, "labels": dict(cluster.labels)} for cluster in clusters[:top_n]]
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {"depth": self.depth,
+                    "similarity_threshold": self.similarity_threshold,
+                    "max_children": self.max_children,
+                    "max_clusters": self.max_clusters,
+                    "next_cluster_id": self.next_cluster_id,
+                    "clusters": [cluster.to_dict() for cluster in self.clusters.values()]}
+
+    @staticmethod
+    def from_dict(data: dict) -> "TemplateMiner":
+        miner = TemplateMiner(data["depth"], data["similarity_threshold"], data["max_children"], data["max_clusters"])
+        miner.next_cluster_id = data["next_cluster_id"]
+        for cluster_data in data["clusters"]:
+            cluster = LogCluster.from_dict(cluster_data)
+            miner.clusters[cluster.cluster_id] = cluster
+            leaf, _ = miner.add_leaf(cluster.path)
+            leaf.append(cluster.cluster_id)
+        return miner
+
+    def save(self, file_path: str) -> None:
+        tag: str = f"{self.class_name}::save"
+        try:
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            temp_file_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(temp_file_path, "w") as file_obj:
+                json.dump(self.to_dict(), file_obj)
+            os.replace(temp_file_path, file_path)
+            logger.info("%s::Saved %s templates to %s", tag, len(self.clusters), file_path)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @staticmethod
+    def load(file_path: str) -> "TemplateMiner":
+        try:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"The file: {file_path} is not exists")
+            with open(file_path, "r") as file_obj:
+                return TemplateMiner.from_dict(json.load(file_obj))
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -0,0 +1,57 @@
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+# name -> LazySingleton, used to warm up the models and to report which ones are loaded
+lazy_singletons: Dict[str, "LazySingleton"] = {}
+
+
+class LazySingleton:
+    """
+    Thread safe lazily created object.
+    The factory is called on the first get(), the threads that call get() at the same time wait for it,
+    so a model is loaded once per process and only when it is used.
+    """
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.class_name = self.__class__.__name__
+        self.name = name
+        self.factory = factory
+        self.instance = None
+        self.loaded = False
+        self.load_seconds = None
+        self.lock = threading.Lock()
+        lazy_singletons[name] = self
+
+    def get(self) -> Any:
+        if self.loaded:
+            return self.instance
+        tag: str = f"{self.class_name}::get"
+        with self.lock:
+            if not self.loaded:
+                try:
+                    start = time.perf_counter()
+                    self.instance = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self.loaded = True
+                    logger.info("%s::Loaded %s in %.2f seconds", tag, self.name, self.load_seconds)
+                except Exception as e:
+                    logger.error("%s::Error loading %s: %s", tag, self.name, e)
+                    raise CustomException(e, sys)
+        return self.instance
+
+    def reset(self) -> None:
+        with self.lock:
+            self.instance = None
+            self.loaded = False
+            self.load_seconds = None
+
+    def status(self) -> dict:
+        return {"loaded": self.loaded, "load_seconds": self.load_seconds}
+
+
+def load_status() -> Dict[str, dict]:
+    return {name: singleton.status() for name, singleton in lazy_singletons.items()}
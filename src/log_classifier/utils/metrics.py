@@ -0,0 +1,338 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.log_classifier.constants import metrics_enabled, metrics_latency_buckets, metrics_batch_size_buckets
+from src.log_classifier.logging.logger import logger
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(label_names: Iterable[str], label_values: Iterable) -> str:
+    labels = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values))
+    return "{" + labels + "}" if labels else ""
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, rendered in the Prometheus text exposition format by GET /metrics.
+    When the registry is disabled the metrics do not record anything.
+    """
+    def __init__(self, enabled: bool = metrics_enabled):
+        self.class_name = self.__class__.__name__
+        self.enabled = enabled
+        # name -> metric, in the order they are registered
+        self.metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"The metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        tag: str = f"{self.class_name}::render"
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # a metric that cannot be read is left out, the other metrics are still exposed
+                logger.error("%s::Error reading the metric %s: %s", tag, metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in samples:
+                lines.append(f"{name}{format_labels(label_names, label_values)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def collect(self) -> dict:
+        """
+        The values of the counters and the histograms recorded since the last collect, they are reset.
+        A worker process of the classification executor sends them to the process that serves /metrics.
+        """
+        collected = {}
+        for name, metric in list(self.metrics.items()):
+            values = metric.take()
+            if values:
+                collected[name] = values
+        return collected
+
+    def merge(self, collected: dict) -> None:
+        """Add the values collected in another process to the metrics of this process."""
+        if not self.enabled:
+            return
+        for name, values in collected.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+metrics_registry = MetricsRegistry()
+
+# (sample name, label names, label values, value)
+Sample = Tuple[str, tuple, tuple, float]
+
+
+class Metric:
+    """
+    A metric with one value per combination of label values.
+    The values are updated under a lock that is held for a dictionary update only,
+    and the callers record once per batch, not once per log, so the cost on the classification path stays small.
+    """
+    kind: str = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (),
+                 registry: MetricsRegistry = metrics_registry):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.registry = registry
+        self.lock = threading.Lock()
+        # label values -> value
+        self.values = {}
+        registry.register(self)
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name, self.label_names, label_values, value) for label_values, value in sorted(values.items())]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+    def take(self) -> dict:
+        """The values recorded since the last take, only for the metrics that can be added across processes."""
+        return {}
+
+    def merge(self, values: dict) -> None:
+        pass
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def take(self) -> dict:
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values: dict) -> None:
+        with self.lock:
+            for label_values, amount in values.items():
+                self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, label_values: tuple = (), amount: float = 1) -> None:
+        self.inc(label_values, -amount)
+
+    def set(self, value: float, label_values: tuple = ()) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    """
+    Counts the observed values in buckets, the buckets are the upper bounds and a +Inf bucket is added.
+    The bucket counts are kept per bucket and made cumulative when they are rendered.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = metrics_latency_buckets,
+                 registry: MetricsRegistry = metrics_registry):
+        super().__init__(name, help_text, label_names, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, label_values: tuple = ()) -> None:
+        if not self.registry.enabled:
+            return
+        # the first bucket whose upper bound is >= the value, len(buckets) is the +Inf bucket
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def observe_many(self, values: Iterable[float], label_values: tuple = ()) -> None:
+        """Observe several values under one lock, e.g. the queueing delay of each item of a batch."""
+        if not self.registry.enabled:
+            return
+        indexes = [(bisect.bisect_left(self.buckets, value), value) for value in values]
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            for index, value in indexes:
+                state[0][index] += 1
+                state[1] += value
+
+    def take(self) -> dict:
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values: dict) -> None:
+        with self.lock:
+            for label_values, (counts, total) in values.items():
+                state = self.values.get(label_values)
+                if state is None:
+                    state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+                state[0] = [count + added for count, added in zip(state[0], counts)]
+                state[1] += total
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            values = {label_values: (list(counts), total) for label_values, (counts, total) in self.values.items()}
+        bucket_label_names = self.label_names + ("le",)
+        samples = []
+        for label_values, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", bucket_label_names,
+                                label_values + (format_value(upper_bound),), cumulative))
+            samples.append((f"{self.name}_sum", self.label_names, label_values, total))
+            samples.append((f"{self.name}_count", self.label_names, label_values, cumulative))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """
+    A metric whose values are read when the metrics are rendered, from a callback that returns
+    {label values: value}. Nothing is recorded on the classification path.
+    """
+    def __init__(self, name: str, help_text: str, kind: str, callback: Callable[[], Dict[tuple, float]],
+                 label_names: tuple = (), registry: MetricsRegistry = metrics_registry):
+        super().__init__(name, help_text, label_names, registry)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, self.label_names, label_values, value)
+                for label_values, value in sorted(self.callback().items())]
+
+
+# HTTP
+http_requests_total = Counter("log_classifier_http_requests_total", "HTTP requests by route, method and status.",
+                              ("route", "method", "status"))
+http_request_duration_seconds = Histogram("log_classifier_http_request_duration_seconds",
+                                          "HTTP request latency by route, until the response is sent.", ("route",))
+http_requests_in_flight = Gauge("log_classifier_http_requests_in_flight", "HTTP requests being served by route.",
+                                ("route",))
+
+# classification tiers
+tier_calls_total = Counter("log_classifier_tier_calls_total", "Batch calls of each classification tier.", ("tier",))
+tier_logs_total = Counter("log_classifier_tier_logs_total", "Logs sent to each classification tier.", ("tier",))
+tier_labelled_logs_total = Counter("log_classifier_tier_labelled_logs_total",
+                                   "Logs labelled by each classification tier.", ("tier",))
+tier_batch_size = Histogram("log_classifier_tier_batch_size", "Number of logs in each call of a tier.", ("tier",),
+                            buckets=metrics_batch_size_buckets)
+tier_duration_seconds = Histogram("log_classifier_tier_duration_seconds", "Latency of each call of a tier.",
+                                  ("tier",))
+regex_rule_hits_total = Counter("log_classifier_regex_rule_hits_total", "Logs matched by each regex rule.", ("rule",))
+bert_predictions_total = Counter("log_classifier_bert_predictions_total",
+                                 "Logistic regression predictions, below_threshold ones are labelled Unclassified.",
+                                 ("outcome",))
+llm_requests_total = Counter("log_classifier_llm_requests_total", "LLM chat completion requests by status.",
+                             ("status",))
+llm_request_duration_seconds = Histogram("log_classifier_llm_request_duration_seconds",
+                                         "Latency of the LLM chat completion requests.")
+
+
+def observe_tier_call(tier: str, log_count: int, labelled_count: int, seconds: float) -> None:
+    tier_label = (tier,)
+    tier_calls_total.inc(tier_label)
+    tier_logs_total.inc(tier_label, log_count)
+    tier_labelled_logs_total.inc(tier_label, labelled_count)
+    tier_batch_size.observe(log_count, tier_label)
+    tier_duration_seconds.observe(seconds, tier_label)
+
+
+# micro batchers, the batches of the BERT encoder coalesced across the requests
+micro_batch_size = Histogram("log_classifier_micro_batch_size", "Number of items in each batch of a micro batcher.",
+                             ("batcher",), buckets=metrics_batch_size_buckets)
+micro_batch_queue_wait_seconds = Histogram("log_classifier_micro_batch_queue_wait_seconds",
+                                           "Time each item waited in the queue of a micro batcher before its batch "
+                                           "was processed.", ("batcher",))
+# micro batcher name -> function that returns the number of items in its queue
+micro_batcher_queue_depths: Dict[str, Callable[[], int]] = {}
+
+
+def register_micro_batcher(name: str, queue_depth: Callable[[], int]) -> None:
+    micro_batcher_queue_depths[name] = queue_depth
+
+
+micro_batch_queue_depth = CallbackMetric("log_classifier_micro_batch_queue_depth",
+                                         "Items waiting in the queue of a micro batcher.", "gauge",
+                                         lambda: {(name,): queue_depth()
+                                                  for name, queue_depth in list(micro_batcher_queue_depths.items())},
+                                         ("batcher",))
+
+
+# cache name -> function that returns the stats of the cache with hits and misses, or None when it is not loaded
+cache_stats_sources: Dict[str, Callable[[], Optional[dict]]] = {}
+
+
+def register_cache_stats(name: str, stats: Callable[[], Optional[dict]]) -> None:
+    cache_stats_sources[name] = stats
+
+
+def cache_stats_values(key: str) -> Dict[tuple, float]:
+    tag: str = "cache_stats_values"
+    values = {}
+    for name, stats in list(cache_stats_sources.items()):
+        try:
+            cache_stats = stats()
+        except Exception as e:
+            logger.error("%s::Error reading the stats of the %s cache: %s", tag, name, e)
+            continue
+        if cache_stats is not None and key in cache_stats:
+            values[(name,)] = cache_stats[key]
+    return values
+
+
+cache_hits_total = CallbackMetric("log_classifier_cache_hits_total", "Cache hits by cache.", "counter",
+                                  lambda: cache_stats_values("hits"), ("cache",))
+cache_misses_total = CallbackMetric("log_classifier_cache_misses_total", "Cache misses by cache.", "counter",
+                                    lambda: cache_stats_values("misses"), ("cache",))
+cache_hit_ratio = CallbackMetric("log_classifier_cache_hit_ratio", "Share of the cache lookups that hit.", "gauge",
+                                 lambda: cache_stats_values("hit_rate"), ("cache",))
+# only the caches that estimate the latency of the calls they save, like the LLM cache, have this metric
+cache_latency_saved_seconds_total = CallbackMetric("log_classifier_cache_latency_saved_seconds_total",
+                                                   "Estimated seconds of the calls the cache hits saved, by cache.",
+                                                   "counter", lambda: cache_stats_values("latency_saved_seconds"),
+                                                   ("cache",))
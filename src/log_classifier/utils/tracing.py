@@ -0,0 +1,199 @@
+import contextvars
+import functools
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import orjson
+
+from src.log_classifier.constants import (tracing_enabled, tracing_sample_rate, tracing_slow_request_seconds,
+                                          tracing_export_file_path, tracing_export_max_queue_size)
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.logging.logger import logger
+
+# the trace of the request being handled and the span the new spans are nested in
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+current_span_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("current_span_id", default=None)
+
+
+class Trace:
+    """
+    The spans of one request, each span is a stage with its start and duration relative to the start of the trace.
+    The spans can be added from the event loop and from the executor threads.
+    """
+    def __init__(self, name: str, attributes: dict = None):
+        self.trace_id = os.urandom(8).hex()
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def start_span(self, name: str, parent_id: Optional[int], attributes: dict) -> dict:
+        record = {"name": name, "parent_id": parent_id, "start": time.perf_counter() - self.start,
+                  "duration": None, "thread": threading.current_thread().name, **attributes}
+        with self.lock:
+            record["span_id"] = len(self.spans)
+            self.spans.append(record)
+        return record
+
+    def end_span(self, record: dict) -> None:
+        record["duration"] = time.perf_counter() - self.start - record["start"]
+
+    def finish(self, **attributes) -> None:
+        self.duration = time.perf_counter() - self.start
+        self.attributes.update(attributes)
+
+    def stage_durations(self) -> dict:
+        """The total seconds of each finished stage, in the order the stages started."""
+        durations = {}
+        with self.lock:
+            spans = list(self.spans)
+        for record in spans:
+            if record["duration"] is not None:
+                durations[record["name"]] = durations.get(record["name"], 0.0) + record["duration"]
+        return durations
+
+    def server_timing(self) -> str:
+        """The stage durations as a Server-Timing header value, in milliseconds."""
+        stages = self.stage_durations()
+        stages["total"] = time.perf_counter() - self.start if self.duration is None else self.duration
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            spans = [dict(record) for record in self.spans]
+        for record in spans:
+            record["start_ms"] = record.pop("start") * 1000
+            duration = record.pop("duration")
+            record["duration_ms"] = None if duration is None else duration * 1000
+        return {"trace_id": self.trace_id, "name": self.name, "start_time": self.start_time,
+                "duration_ms": None if self.duration is None else self.duration * 1000,
+                **self.attributes, "spans": spans}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage of the current trace, the spans started inside it are its children.
+    Without a current trace it does nothing, so the stages can be wrapped on every code path.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    record = trace.start_span(name, current_span_id.get(), attributes)
+    token = current_span_id.set(record["span_id"])
+    try:
+        yield record
+    finally:
+        current_span_id.reset(token)
+        trace.end_span(record)
+
+
+def record_spans(spans: list) -> None:
+    """
+    Add the spans timed outside the trace, like the stages of a micro-batch run by the batcher thread,
+    to the current trace as children of the current span.
+    Each span is a (name, perf_counter at its start, duration in seconds, attributes) tuple.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return
+    parent_id = current_span_id.get()
+    for name, start, duration, attributes in spans:
+        record = trace.start_span(name, parent_id, attributes)
+        record["start"] = start - trace.start
+        record["duration"] = duration
+
+
+def in_trace_context(function: Callable, executor=None) -> Callable:
+    """
+    Run the function in the trace context of the caller when it is run on a thread executor,
+    the executor threads do not get the context variables of the event loop task otherwise.
+    The context cannot be sent to a process executor, the stages that run there are not traced.
+    """
+    if current_trace.get() is None or isinstance(executor, ProcessPoolExecutor):
+        return function
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def start_trace(name: str, **attributes) -> Optional[Trace]:
+    return Trace(name, attributes) if tracing_enabled else None
+
+
+def is_sampled(trace: Trace, sample_rate: float = tracing_sample_rate,
+               slow_request_seconds: float = tracing_slow_request_seconds) -> bool:
+    """A trace is exported with the probability sample_rate, and always when the request was slow."""
+    return trace.duration >= slow_request_seconds or random.random() < sample_rate
+
+
+class JsonLinesTraceExporter:
+    """
+    Writes the traces to a JSON lines file, one trace per line.
+    The traces are queued and written by a background thread, so exporting does not block the event loop.
+    When the queue is full the trace is dropped and counted.
+    """
+    def __init__(self, file_path: str = tracing_export_file_path,
+                 max_queue_size: int = tracing_export_max_queue_size):
+        self.class_name = self.__class__.__name__
+        self.file_path = file_path
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run_worker, name="trace_exporter", daemon=True)
+                self.thread.start()
+
+    def export(self, trace: Trace) -> None:
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def run_worker(self) -> None:
+        tag: str = f"{self.class_name}::run_worker"
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(self.file_path, "ab") as file:
+                while True:
+                    trace = self.queue.get()
+                    file.write(orjson.dumps(trace.to_dict()) + b"\n")
+                    # the file is flushed when the queue is drained, so a burst of traces is written together
+                    if self.queue.empty():
+                        file.flush()
+                    with self.lock:
+                        self.exported += 1
+                    self.queue.task_done()
+        except Exception as e:
+            logger.error("%s::Error writing the traces to %s: %s", tag, self.file_path, e)
+            raise CustomException(e, sys)
+
+    def flush(self, timeout_seconds: float = 5.0) -> None:
+        """Wait until the queued traces are written to the file."""
+        deadline = time.perf_counter() + timeout_seconds
+        while self.queue.unfinished_tasks and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"exported": self.exported, "dropped": self.dropped, "queue_depth": self.queue.qsize()}
+
+
+trace_exporter = JsonLinesTraceExporter()
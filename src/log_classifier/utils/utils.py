@@ -4,13 +4,18 @@ import numpy as np
 import pandas as pd
 import yaml
 import pickle
+from typing import TYPE_CHECKING
 
-from sentence_transformers import SentenceTransformer
-from sklearn.linear_model import LogisticRegression
-
+from src.log_classifier.constants import (artifact_file_format, artifact_file_extensions, artifact_csv_export,
+                                          artifact_categorical_columns)
 from src.log_classifier.exception.exception import CustomException
 from src.log_classifier.logging.logger import logger
 
+# torch and scikit-learn are slow to import, they are imported when a model is loaded
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+    from sklearn.linear_model import LogisticRegression
+
 
 def read_yaml(file_path: str) -> dict:
     try:
@@ -19,7 +24,7 @@ def read_yaml(file_path: str) -> dict:
         with open(file_path, 'rb') as file:
             return yaml.safe_load(file)
     except Exception as e:
-        logger.error(f"Error reading the yaml file: {e}")
+        logger.error("Error reading the yaml file: %s", e)
         raise CustomException(e, sys) from e
 
 
@@ -28,7 +33,7 @@ def save_object(file_path: str, obj: object) -> None:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, "wb") as file_obj:
             pickle.dump(obj, file_obj)
-        logger.info(f"Object saved successfully at: {file_path}")
+        logger.info("Object saved successfully at: %s", file_path)
     except Exception as e:
         raise CustomException(e, sys) from e
 
@@ -43,31 +48,32 @@ def load_object(file_path: str, ) -> object:
     except Exception as e:
         raise CustomException(e, sys) from e
 
-def logistic_regression_load_object(file_path: str, ) -> LogisticRegression:
+def logistic_regression_load_object(file_path: str, ) -> "LogisticRegression":
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file: {file_path} is not exists")
         # Load the LogisticRegression model using pickle
         with open("final_model/logistic_regression.pkl", "rb") as file:
-            model: LogisticRegression = pickle.load(file)
+            model: "LogisticRegression" = pickle.load(file)
             return model
     except Exception as e:
         raise CustomException(e, sys) from e
 
 
-def sentence_transformer_save_object(file_path: str, obj: SentenceTransformer) -> None:
+def sentence_transformer_save_object(file_path: str, obj: "SentenceTransformer") -> None:
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         obj.save(file_path)
-        logger.info(f"Object saved successfully at: {file_path}")
+        logger.info("Object saved successfully at: %s", file_path)
     except Exception as e:
         raise CustomException(e, sys) from e
 
 
-def sentence_transformer_load_object(file_path: str, ) -> SentenceTransformer:
+def sentence_transformer_load_object(file_path: str, ) -> "SentenceTransformer":
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file: {file_path} is not exists")
+        from sentence_transformers import SentenceTransformer
         return SentenceTransformer(file_path)
     except Exception as e:
         raise CustomException(e, sys) from e
@@ -100,17 +106,89 @@ def load_numpy_array_data(file_path: str) -> np.array:
     except Exception as e:
         raise CustomException(e, sys) from e
 
-def save_dataframe(df: pd.DataFrame, file_path: str, description: str):
+def artifact_file_path(file_path: str, file_format: str = artifact_file_format) -> str:
+    """Replace the extension of the file path with the extension of the artifact file format."""
+    if file_format not in artifact_file_extensions:
+        raise ValueError(f"Unknown artifact file format: {file_format}, use one of {list(artifact_file_extensions)}")
+    return os.path.splitext(file_path)[0] + artifact_file_extensions[file_format]
+
+
+def infer_file_format(file_path: str) -> str:
+    """The artifact file format of the file path from its extension, files with other extensions are CSV."""
+    extension = os.path.splitext(file_path)[1].lower()
+    for file_format, format_extension in artifact_file_extensions.items():
+        if extension == format_extension:
+            return file_format
+    return "csv"
+
+
+def with_categorical_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Store the columns with few distinct values as categoricals, each value is then kept once."""
+    columns = {column: "category" for column in artifact_categorical_columns
+               if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype)}
+    return df.astype(columns) if columns else df
+
+
+def save_dataframe(df: pd.DataFrame, file_path: str, description: str, file_format: str = None):
+    """
+    Save the dataframe as a stage output of the training pipeline.
+    The file format is "parquet", "arrow" (Arrow IPC, uncompressed so it can be memory mapped) or "csv",
+    by default it is inferred from the extension of the file path.
+    With artifact_csv_export a CSV copy is written next to the Parquet and Arrow files.
+    """
     try:
         if df.empty:
             raise ValueError(f"Dataframe is empty")
+        file_format = file_format or infer_file_format(file_path)
         # create folder if not exists
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        df.to_csv(file_path, index=False, header=True)
-        logger.info(f"{description} saved successfully to {file_path}")
+        if file_format == "csv":
+            df.to_csv(file_path, index=False, header=True)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(with_categorical_columns(df), preserve_index=False)
+            if file_format == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, file_path)
+            elif file_format == "arrow":
+                with pa.OSFile(file_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            else:
+                raise ValueError(f"Unknown artifact file format: {file_format}")
+            if artifact_csv_export:
+                df.to_csv(artifact_file_path(file_path, "csv"), index=False, header=True)
+        logger.info("%s saved successfully to %s", description, file_path)
     except Exception as e:
         raise CustomException(f"Error saving {description}: {str(e)}", sys)
 
+
+def load_dataframe(file_path: str, columns: list = None, file_format: str = None) -> pd.DataFrame:
+    """
+    Load a stage output of the training pipeline, only the given columns are read when columns is set.
+    Parquet and Arrow files are memory mapped, the columns that are not read are not loaded from the disk.
+    The columns with few distinct values are returned as categoricals with every format.
+    """
+    try:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"The file: {file_path} is not exists")
+        file_format = file_format or infer_file_format(file_path)
+        if file_format == "csv":
+            df = pd.read_csv(file_path, usecols=columns)
+        elif file_format == "parquet":
+            import pyarrow.parquet as pq
+            df = pq.read_table(file_path, columns=columns, memory_map=True).to_pandas()
+        elif file_format == "arrow":
+            import pyarrow as pa
+            # the buffers of the table keep the mapped region alive after the file is closed
+            with pa.memory_map(file_path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = (table.select(columns) if columns else table).to_pandas()
+        else:
+            raise ValueError(f"Unknown artifact file format: {file_format}")
+        return with_categorical_columns(df)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
 import shutil
 import os
 
@@ -147,7 +225,7 @@ def copy_file_with_validation(source: str, destination: str, valid_extensions=No
 
         # Copy the file
         shutil.copy(source, destination)
-        logger.info(f"File copied successfully from {source} to {destination}")
+        logger.info("File copied successfully from %s to %s", source, destination)
 
     except PermissionError as pe:
         message: str = f"Permissions error when copying the file from {source} to {destination}: {str(pe)}"
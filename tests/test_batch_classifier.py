@@ -0,0 +1,145 @@
+"""
+Tests of the offline batch classifier, its output must be the output of csv_classifier for the same file.
+The models are not loaded, classify is replaced by a stub that derives the label from the message,
+and the worker processes are replaced by threads that run the stub, so the tests run without a network.
+
+Run from the project root:
+    python -m pytest tests
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from src.log_classifier.exception.exception import CustomException
+from src.log_classifier.utils.classifiers import classification_executor, classifier
+from src.log_classifier.utils.classifiers.batch_classifier import BatchClassifier
+from src.log_classifier.utils.classifiers.classifier import csv_classifier
+
+logs = [
+    ("ModernCRM", "User User123 logged in."),
+    ("BillingSystem", "Backup completed successfully."),
+    ("ModernHR", "Admin access escalation detected for user 9429"),
+    ("AnalyticsEngine", "File data_6957.csv uploaded successfully by user User265."),
+    ("ModernCRM", "IP 192.168.133.114 blocked due to potential attack"),
+    ("ModernHR", "Multiple login failures occurred on user 6454 account"),
+    ("BillingSystem", "System updated to version 3.4.1."),
+    ("AnalyticsEngine", "Disk cleanup completed successfully."),
+    ("ModernCRM", "Account with ID 5351 created by User634."),
+    ("ModernHR", "Shard 6 replication task ended in failure"),
+]
+
+
+def stub_label(source: str, log_message: str) -> str:
+    return f"{source}:{len(log_message)}"
+
+
+class StubClassifier:
+    """Stands in for classify, records the messages of each call and can wait or fail on a message."""
+    def __init__(self):
+        self.calls = []
+        self.delays = {}
+        self.failing_message = None
+
+    def __call__(self, logs, *args, **kwargs):
+        logs = list(logs)
+        self.calls.append([log_message for _, log_message in logs])
+        for _, log_message in logs:
+            if log_message == self.failing_message:
+                raise RuntimeError(f"failed to classify {log_message}")
+            time.sleep(self.delays.get(log_message, 0.0))
+        return [stub_label(source, log_message) for source, log_message in logs]
+
+
+@pytest.fixture
+def stub_classify(monkeypatch) -> StubClassifier:
+    stub = StubClassifier()
+    # classify_chunk imports classify from the classifier module when it is called
+    monkeypatch.setattr(classifier, "classify", stub)
+    # the workers are threads, they see the stub, worker processes would load the models
+    monkeypatch.setattr(classification_executor, "create_classification_executor",
+                        lambda kind, max_workers: ThreadPoolExecutor(max_workers=max_workers))
+    return stub
+
+
+@pytest.fixture
+def input_file(tmp_path) -> str:
+    df = pd.DataFrame(logs, columns=["source", "log_message"])
+    # the ids of the later rows are missing, the codes have leading zeros, both must be written back as they were read
+    df.insert(0, "ticket_id", [str(row) for row in range(6)] + [""] * 4)
+    df["code"] = [f"{row:03d}" for row in range(len(df))]
+    file_path = str(tmp_path / "logs.csv")
+    df.to_csv(file_path, index=False)
+    return file_path
+
+
+def read_output(file_path: str) -> pd.DataFrame:
+    return pd.read_csv(file_path, dtype=str, keep_default_na=False)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_output_matches_csv_classifier(stub_classify, input_file, tmp_path, workers):
+    expected_file = csv_classifier(input_file, str(tmp_path / "expected.csv"))
+    output_file = str(tmp_path / f"output_{workers}.csv")
+    summary = BatchClassifier(input_file, output_file, chunk_size=4, workers=workers).run()
+    assert summary["chunks"] == 3 and summary["rows"] == len(logs)
+    with open(expected_file, "rb") as expected, open(output_file, "rb") as output:
+        assert output.read() == expected.read()
+
+
+@pytest.mark.parametrize("chunk_size, chunks", [(1, 10), (3, 4), (10, 1), (25, 1)])
+def test_chunks(stub_classify, input_file, tmp_path, chunk_size, chunks):
+    output_file = str(tmp_path / "output.csv")
+    summary = BatchClassifier(input_file, output_file, chunk_size=chunk_size, workers=0).run()
+    assert summary["chunks"] == chunks and summary["rows_classified"] == len(logs)
+    assert [len(call) for call in stub_classify.calls] == [len(logs[start:start + chunk_size])
+                                                          for start in range(0, len(logs), chunk_size)]
+    df = read_output(output_file)
+    assert df["target_label"].tolist() == [stub_label(*log) for log in logs]
+
+
+def test_output_keeps_the_input_order(stub_classify, input_file, tmp_path):
+    # the first chunks take the longest, so the workers finish the chunks in the reverse order
+    for position, (_, log_message) in enumerate(logs):
+        stub_classify.delays[log_message] = 0.05 * (len(logs) - position) / len(logs)
+    output_file = str(tmp_path / "output.csv")
+    summary = BatchClassifier(input_file, output_file, chunk_size=2, workers=5).run()
+    assert summary["chunks"] == 5
+    df = read_output(output_file)
+    assert df["log_message"].tolist() == [log_message for _, log_message in logs]
+    assert df["target_label"].tolist() == [stub_label(*log) for log in logs]
+    assert df["code"].tolist() == [f"{row:03d}" for row in range(len(logs))]
+
+
+def test_resume_after_a_failed_chunk(stub_classify, input_file, tmp_path):
+    output_file = str(tmp_path / "output.csv")
+    # the third chunk fails, the first two are written and recorded in the checkpoint
+    stub_classify.failing_message = logs[8][1]
+    with pytest.raises(CustomException):
+        BatchClassifier(input_file, output_file, chunk_size=4, workers=0, max_pending_chunks=1).run()
+    with open(output_file + ".checkpoint.json") as file:
+        assert sorted(json.load(file)["completed"]) == ["0", "1"]
+
+    stub_classify.failing_message = None
+    stub_classify.calls.clear()
+    summary = BatchClassifier(input_file, output_file, chunk_size=4, workers=0).run()
+    assert summary["rows_resumed"] == 8 and summary["rows_classified"] == 2
+    # only the chunk that failed is classified again
+    assert stub_classify.calls == [[log_message for _, log_message in logs[8:]]]
+    df = read_output(output_file)
+    assert df["target_label"].tolist() == [stub_label(*log) for log in logs]
+
+
+def test_changed_chunk_size_does_not_resume(stub_classify, input_file, tmp_path):
+    output_file = str(tmp_path / "output.csv")
+    stub_classify.failing_message = logs[8][1]
+    with pytest.raises(CustomException):
+        BatchClassifier(input_file, output_file, chunk_size=4, workers=0, max_pending_chunks=1).run()
+
+    stub_classify.failing_message = None
+    stub_classify.calls.clear()
+    summary = BatchClassifier(input_file, output_file, chunk_size=5, workers=0).run()
+    assert summary["rows_resumed"] == 0 and summary["rows_classified"] == len(logs)
+    assert len(stub_classify.calls) == 2
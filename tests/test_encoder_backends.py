@@ -0,0 +1,50 @@
+"""
+Tests that the ONNX and int8 ONNX sentence encoders stay close to the torch SentenceTransformer, in the cosine
+similarity of the embeddings and the agreement of the labels, with the thresholds of benchmarks/encoder_backends.py.
+Skipped when ONNX Runtime is not installed or the model was not exported, export it first with
+    python -m src.log_classifier.utils.classifiers.sentence_encoder --model-dir <saved model dir>
+
+Run from the project root:
+    python -m pytest tests
+"""
+import json
+import os
+
+import pytest
+
+from src.log_classifier.constants import (sentence_encoder_onnx_dir, sentence_encoder_onnx_file_name,
+                                          sentence_encoder_onnx_int8_file_name, sentence_encoder_config_file_name)
+
+# the first rows of the data are enough to compare the backends
+parity_rows: int = 500
+
+
+def exported_model_dir(onnx_dir: str) -> str:
+    """The saved SentenceTransformer the ONNX graphs were exported from, the test is skipped without them."""
+    for file_name in (sentence_encoder_onnx_file_name, sentence_encoder_onnx_int8_file_name,
+                      sentence_encoder_config_file_name):
+        if not os.path.exists(os.path.join(onnx_dir, file_name)):
+            pytest.skip(f"{os.path.join(onnx_dir, file_name)} does not exist, the model is not exported")
+    with open(os.path.join(onnx_dir, sentence_encoder_config_file_name)) as file:
+        model_dir = json.load(file)["model_dir"]
+    if not os.path.exists(model_dir):
+        pytest.skip(f"The exported model {model_dir} does not exist")
+    return model_dir
+
+
+def check_parity(onnx_dir: str) -> None:
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("transformers")
+    pytest.importorskip("sentence_transformers")
+    model_dir = exported_model_dir(onnx_dir)
+    from benchmarks.encoder_backends import min_label_agreement, min_mean_cosine_similarity, run
+
+    results = {result["backend"]: result for result in run(model_dir, onnx_dir, rows=parity_rows)}
+    assert set(results) == {"torch", "onnx", "onnx_int8"}
+    for backend in ("onnx", "onnx_int8"):
+        assert results[backend]["mean_cosine_similarity"] >= min_mean_cosine_similarity, backend
+        assert results[backend]["label_agreement"] >= min_label_agreement, backend
+
+
+def test_onnx_backends_match_torch():
+    check_parity(sentence_encoder_onnx_dir)
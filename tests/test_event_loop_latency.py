@@ -0,0 +1,71 @@
+"""
+Tests that a cheap request stays fast while a large CSV is classified.
+The tiers are replaced by a stub that keeps the CPU busy, so the test runs without the models and
+fails when the classification blocks the event loop instead of running on the classification executor.
+
+Run from the project root:
+    python -m pytest tests
+"""
+import asyncio
+import io
+import time
+
+import httpx
+import pandas as pd
+import pytest
+
+import app as app_module
+from benchmarks.common import percentile
+from benchmarks.event_loop_latency import homepage_latencies, max_loaded_p99_seconds
+from src.log_classifier.utils.classifiers import classifier
+
+rows: int = 4000
+# the busy time of the stub tier per message, the classification takes about a second
+stub_seconds_per_message: float = 0.00025
+
+
+def stub_tier(log_messages: list, **kwargs) -> list:
+    deadline = time.perf_counter() + stub_seconds_per_message * len(log_messages)
+    while time.perf_counter() < deadline:
+        pass
+    return ["Stub Label"] * len(log_messages)
+
+
+@pytest.fixture
+def stub_classifier(monkeypatch):
+    for tier in classifier.tier_classifiers:
+        monkeypatch.setitem(classifier.tier_classifiers, tier, stub_tier)
+    monkeypatch.setattr(classifier, "bert_micro_batching_enabled", False)
+    monkeypatch.setattr(app_module, "create_classification_executor", classifier_executor)
+
+
+def classifier_executor():
+    from src.log_classifier.utils.classifiers.classification_executor import create_classification_executor
+    # a thread executor, the stub tiers are not in the worker processes of a process executor
+    return create_classification_executor("thread", 2)
+
+
+async def measure() -> tuple:
+    csv_bytes = pd.DataFrame({"source": ["ModernCRM", "BillingSystem"] * (rows // 2),
+                              "log_message": [f"Stub log message {row}" for row in range(rows)]}).to_csv(index=False)
+    app = app_module.app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+            start = time.perf_counter()
+            classify_request = asyncio.ensure_future(
+                client.post("/classify/", files={"file": ("logs.csv", io.BytesIO(csv_bytes.encode()), "text/csv")}))
+            loaded = await homepage_latencies(client, until=classify_request)
+            response = await classify_request
+            classify_seconds = time.perf_counter() - start
+    return response, loaded, classify_seconds
+
+
+def test_homepage_is_fast_while_a_large_csv_is_classified(stub_classifier):
+    response, loaded, classify_seconds = asyncio.run(measure())
+    assert response.status_code == 200
+    assert pd.read_csv(io.StringIO(response.text))["target_label"].eq("Stub Label").all()
+    assert classify_seconds >= rows * stub_seconds_per_message
+    # the homepage was served many times while the classification ran
+    assert len(loaded) >= 10
+    assert percentile(loaded, 0.99) <= max_loaded_p99_seconds
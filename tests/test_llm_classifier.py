@@ -0,0 +1,77 @@
+"""
+Tests of the batched LLM tier against the local fake chat completions server of the benchmarks.
+
+Run from the project root:
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+from groq import AsyncGroq
+
+from benchmarks.fake_llm import fake_category, start_fake_llm_server
+from src.log_classifier.utils.classifiers import llm_classifier
+from src.log_classifier.utils.classifiers.llm_cache import LLMResponseCache
+from src.log_classifier.utils.classifiers.llm_classifier import llm_classify_batch_async, parse_batch_response
+
+# the messages are told apart by words, the cache key masks the numbers
+agents = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy",
+          "karl", "liam", "mallory", "nina", "oscar", "peggy", "quinn", "rupert", "sybil", "trent"]
+modules = ["Reports", "Billing", "Search", "Export", "Audit"]
+log_messages = ([f"Case escalation failed because the agent {agent} is no longer active." for agent in agents] +
+                [f"The '{module}' module will be retired in version 4.0." for module in modules])
+
+
+@pytest.fixture
+def server():
+    server = start_fake_llm_server(latency_seconds=0.05, fail_marker="FAIL")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def classify(server, messages: list, **kwargs) -> list:
+    async def run() -> list:
+        # no retries, a rate limited prompt fails at once
+        client = AsyncGroq(api_key="fake", base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+        try:
+            return await llm_classify_batch_async(messages, client, **kwargs)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_messages_are_packed_into_prompts(server):
+    categories = classify(server, log_messages + log_messages[:5], messages_per_prompt=10, use_cache=False)
+    assert categories == [fake_category(log_message) for log_message in log_messages + log_messages[:5]]
+    # the 25 distinct messages are sent once, 10 per prompt
+    assert server.RequestHandlerClass.requests == 3
+
+
+def test_prompts_in_flight_are_limited(server):
+    classify(server, log_messages, messages_per_prompt=1, max_concurrency=4, use_cache=False)
+    assert server.RequestHandlerClass.requests == len(log_messages)
+    assert 1 < server.RequestHandlerClass.max_in_flight <= 4
+
+
+def test_parse_batch_response():
+    content = ('<think><category id="1">Thinking</category></think>'
+               '<category id="2"> Deprecation Warning </category><category id="1">Workflow Error</category>'
+               '<category id="9">Out of range</category>')
+    # the third message is not answered, it is not cached
+    assert parse_batch_response(content, 3) == ["Workflow Error", "Deprecation Warning", None]
+
+
+def test_failed_prompt_only_fails_its_messages(server, tmp_path, monkeypatch):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr(llm_classifier, "get_llm_cache", lambda: cache)
+    messages = log_messages[:10] + ["FAIL this prompt"] + log_messages[20:]
+    categories = classify(server, messages, messages_per_prompt=5, use_cache=True)
+    # the prompt with the failing message is the third one, its five messages are not classified
+    assert categories[:10] == [fake_category(log_message) for log_message in messages[:10]]
+    assert categories[10:15] == ["Unclassified"] * 5
+    assert categories[15:] == [fake_category(log_message) for log_message in messages[15:]]
+    # the failed messages are not cached, they are sent again by the next call
+    assert len(cache.get_many(llm_classifier.llm_cache_key(log_message, llm_classifier.llm_batch_prompt_template,
+                                                           llm_classifier.llm_model_name, llm_classifier.llm_temperature)
+                              for log_message in messages)) == len(messages) - 5
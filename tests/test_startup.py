@@ -0,0 +1,35 @@
+"""
+Tests that importing the API is cheap: no model is loaded and the import stays within the startup budget.
+The import runs in a fresh interpreter, the modules imported by the other tests do not count.
+
+Run from the project root:
+    python -m pytest tests
+"""
+import json
+import subprocess
+import sys
+
+from benchmarks.import_time import heavy_modules, import_time_budget_seconds, measure_import_time
+
+check_script = """
+import json, sys
+import app
+from src.log_classifier.utils.lazy_loader import lazy_singletons
+print(json.dumps({"loaded": sorted(name for name, singleton in lazy_singletons.items() if singleton.loaded),
+                  "singletons": sorted(lazy_singletons),
+                  "modules": sorted({name.split(".")[0] for name in sys.modules})}))
+"""
+
+
+def test_import_does_not_load_the_models():
+    result = subprocess.run([sys.executable, "-c", check_script], capture_output=True, text=True, check=True)
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert state["singletons"]
+    assert state["loaded"] == []
+    assert not set(heavy_modules) & set(state["modules"])
+
+
+def test_import_is_within_the_budget():
+    result = measure_import_time("app")
+    assert result["heavy_modules"] == []
+    assert 0 < result["cumulative_seconds"] <= import_time_budget_seconds